@@ -1,58 +1,156 @@
 # pip install flask scikit-learn pandas joblib
+import functools
+import io
 import json
-from flask import Flask, request, jsonify
-import joblib
+from flask import Flask, Response, g, request, jsonify, make_response
+from flask.json.provider import DefaultJSONProvider
 import numpy as np
 import pandas as pd
 import os
+from artifacts import CALIBRATION_FILE, SOURCE_FILES, has_artifacts, load_artifacts, load_calibrations, stale_sources
+from inference import InferenceEngine
+from cache import PredictionCache
+from weights import WeightsStore
+from feedback import FeedbackService, PredictionLog
+from ledger import BalanceLedger
+from metrics import Metrics
+from peers import FanOutClient, PeerRegistry
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  
-models = {
-    "logistic_regression": joblib.load(os.path.join(BASE_DIR, "data", "logreg_model.pkl")),
-    "random_forest": joblib.load(os.path.join(BASE_DIR, "data", "rf_model.pkl")),
-    "svm": joblib.load(os.path.join(BASE_DIR, "data", "svm_model.pkl"))
-}
-preprocessor = joblib.load(os.path.join(BASE_DIR, "data", "preprocessor.pkl"))
-
-
-try:
-    with open(os.path.join(BASE_DIR, "data","model_weights.json"), "r") as f:
-        weights = np.array(list(json.load(f).values()))
-except FileNotFoundError:
-    weights = np.array([1/3, 1/3, 1/3])  
-
-try:
-    with open(os.path.join(BASE_DIR, "data","pos_model_weights.json"), "r") as f:
-        pos_weights = np.array(list(json.load(f).values()))
-except FileNotFoundError:
-    pos_weights = np.array([1/3, 1/3, 1/3])  
+# Memory-mapped export of the models (python artifacts.py) if there is a current one, else the pickles
+ARTIFACTS_DIR = os.path.join(BASE_DIR, "data", "compact")
+MODEL_SOURCES = {name: os.path.join(BASE_DIR, "data", file_name) for name, file_name in SOURCE_FILES.items()}
+use_artifacts = has_artifacts(ARTIFACTS_DIR)
+if use_artifacts:
+    # The notebook may have retrained (rewritten the pickles) since the last export
+    stale = stale_sources(ARTIFACTS_DIR, MODEL_SOURCES.values())
+    if stale:
+        print(f"Ignoring {ARTIFACTS_DIR}: exported from other versions of {', '.join(map(os.path.basename, stale))}; "
+              f"loading the pickles (re-run python artifacts.py)")
+    use_artifacts = not stale
+if use_artifacts:
+    models, preprocessor = load_artifacts(ARTIFACTS_DIR)
+else:
+    import joblib
+    models = {name: joblib.load(path) for name, path in MODEL_SOURCES.items() if name != "preprocessor"}
+    preprocessor = joblib.load(MODEL_SOURCES["preprocessor"])
+
+# Platt parameters of the linear models: the SVM's margin becomes a survival probability
+calibrations = load_calibrations(os.path.join(BASE_DIR, "data", CALIBRATION_FILE))
+
+WEIGHTS_FILE = os.path.join(BASE_DIR, "data", "model_weights.json")
+POS_WEIGHTS_FILE = os.path.join(BASE_DIR, "data", "pos_model_weights.json")
+BALANCE_FILE = os.path.join(BASE_DIR, "data", "model_balances.json")
+LEDGER_FILE = os.path.join(BASE_DIR, "data", "balance_ledger.jsonl")
+LEDGER_SNAPSHOT_FILE = os.path.join(BASE_DIR, "data", "balance_snapshot.json")
+WEIGHTS_POLL_INTERVAL = 2  # seconds
+
+# Stake balances: append-only ledger, seeded from model_balances.json on first start
+ledger = BalanceLedger(LEDGER_FILE, LEDGER_SNAPSHOT_FILE, models.keys(), seed_file=BALANCE_FILE)
+
+# Weights and stake balances, re-read whenever the notebook (or anyone) rewrites the JSON files
+weights_store = WeightsStore(WEIGHTS_FILE, POS_WEIGHTS_FILE, ledger, models.keys(),
+                             poll_interval=WEIGHTS_POLL_INTERVAL)
+
+# Ground-truth labels for served consensus predictions keep the weights current (Q3/Q4 online)
+FEEDBACK_BATCH_SIZE = 10
+CONSUMED_PREDICTIONS_FILE = os.path.join(BASE_DIR, "data", "consumed_predictions.txt")
+PREDICTION_ID_MAX_AGE = 86400  # seconds a prediction_id can be given feedback for
+prediction_log = PredictionLog(consumed_file=CONSUMED_PREDICTIONS_FILE, max_age=PREDICTION_ID_MAX_AGE)
+feedback_service = FeedbackService(weights_store, ledger, models.keys(), batch_size=FEEDBACK_BATCH_SIZE)
+
+# Remote peers (e.g. group members' models behind ngrok) for the decentralized consensus
+PEERS_FILE = os.path.join(BASE_DIR, "data", "peers.json")
+PEER_TIMEOUT = 2.0  # seconds, budget for the whole fan-out
+PEER_HEDGE_DELAY = 0.3  # seconds before re-sending to a peer that has not answered
+PEER_QUORUM = 2 / 3  # share of the total stake that must answer
+peer_registry = PeerRegistry(PEERS_FILE, ledger)
+fan_out_client = FanOutClient(peer_registry, timeout=PEER_TIMEOUT, hedge_delay=PEER_HEDGE_DELAY,
+                              quorum=PEER_QUORUM)
+
+FEATURE_COLUMNS = ['pclass', 'sex', 'age', 'sibsp', 'parch', 'fare', 'embarked']
+
+# hard: majority of the 0/1 predictions; soft: mean of the models' survival probabilities
+CONSENSUS_MODES = ("hard", "soft")
+
+# Per-stage latency histograms on /metrics; a sample of requests is traced span by span
+TRACE_FILE = os.path.join(BASE_DIR, "data", "traces.jsonl")
+TRACE_SAMPLE_RATE = 0.01  # share of requests written to TRACE_FILE
+metrics = Metrics(trace_file=TRACE_FILE, trace_sample_rate=TRACE_SAMPLE_RATE)
+
+# Single owner of the preprocessor and models: transform once, fan out to every model
+engine = InferenceEngine(models, preprocessor, FEATURE_COLUMNS, metrics=metrics, calibrations=calibrations)
+
+# Responses for repeated passengers, keyed on (route, features, weights version)
+PREDICTION_CACHE_SIZE = 10000
+PREDICTION_CACHE_TTL = 300  # seconds
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
+
+
+def start_background_services():
+    """Start the weights watcher and the feedback worker of this process.
+
+    serve.py loads the app once in the master and calls this in every forked worker, since
+    threads do not survive a fork; otherwise it runs at import.
+    """
+    ledger.reopen()
+    weights_store.start_watching()
+    feedback_service.start()
+
+
+def stop_background_services():
+    """Stop the background threads and flush the ledger (graceful worker shutdown)."""
+    weights_store.stop_watching()
+    feedback_service.stop(timeout=5)
+    ledger.close()
+
+
+if os.environ.get("PREDICTION_SERVER_PRELOAD") != "1":
+    start_background_services()
 
 # Initialize Flask app
 app = Flask(__name__)
 
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with every jsonify() timed as the "serialize" stage."""
+
+    def response(self, *args, **kwargs):
+        with metrics.stage("serialize"):
+            return super().response(*args, **kwargs)
+
+
+app.json = TimedJSONProvider(app)
+
+
+@app.before_request
+def begin_request_metrics():
+    metrics.begin(request.url_rule.rule if request.url_rule is not None else "unmatched")
+
+
+@app.after_request
+def end_request_metrics(response):
+    metrics.end(response.status_code)
+    return response
+
+
 # ----------------------- Q1: Define model prediction function -------------------------------------
 def predict_survival(model_name, features):
     """Preprocess input features and predict survival using the selected model."""
     try:
-        if model_name not in models:
+        if model_name not in engine.models:
             return jsonify({"error": f"Model '{model_name}' not found"}), 404
 
-        model = models[model_name]
-
-        # Convert input features into a Pandas DataFrame with correct column names
-        feature_columns = ['pclass', 'sex', 'age', 'sibsp', 'parch', 'fare', 'embarked']
-        features_df = pd.DataFrame([features], columns=feature_columns)
-
         # Transform input using the same preprocessing pipeline (includes OneHotEncoder & StandardScaler)
-        features_scaled = preprocessor.transform(features_df)
+        features_scaled = engine.transform(features)
 
         # Make prediction
-        prediction = model.predict(features_scaled)[0]
+        prediction = engine.predict(model_name, features_scaled)[0]
         survival = "Survived" if prediction == 1 else "Did not survive"
 
         return jsonify({
             "model": model_name,
-            "input_features": features_df.to_dict(orient="records")[0],  # Convert DataFrame row to dictionary
+            "input_features": dict(zip(FEATURE_COLUMNS, features)),
             "prediction": survival
         })
 
@@ -63,6 +161,14 @@ def predict_survival(model_name, features):
 
 # Helper function to get and validate request parameters
 def get_request_features():
+    """The request's features, parsed on the first call; cached_prediction and the view share them."""
+    if "features" not in g:
+        g.features = parse_request_features()
+    return g.features
+
+
+@metrics.timed("parse")
+def parse_request_features():
     """Extracts and processes query parameters from GET request."""
     try:
         pclass = request.args.get("pclass", type=int)
@@ -85,20 +191,102 @@ def get_request_features():
         return jsonify({"error": str(e)}), 400
     
 
+def get_consensus_mode():
+    """Consensus mode of the request (?mode=hard|soft, default hard), or an error response."""
+    mode = request.args.get("mode", "hard").lower()
+    if mode not in CONSENSUS_MODES:
+        expected = ", ".join(CONSENSUS_MODES)
+        return jsonify({"error": f"Unknown consensus mode '{mode}', expected one of {expected}"}), 400
+    return mode
+
+
+def soft_vote(model_proba, consensus_weights=None):
+    """Weighted mean of the models' survival probabilities, one per row of a (n_rows, n_models) array."""
+    return np.average(model_proba, axis=-1, weights=consensus_weights)
+
+
+def soft_consensus(model_label, features, consensus_weights=None, weights_key="weights"):
+    """Soft-vote consensus response for one passenger: the models' probabilities are averaged."""
+    model_preds, model_proba = engine.predict_one_proba(features)
+    probability = float(soft_vote(model_proba, consensus_weights))
+
+    response = {
+        "model": model_label,
+        "mode": "soft",
+        "input_features": dict(zip(FEATURE_COLUMNS, features)),
+        "individual_predictions": {
+            model_name: label(prediction) for model_name, prediction in zip(engine.model_names, model_preds)
+        },
+        "individual_probabilities": dict(zip(engine.model_names, model_proba.tolist())),
+        "survival_probability": probability,
+        "final_prediction": label(int(probability > 0.5)),
+        "prediction_id": issue_prediction_id(model_preds)
+    }
+    if consensus_weights is not None:
+        response[weights_key] = consensus_weights.tolist()
+    return jsonify(response)
+
+
+def issue_prediction_id(model_preds):
+    """A new prediction_id for one passenger's model predictions, remembered for cached_prediction."""
+    g.prediction = (prediction_log.record([model_preds])[0], model_preds)
+    return g.prediction[0]
+
+
+def cached_prediction(route_name):
+    """Serve repeated requests for the same passenger from prediction_cache.
+
+    Only successful responses are cached; the cache is emptied whenever a new weights snapshot is loaded.
+    The prediction_id is cut out of the cached body and every response gets a new one, since an ID
+    can only be given feedback once.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper():
+            features = get_request_features()
+            if not isinstance(features, list):
+                return view()
+
+            version = weights_store.current.version
+            prediction_cache.set_version(version)
+            key = (route_name, tuple(features), version, request.args.get("mode", "hard").lower())
+
+            with metrics.stage("cache"):
+                entry = prediction_cache.get(key)
+            if entry is not None:
+                parts, model_preds = entry
+                body = issue_prediction_id(model_preds).encode().join(parts) if model_preds is not None else parts[0]
+                return Response(body, mimetype="application/json")
+
+            response = make_response(view())
+            if response.status_code == 200:
+                body = response.get_data()
+                if "prediction" in g:
+                    prediction_id, model_preds = g.prediction
+                    prediction_cache.put(key, (body.split(prediction_id.encode()), model_preds))
+                else:
+                    prediction_cache.put(key, ((body,), None))
+            return response
+        return wrapper
+    return decorator
+
 # Define API routes for each model
 @app.route('/predict/logistic_regression', methods=['GET'])
+@cached_prediction("logistic_regression")
 def predict_logistic_regression():
     """Predict survival using Logistic Regression."""
     features = get_request_features()
     return predict_survival("logistic_regression", features)
 
 @app.route('/predict/random_forest', methods=['GET'])
+@cached_prediction("random_forest")
 def predict_random_forest():
     """Predict survival using Random Forest."""
     features = get_request_features()
     return predict_survival("random_forest", features)
 
 @app.route('/predict/svm', methods=['GET'])
+@cached_prediction("svm")
 def predict_svm():
     """Predict survival using Support Vector Machine."""
     features = get_request_features()
@@ -106,21 +294,24 @@ def predict_svm():
 
 # -------------------------- Q2: Define a route to generate a consensus prediction----------------------------------------
 @app.route('/predict/consensus', methods=['GET'])
+@cached_prediction("consensus")
 def predict_consensus():
     """Generate a consensus prediction by averaging outputs from all models."""
+    mode = get_consensus_mode()
+    if not isinstance(mode, str):
+        return mode
     try:
         features = get_request_features()
+        if mode == "soft":
+            return soft_consensus("consensus", features)
         
-        # Convert features into DataFrame for preprocessing
-        features_df = pd.DataFrame([features], columns=['pclass', 'sex', 'age', 'sibsp', 'parch', 'fare', 'embarked'])
-        features_transformed = preprocessor.transform(features_df)
+        # Preprocess input features once and collect individual predictions from all models
+        model_preds = engine.predict_one(features)
 
-        # Collect individual predictions from all models
         individual_predictions = {}
         predictions = []
 
-        for model_name, model in models.items():
-            prediction = model.predict(features_transformed)[0]
+        for model_name, prediction in zip(engine.model_names, model_preds):
             predictions.append(int(prediction))  # Convert int64 to Python int
             individual_predictions[model_name] = "Survived" if prediction == 1 else "Did not survive"
 
@@ -140,7 +331,8 @@ def predict_consensus():
                 "embarked": features[6]
             },
             "individual_predictions": individual_predictions,
-            "final_prediction": survival
+            "final_prediction": survival,
+            "prediction_id": issue_prediction_id(model_preds)
         })
 
     except ValueError as ve:
@@ -151,28 +343,29 @@ def predict_consensus():
 
 # -------------------------- Q3: Define a route to generate a weighted consensus prediction--------------------------------
 @app.route('/predict/weighted_consensus', methods=['GET'])
+@cached_prediction("weighted_consensus")
 def predict_weighted_consensus():
     """Generate a weighted consensus prediction using dynamically adjusted model weights."""
+    mode = get_consensus_mode()
+    if not isinstance(mode, str):
+        return mode
     try:
         # Extract request parameters
         features = get_request_features()
         if features is None:
             return jsonify({"error": "Missing or invalid input parameters"}), 400
+        if mode == "soft":
+            return soft_consensus("weighted_consensus", features, weights_store.current.weights)
 
-        # Convert input into a DataFrame for preprocessing
-        features_df = pd.DataFrame([features], columns=['pclass', 'sex', 'age', 'sibsp', 'parch', 'fare', 'embarked'])
-        
-        # Preprocess input features
-        features_scaled = preprocessor.transform(features_df)
-
-        # Collect individual model predictions
+        # Preprocess input features once and collect individual model predictions
+        model_preds = engine.predict_one(features)
         individual_predictions = {
-            model_name: int(model.predict(features_scaled)[0])  
-            for model_name, model in models.items()
+            model_name: int(prediction)
+            for model_name, prediction in zip(engine.model_names, model_preds)
         }
 
         # Compute weighted consensus prediction
-        model_preds = np.array(list(individual_predictions.values()))
+        weights = weights_store.current.weights
         weighted_prediction = int(round(np.average(model_preds, weights=weights)))
 
         # Convert to human-readable format
@@ -191,7 +384,8 @@ def predict_weighted_consensus():
                 "embarked": {0: "C", 1: "Q", 2: "S"}.get(features[6], "Unknown")
             },
             "individual_predictions": individual_predictions,
-            "final_prediction": survival
+            "final_prediction": survival,
+            "prediction_id": issue_prediction_id(model_preds)
         })
 
     except Exception as e:
@@ -200,31 +394,30 @@ def predict_weighted_consensus():
 
 # -------------------------- Q4: Define a route to generate a PoS weighted consensus prediction --------------------------------
 @app.route('/predict/pos_consensus', methods=['GET'])
+@cached_prediction("pos_consensus")
 def predict_pos_consensus():
     """Generate a Proof-of-Stake weighted consensus prediction using stored model weights."""
+    mode = get_consensus_mode()
+    if not isinstance(mode, str):
+        return mode
     try:
         # Extract request parameters
         features = get_request_features()
         if features is None:
             return jsonify({"error": "Missing or invalid input parameters"}), 400
+        if mode == "soft":
+            return soft_consensus("proof_of_stake_consensus", features, weights_store.current.pos_weights,
+                                  weights_key="model_weights")
 
-        # Convert input into a DataFrame for preprocessing
-        features_df = pd.DataFrame([features], columns=['pclass', 'sex', 'age', 'sibsp', 'parch', 'fare', 'embarked'])
-        
-        # Preprocess input features
-        features_scaled = preprocessor.transform(features_df)
-
-
-        # Collect individual model predictions
+        # Preprocess input features once and collect individual model predictions
+        model_preds = engine.predict_one(features)
         individual_predictions = {
-            model_name: int(model.predict(features_scaled)[0])  # Convert np.int64 to Python int
-            for model_name, model in models.items()
+            model_name: int(prediction)  # Convert np.int64 to Python int
+            for model_name, prediction in zip(engine.model_names, model_preds)
         }
 
         # Compute PoS weighted consensus
-        model_preds = np.array(list(individual_predictions.values()))
-
-        # Weighted consensus prediction
+        pos_weights = weights_store.current.pos_weights
         pos_prediction = int(round(np.average(model_preds, weights=pos_weights)))
 
         # Convert to human-readable format
@@ -243,12 +436,248 @@ def predict_pos_consensus():
             },
             "individual_predictions": individual_predictions,
             "model_weights": pos_weights.tolist(), 
-            "final_prediction": survival
+            "final_prediction": survival,
+            "prediction_id": issue_prediction_id(model_preds)
         })
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# -------------------------- Decentralized consensus over remote peers --------------------------------
+@app.route('/predict/remote_consensus', methods=['GET'])
+def predict_remote_consensus():
+    """Stake-weighted consensus of the registered remote peers, returned once a quorum has answered."""
+    features = get_request_features()
+    if not isinstance(features, list):
+        return features
+
+    try:
+        result = fan_out_client.consensus(dict(zip(FEATURE_COLUMNS, features)))
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 503
+
+    if result["final_prediction"] is None:
+        return jsonify({"error": "No peer answered in time", **result}), 504
+
+    return jsonify({
+        "model": "remote_consensus",
+        "input_features": dict(zip(FEATURE_COLUMNS, features)),
+        **result,
+        "individual_predictions": {
+            name: "Survived" if prediction == 1 else "Did not survive"
+            for name, prediction in result["individual_predictions"].items()
+        },
+        "final_prediction": "Survived" if result["final_prediction"] == 1 else "Did not survive"
+    })
+
+@app.route('/peers', methods=['GET'])
+def get_peers():
+    """Registered remote peers and their stake; ?reload=true re-reads data/peers.json."""
+    if request.args.get("reload", "").lower() == "true":
+        peer_registry.reload()
+    return jsonify([peer._asdict() for peer in peer_registry.peers()])
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Per-stage latency histograms and request counters in the Prometheus text format."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/admin/trace_sampling', methods=['POST'])
+def set_trace_sampling():
+    """Change the share of requests traced to TRACE_FILE, e.g. {"sample_rate": 1.0} while investigating."""
+    payload = request.get_json(silent=True) or {}
+    sample_rate = payload.get("sample_rate")
+    if not isinstance(sample_rate, (int, float)) or not 0 <= sample_rate <= 1:
+        return jsonify({"error": "sample_rate must be a number between 0 and 1"}), 400
+    metrics.trace_sample_rate = float(sample_rate)
+    return jsonify({"sample_rate": metrics.trace_sample_rate, "trace_file": TRACE_FILE,
+                    "traces_written": metrics.traces_written})
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss/eviction counters of the prediction cache."""
+    return jsonify(prediction_cache.stats())
+
+@app.route('/admin/reload_weights', methods=['POST'])
+def reload_weights():
+    """Force a reload of the weight and balance files without restarting the server."""
+    try:
+        reloaded = weights_store.reload(force=True)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    snapshot = weights_store.current
+    if not reloaded:
+        return jsonify({"error": f"Weight files could not be parsed, keeping version {snapshot.version}"}), 500
+    return jsonify({
+        "version": snapshot.version,
+        "weights": snapshot.weights.tolist(),
+        "pos_weights": snapshot.pos_weights.tolist(),
+        "balances": snapshot.balances
+    })
+
+@app.route('/balances', methods=['GET'])
+def get_balances():
+    """Current stake of every model, plus ledger records after ?since=<seq> for auditing."""
+    since = request.args.get("since", type=int)
+    response = {"seq": ledger.seq, "balances": ledger.balances()}
+    if since is not None:
+        response["records"] = ledger.records(since)
+    return jsonify(response)
+
+@app.route('/feedback', methods=['POST'])
+def submit_feedback():
+    """Accept ground-truth labels for previously served consensus predictions.
+
+    Body: a list (or {"feedback": [...]}) of {"prediction_id": "...", "label": 0 | 1}.
+    Labels are applied to the weights asynchronously, in micro-batches. Every prediction_id is
+    accepted once; unknown, expired and already used IDs are returned in unknown_prediction_ids.
+    """
+    payload = request.get_json(silent=True)
+    if isinstance(payload, dict):
+        payload = payload.get("feedback", [payload])
+    if not isinstance(payload, list):
+        return jsonify({"error": "Expected a JSON list of {prediction_id, label} objects"}), 400
+
+    accepted, unknown = 0, []
+    for item in payload:
+        if not isinstance(item, dict) or item.get("label") not in (0, 1):
+            return jsonify({"error": "Each feedback item needs a prediction_id and a label of 0 or 1"}), 400
+
+        model_preds = prediction_log.consume(item.get("prediction_id"))
+        if model_preds is None:
+            unknown.append(item.get("prediction_id"))
+            continue
+        feedback_service.submit(model_preds, item["label"])
+        accepted += 1
+
+    return jsonify({"accepted": accepted, "unknown_prediction_ids": unknown, **feedback_service.stats()}), 202
+
+# -------------------------- Batch prediction routes --------------------------------
+def get_batch_features():
+    """Parse a JSON or CSV request body into a DataFrame of passenger features.
+
+    JSON bodies may be a list of objects, a list of rows in FEATURE_COLUMNS order,
+    or an object with a "passengers" key holding either of those.
+    """
+    if request.mimetype == "text/csv":
+        features_df = pd.read_csv(io.StringIO(request.get_data(as_text=True)))
+    else:
+        payload = request.get_json(silent=True)
+        if isinstance(payload, dict):
+            payload = payload.get("passengers")
+        if not isinstance(payload, list) or not payload:
+            raise ValueError("Expected a non-empty JSON list of passengers or a CSV body")
+        if isinstance(payload[0], (list, tuple)):
+            features_df = pd.DataFrame(payload, columns=FEATURE_COLUMNS)
+        else:
+            features_df = pd.DataFrame(payload)
+
+    missing_columns = [column for column in FEATURE_COLUMNS if column not in features_df.columns]
+    if missing_columns:
+        raise ValueError(f"Missing columns: {', '.join(missing_columns)}")
+
+    features_df = features_df[FEATURE_COLUMNS]
+    if features_df.isnull().values.any():
+        raise ValueError("Missing one or more required values")
+
+    # Same normalisation as get_request_features, applied column-wise
+    return features_df.astype({
+        "pclass": int, "age": float, "sibsp": int, "parch": int, "fare": float
+    }).assign(
+        sex=features_df["sex"].astype(str).str.lower(),
+        embarked=features_df["embarked"].astype(str).str.upper()
+    )
+
+def stream_batch_results(features_df, build_result):
+    """Stream one JSON line per passenger as newline-delimited JSON."""
+    records = features_df.to_dict(orient="records")
+
+    def generate():
+        for index, record in enumerate(records):
+            yield json.dumps({"index": index, "input_features": record, **build_result(index)}) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+def label(prediction):
+    return "Survived" if prediction == 1 else "Did not survive"
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    """Predict survival for many passengers with a single model (?model=<name>)."""
+    model_name = request.args.get("model", type=str)
+    if model_name not in engine.models:
+        return jsonify({"error": f"Model '{model_name}' not found"}), 404
+
+    try:
+        features_df = get_batch_features()
+        predictions = engine.predict(model_name, engine.transform_batch(features_df))
+    except ValueError as ve:
+        return jsonify({"error": f"Value Error: {str(ve)}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    return stream_batch_results(features_df, lambda i: {
+        "model": model_name,
+        "prediction": label(predictions[i])
+    })
+
+def consensus_batch_route(model_label, consensus_weights=None):
+    """Shared body of the batch consensus routes; uniform average when no weights are given."""
+    mode = get_consensus_mode()
+    if not isinstance(mode, str):
+        return mode
+    try:
+        features_df = get_batch_features()
+        features_scaled = engine.transform_batch(features_df)
+        if mode == "soft":
+            model_preds, model_proba = engine.predict_proba_matrix(features_scaled)
+        else:
+            model_preds = engine.predict_matrix(features_scaled)
+    except ValueError as ve:
+        return jsonify({"error": f"Value Error: {str(ve)}"}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    if mode == "soft":
+        survival_proba = soft_vote(model_proba, consensus_weights)
+        final_preds = (survival_proba > 0.5).astype(int)
+    else:
+        final_preds = np.round(np.average(model_preds, axis=1, weights=consensus_weights)).astype(int)
+    prediction_ids = prediction_log.record(model_preds)
+
+    def build_result(i):
+        result = {
+            "model": model_label,
+            "individual_predictions": {
+                model_name: label(model_preds[i, j]) for j, model_name in enumerate(engine.model_names)
+            },
+            "final_prediction": label(final_preds[i]),
+            "prediction_id": prediction_ids[i]
+        }
+        if mode == "soft":
+            result["mode"] = "soft"
+            result["individual_probabilities"] = dict(zip(engine.model_names, model_proba[i].tolist()))
+            result["survival_probability"] = float(survival_proba[i])
+        return result
+
+    return stream_batch_results(features_df, build_result)
+
+@app.route('/predict/batch/consensus', methods=['POST'])
+def predict_batch_consensus():
+    """Consensus prediction for many passengers."""
+    return consensus_batch_route("consensus")
+
+@app.route('/predict/batch/weighted_consensus', methods=['POST'])
+def predict_batch_weighted_consensus():
+    """Weighted consensus prediction for many passengers."""
+    return consensus_batch_route("weighted_consensus", weights_store.current.weights)
+
+@app.route('/predict/batch/pos_consensus', methods=['POST'])
+def predict_batch_pos_consensus():
+    """Proof-of-Stake weighted consensus prediction for many passengers."""
+    return consensus_batch_route("proof_of_stake_consensus", weights_store.current.pos_weights)
+
 # Run the Flask app
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
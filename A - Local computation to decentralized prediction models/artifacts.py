@@ -0,0 +1,551 @@
+# Compact, array-backed model artifacts for the prediction server.
+#
+#   python artifacts.py                 # export data/*.pkl to data/compact/
+#   python artifacts.py --check         # only compare a fresh export with the pickled models
+#   python artifacts.py --calibration-data titanic.csv   # also refit data/calibration.json
+#
+# The export writes one .npy file per array plus a manifest.json; load_artifacts() memory-maps
+# the arrays, so loading costs a few page-table entries instead of unpickling 100 trees (and
+# importing scikit-learn), and every worker process maps the same on-disk pages.
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+# Platt (A, B) of the linear models, fitted on the notebook's held-out test split
+CALIBRATION_FILE = "calibration.json"
+# Pickles written by the notebook, under data/, that an export is made from
+SOURCE_FILES = {
+    "logistic_regression": "logreg_model.pkl",
+    "random_forest": "rf_model.pkl",
+    "svm": "svm_model.pkl",
+    "preprocessor": "preprocessor.pkl"
+}
+# Source of seaborn's load_dataset("titanic"), used by the notebook
+TITANIC_URL = "https://raw.githubusercontent.com/mwaskom/seaborn-data/master/titanic.csv"
+
+
+def _check_finite(X, allow_nan=False):
+    # Same conditions under which the sklearn estimators refuse their input
+    if allow_nan:
+        if np.isinf(X).any():
+            raise ValueError("Input X contains infinity or a value too large for dtype('float32').")
+    elif not np.isfinite(X).all():
+        raise ValueError("Input X contains NaN or infinity.")
+
+
+class ArrayPreprocessor:
+    """A fitted ColumnTransformer of StandardScaler and OneHotEncoder blocks, as plain arrays.
+
+    `numeric` holds (columns, output offset, mean, scale) per scaler block and `categorical`
+    (column, output offset, categories, dropped category index or None) per encoded column.
+    """
+
+    def __init__(self, feature_columns, numeric, categorical, n_features):
+        self.feature_columns = list(feature_columns)
+        self.numeric = numeric
+        self.categorical = categorical
+        self.n_features = n_features
+
+    @classmethod
+    def from_column_transformer(cls, preprocessor, feature_columns):
+        """Read the fitted parameters; None if the transformer has steps this class does not mirror."""
+        from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+        numeric, categorical = [], []
+        for name, transformer, columns in preprocessor.transformers_:
+            if transformer == "drop":
+                continue
+            output = preprocessor.output_indices_[name]
+
+            if isinstance(transformer, StandardScaler):
+                mean = transformer.mean_ if transformer.with_mean else np.zeros(len(columns))
+                scale = transformer.scale_ if transformer.with_std else np.ones(len(columns))
+                numeric.append((list(columns), output.start, np.asarray(mean), np.asarray(scale)))
+            elif isinstance(transformer, OneHotEncoder):
+                if any(getattr(transformer, "infrequent_categories_", None) or []):
+                    return None
+                offset = output.start
+                drop_idx = transformer.drop_idx_
+                for feature, (column, categories) in enumerate(zip(columns, transformer.categories_)):
+                    dropped = None if drop_idx is None else int(drop_idx[feature])
+                    categories = [category.item() if hasattr(category, "item") else category
+                                  for category in categories]
+                    categorical.append((column, offset, categories, dropped))
+                    offset += len(categories) - (dropped is not None)
+            else:
+                return None
+
+        n_features = sum(output.stop - output.start for output in preprocessor.output_indices_.values())
+        return cls(feature_columns, numeric, categorical, n_features)
+
+    def transform(self, features_df):
+        """Encode a DataFrame of passengers like ColumnTransformer.transform."""
+        X = np.zeros((len(features_df), self.n_features))
+
+        for columns, offset, mean, scale in self.numeric:
+            block = features_df[columns].to_numpy(dtype=np.float64)
+            # Same in-place order of operations as StandardScaler.transform
+            block -= mean
+            block /= scale
+            X[:, offset:offset + len(columns)] = block
+
+        for position, (column, offset, categories, dropped) in enumerate(self.categorical):
+            codes = pd.Categorical(features_df[column], categories=categories).codes
+            unknown = codes < 0
+            if unknown.any():
+                raise ValueError(
+                    f"Found unknown categories {sorted(set(features_df[column][unknown]), key=str)} "
+                    f"in column {position} during transform"
+                )
+            rows = np.arange(len(codes))
+            if dropped is not None:
+                rows, codes = rows[codes != dropped], codes[codes != dropped]
+                codes = codes - (codes > dropped)
+            X[rows, offset + codes] = 1.0
+        return X
+
+    def to_manifest(self):
+        return {
+            "feature_columns": self.feature_columns,
+            "n_features": self.n_features,
+            "numeric": [
+                {"columns": columns, "offset": offset, "mean": mean.tolist(), "scale": scale.tolist()}
+                for columns, offset, mean, scale in self.numeric
+            ],
+            "categorical": [
+                {"column": column, "offset": offset, "categories": categories, "dropped": dropped}
+                for column, offset, categories, dropped in self.categorical
+            ]
+        }
+
+    @classmethod
+    def from_manifest(cls, entry):
+        numeric = [(block["columns"], block["offset"], np.array(block["mean"]), np.array(block["scale"]))
+                   for block in entry["numeric"]]
+        categorical = [(block["column"], block["offset"], block["categories"], block["dropped"])
+                       for block in entry["categorical"]]
+        return cls(entry["feature_columns"], numeric, categorical, entry["n_features"])
+
+
+class LinearClassifier:
+    """Binary linear model (LogisticRegression, linear-kernel SVC) reduced to its coefficients.
+
+    `calibration` holds Platt parameters (A, B) mapping a decision value f to the probability
+    1 / (1 + exp(A * f + B)) of the positive class; (-1, 0) for logistic regression, fitted on
+    labelled data for the SVM, None if unknown.
+    """
+
+    kind = "linear"
+
+    def __init__(self, coef, intercept, classes, calibration=None):
+        self.coef = coef                # (n_features, 1), i.e. sklearn's coef_.T
+        self.intercept = intercept      # (1,)
+        self.classes = classes
+        self.calibration = calibration
+
+    @classmethod
+    def from_estimator(cls, estimator):
+        from sklearn.linear_model import LogisticRegression
+
+        if len(estimator.classes_) != 2:
+            raise ValueError("Only binary linear models can be exported")
+        return cls(np.ascontiguousarray(estimator.coef_.T, dtype=np.float64),
+                   np.asarray(estimator.intercept_, dtype=np.float64), np.asarray(estimator.classes_),
+                   (-1.0, 0.0) if isinstance(estimator, LogisticRegression) else None)
+
+    def arrays(self):
+        return {"coef": self.coef, "intercept": self.intercept, "classes": self.classes}
+
+    @classmethod
+    def from_arrays(cls, arrays, calibration=None):
+        return cls(arrays["coef"], arrays["intercept"], arrays["classes"],
+                   tuple(calibration) if calibration is not None else None)
+
+    def decision_function(self, X):
+        _check_finite(X)
+        return (X @ self.coef + self.intercept).ravel()
+
+    def predict(self, X):
+        return self.classes[(self.decision_function(X) > 0).astype(int)]
+
+    def predict_proba(self, X):
+        if self.calibration is None:
+            raise AttributeError("predict_proba needs a calibrated model (see fit_platt)")
+        positive = platt(self.decision_function(X), *self.calibration)
+        return np.column_stack([1 - positive, positive])
+
+
+def platt(decisions, a, b):
+    return 1.0 / (1.0 + np.exp(a * decisions + b))
+
+
+def fit_platt(decisions, labels, max_iterations=100):
+    """Platt scaling: (A, B) minimising the log loss of 1 / (1 + exp(A * f + B)) against labels.
+
+    Uses Platt's smoothed targets and Newton steps (Lin, Lin and Weng, 2007).
+    """
+    decisions = np.asarray(decisions, dtype=np.float64)
+    labels = np.asarray(labels).astype(bool)
+    positives, negatives = labels.sum(), (~labels).sum()
+    targets = np.where(labels, (positives + 1.0) / (positives + 2.0), 1.0 / (negatives + 2.0))
+
+    a, b = 0.0, float(np.log((negatives + 1.0) / (positives + 1.0)))
+    for _ in range(max_iterations):
+        p = platt(decisions, a, b)
+        residual = targets - p
+        weight = p * (1 - p)
+        gradient = np.array([residual @ decisions, residual.sum()])
+        hessian = np.array([[weight @ decisions ** 2, weight @ decisions],
+                            [weight @ decisions, weight.sum()]]) + 1e-12 * np.eye(2)
+        step = np.linalg.solve(hessian, gradient)
+        a, b = a - step[0], b - step[1]
+        if np.abs(step).max() < 1e-10:
+            break
+    return float(a), float(b)
+
+
+class FusedLinearScorer:
+    """Several binary linear models scored together with one matrix product.
+
+    The models' coefficient vectors are the columns of one (n_features, n_models) matrix, so
+    a batch of preprocessed rows costs a single GEMM however many linear models there are.
+    Every model must be calibrated, so that the scorer's probabilities are all probabilities.
+    """
+
+    def __init__(self, models):
+        uncalibrated = [name for name, model in models.items() if model.calibration is None]
+        if uncalibrated:
+            raise ValueError(f"No calibration for {', '.join(uncalibrated)}: "
+                             f"add its Platt parameters to {CALIBRATION_FILE} (see fit_platt)")
+        self.model_names = list(models)
+        self.coef = np.ascontiguousarray(np.hstack([model.coef for model in models.values()]))
+        self.intercept = np.concatenate([model.intercept for model in models.values()])
+        self.classes = np.column_stack([model.classes for model in models.values()])
+        self.calibration_a, self.calibration_b = (
+            np.array(values, dtype=np.float64) for values in zip(*(model.calibration for model in models.values()))
+        )
+
+    @classmethod
+    def from_models(cls, models, calibrations=None):
+        """Scorer over the binary linear models among `models` (compact or sklearn); None if none.
+
+        `calibrations` maps model names to Platt (A, B) parameters for the models that do not
+        carry their own, such as a pickled SVC(probability=False). Raises ValueError if a
+        linear model is left without one.
+        """
+        calibrations = calibrations or {}
+        linear = {}
+        for name, model in models.items():
+            if not isinstance(model, LinearClassifier) and hasattr(model, "coef_"):
+                try:
+                    model = compact_model(model)
+                except (TypeError, ValueError):
+                    continue
+            if isinstance(model, LinearClassifier):
+                if model.calibration is None and name in calibrations:
+                    model = LinearClassifier(model.coef, model.intercept, model.classes, tuple(calibrations[name]))
+                linear[name] = model
+        return cls(linear) if linear else None
+
+    def decision_function(self, X):
+        """(n_samples, n_models) decision values."""
+        _check_finite(X)
+        return X @ self.coef + self.intercept
+
+    def predict(self, X):
+        """(n_samples, n_models) predicted classes."""
+        positive = self.decision_function(X) > 0
+        return np.where(positive, self.classes[1], self.classes[0])
+
+    def predict_proba(self, X):
+        """(n_samples, n_models) calibrated probability of each model's positive class."""
+        return self.score(X)[1]
+
+    def score(self, X):
+        """Predicted classes and positive-class probabilities, both from one product."""
+        decisions = self.decision_function(X)
+        positive = decisions > 0
+        proba = platt(decisions, self.calibration_a, self.calibration_b)
+        return np.where(positive, self.classes[1], self.classes[0]), proba
+
+
+class ForestClassifier:
+    """RandomForestClassifier as flat node arrays shared by all of its trees.
+
+    Node i of the forest tests X[:, feature[i]] <= threshold[i] (NaN follows missing_left[i])
+    and continues at children[i, 0] or children[i, 1]; leaves point to themselves and carry
+    the class probabilities of their tree in `value`. Tree t starts at roots[t] and any
+    sample reaches a leaf after depths[t] steps, so max(depths) steps settle every tree.
+    """
+
+    kind = "forest"
+
+    def __init__(self, children, feature, threshold, missing_left, value, roots, depths, classes):
+        self.children = children            # (n_nodes, 2) int32, global node indexes
+        self.feature = feature              # (n_nodes,) int32
+        self.threshold = threshold          # (n_nodes,) float64
+        self.missing_left = missing_left    # (n_nodes,) bool
+        self.value = value                  # (n_nodes, n_classes) float64, normalised per leaf
+        self.roots = roots                  # (n_trees,) int32
+        self.depths = depths                # (n_trees,) int32
+        self.classes = classes
+
+        self.max_depth = int(self.depths.max())
+        self._children_flat = self.children.ravel()
+        self.chunk_size = 1024  # samples walked at once; keeps the frontier cache-sized
+
+    @classmethod
+    def from_estimator(cls, forest):
+        if forest.n_outputs_ != 1:
+            raise ValueError("Only single-output forests can be exported")
+
+        children, feature, threshold, missing_left, value, roots, depths = [], [], [], [], [], [], []
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count)
+            leaf = tree.children_left < 0
+            children.append(np.column_stack([
+                np.where(leaf, nodes, tree.children_left), np.where(leaf, nodes, tree.children_right)
+            ]) + offset)
+            feature.append(np.where(leaf, 0, tree.feature))
+            threshold.append(np.where(leaf, np.inf, tree.threshold))
+            missing = getattr(tree, "missing_go_to_left", None)
+            missing_left.append(np.zeros(tree.node_count, dtype=bool) if missing is None else missing.astype(bool))
+
+            # Same normalisation as DecisionTreeClassifier.predict_proba
+            proba = tree.value[:, 0, :forest.n_classes_].copy()
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba /= normalizer
+            value.append(proba)
+
+            roots.append(offset)
+            depths.append(tree.max_depth)
+            offset += tree.node_count
+
+        return cls(np.concatenate(children).astype(np.int32), np.concatenate(feature).astype(np.int32),
+                   np.concatenate(threshold).astype(np.float64), np.concatenate(missing_left),
+                   np.concatenate(value), np.array(roots, dtype=np.int32), np.array(depths, dtype=np.int32),
+                   np.asarray(forest.classes_))
+
+    def arrays(self):
+        return {name: getattr(self, name) for name in
+                ("children", "feature", "threshold", "missing_left", "value", "roots", "depths", "classes")}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(**arrays)
+
+    def apply(self, X):
+        """Leaf reached in every tree by every sample, as a (n_samples, n_trees) array of nodes.
+
+        All trees are walked together, one level per step: each step is a handful of gathers
+        over the (n_samples, n_trees) frontier instead of a pass through every tree object.
+        X must already be float32, as sklearn's trees compare float32 inputs.
+        """
+        n_samples, n_features = X.shape
+        node = np.repeat(self.roots[np.newaxis, :], n_samples, axis=0)
+        # Flat positions of each sample's row in X, so a gather is one np.take
+        row_offsets = (np.arange(n_samples, dtype=np.intp) * n_features)[:, np.newaxis]
+        X_flat = X.ravel()
+        has_nan = np.isnan(X_flat).any()
+
+        for _ in range(self.max_depth):
+            x = np.take(X_flat, row_offsets + np.take(self.feature, node))
+            go_left = x <= np.take(self.threshold, node)
+            if has_nan:
+                go_left |= np.isnan(x) & np.take(self.missing_left, node)
+            node = np.take(self._children_flat, 2 * node + 1 - go_left)
+        return node
+
+    def predict_proba(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        _check_finite(X, allow_nan=True)
+        proba = np.empty((len(X), self.value.shape[1]))
+        for start in range(0, len(X), self.chunk_size):
+            leaves = self.apply(X[start:start + self.chunk_size])
+            # Tree-major (n_trees, n_samples, n_classes) so the sum adds the trees one after
+            # another, in the same order and rounding as RandomForestClassifier.predict_proba
+            chunk = np.take(self.value, leaves.T, axis=0).sum(axis=0)
+            chunk /= len(self.roots)
+            proba[start:start + len(chunk)] = chunk
+        return proba
+
+    def predict(self, X):
+        return self.classes.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def compact_model(estimator):
+    """Array-backed equivalent of a fitted estimator."""
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.svm import SVC
+
+    if isinstance(estimator, RandomForestClassifier):
+        return ForestClassifier.from_estimator(estimator)
+    if isinstance(estimator, LogisticRegression) or (isinstance(estimator, SVC) and estimator.kernel == "linear"):
+        return LinearClassifier.from_estimator(estimator)
+    raise TypeError(f"No compact format for {type(estimator).__name__}")
+
+
+def file_digest(path):
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def export_artifacts(models, preprocessor, feature_columns, output_dir, calibrations=None, sources=()):
+    """Write the models and the preprocessor to output_dir; return the manifest.
+
+    `calibrations` maps linear model names to Platt (A, B) parameters, e.g. from fit_platt.
+    The SHA-256 of every file in `sources` (the pickles the models were loaded from) is kept
+    in the manifest, so a stale export can be told apart from a current one.
+    """
+    calibrations = calibrations or {}
+    compact_preprocessor = ArrayPreprocessor.from_column_transformer(preprocessor, feature_columns)
+    if compact_preprocessor is None:
+        raise TypeError("The preprocessor has steps without a compact equivalent")
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "sources": {os.path.basename(path): file_digest(path) for path in sources},
+        "preprocessor": compact_preprocessor.to_manifest(),
+        "models": {}
+    }
+    for name, estimator in models.items():
+        model = compact_model(estimator)
+        files = {}
+        for array_name, array in model.arrays().items():
+            files[array_name] = f"{name}.{array_name}.npy"
+            np.save(os.path.join(output_dir, files[array_name]), np.ascontiguousarray(array))
+        manifest["models"][name] = {
+            "kind": model.kind, "calibration": calibrations.get(name, getattr(model, "calibration", None)),
+            "arrays": files
+        }
+
+    # Manifest last: a directory without one is an unfinished export and is not loaded
+    tmp_path = os.path.join(output_dir, f"{MANIFEST}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(output_dir, MANIFEST))
+    return manifest
+
+
+def load_calibrations(path):
+    """{model name: (A, B)} from a calibration file; empty if there is none."""
+    try:
+        with open(path, "r") as f:
+            return {name: tuple(parameters) for name, parameters in json.load(f).items()}
+    except FileNotFoundError:
+        return {}
+
+
+def has_artifacts(artifacts_dir):
+    return os.path.exists(os.path.join(artifacts_dir, MANIFEST))
+
+
+def stale_sources(artifacts_dir, sources):
+    """Files among `sources` that changed (or are unknown) since the export was written."""
+    with open(os.path.join(artifacts_dir, MANIFEST), "r") as f:
+        exported = json.load(f).get("sources", {})
+    return [path for path in sources if exported.get(os.path.basename(path)) != file_digest(path)]
+
+
+def load_artifacts(artifacts_dir, mmap_mode="r"):
+    """Memory-map an export; return (models dict, preprocessor) in the manifest's model order."""
+    with open(os.path.join(artifacts_dir, MANIFEST), "r") as f:
+        manifest = json.load(f)
+    if manifest["format_version"] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format version {manifest['format_version']}")
+
+    models = {}
+    for name, entry in manifest["models"].items():
+        # Plain ndarray views of the maps: same pages, without np.memmap's per-operation overhead
+        arrays = {
+            array_name: np.asarray(np.load(os.path.join(artifacts_dir, file_name), mmap_mode=mmap_mode))
+            for array_name, file_name in entry["arrays"].items()
+        }
+        if entry["kind"] == "forest":
+            models[name] = ForestClassifier.from_arrays(arrays)
+        else:
+            models[name] = LinearClassifier.from_arrays(arrays, entry["calibration"])
+    return models, ArrayPreprocessor.from_manifest(manifest["preprocessor"])
+
+
+def compare(models, preprocessor, compact_models, compact_preprocessor, samples):
+    """Number of differing predictions per model, and whether the preprocessed rows match exactly."""
+    X = preprocessor.transform(samples)
+    X_compact = compact_preprocessor.transform(samples)
+    mismatches = {
+        name: int((estimator.predict(X) != compact_models[name].predict(X_compact)).sum())
+        for name, estimator in models.items()
+    }
+    return mismatches, bool(np.array_equal(X, X_compact))
+
+
+def calibration_split(source, feature_columns):
+    """The notebook's held-out test split of the Titanic data, (features DataFrame, labels)."""
+    from sklearn.model_selection import train_test_split
+
+    df = pd.read_csv(source)
+    df = df.drop(columns=["deck"]).dropna()
+    _, X_test, _, y_test = train_test_split(df[feature_columns], df["survived"], test_size=0.2, random_state=42)
+    return X_test, y_test.to_numpy()
+
+
+def main():
+    import joblib
+
+    from benchmark import generate_passengers
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Export the pickled models to the compact array format")
+    parser.add_argument("--data", default=os.path.join(base_dir, "data"))
+    parser.add_argument("--output", default=os.path.join(base_dir, "data", "compact"))
+    parser.add_argument("--samples", type=int, default=20000, help="random passengers used to check the export")
+    parser.add_argument("--check", action="store_true", help="check an existing export instead of writing one")
+    parser.add_argument("--calibration-data", default=None,
+                        help=f"Titanic CSV (URL or path, e.g. {TITANIC_URL}) whose held-out split "
+                             f"refits the calibration of the linear models; default: data/{CALIBRATION_FILE}")
+    args = parser.parse_args()
+
+    feature_columns = ['pclass', 'sex', 'age', 'sibsp', 'parch', 'fare', 'embarked']
+    sources = {name: os.path.join(args.data, file_name) for name, file_name in SOURCE_FILES.items()}
+    models = {name: joblib.load(path) for name, path in sources.items() if name != "preprocessor"}
+    preprocessor = joblib.load(sources["preprocessor"])
+
+    calibration_file = os.path.join(args.data, CALIBRATION_FILE)
+    if not args.check:
+        calibrations = load_calibrations(calibration_file)
+        if args.calibration_data is not None:
+            X_calibration, y_calibration = calibration_split(args.calibration_data, feature_columns)
+            X_calibration = preprocessor.transform(X_calibration)
+            for name, estimator in models.items():
+                model = compact_model(estimator)
+                if isinstance(model, LinearClassifier) and model.calibration is None:
+                    calibrations[name] = fit_platt(model.decision_function(X_calibration), y_calibration)
+                    print(f"{name} calibrated on {len(y_calibration)} held-out passengers: "
+                          f"A={calibrations[name][0]:.4f} B={calibrations[name][1]:.4f}")
+            with open(calibration_file, "w") as f:
+                json.dump({name: list(parameters) for name, parameters in calibrations.items()}, f, indent=4)
+        export_artifacts(models, preprocessor, feature_columns, args.output, calibrations, sources.values())
+        size = sum(os.path.getsize(os.path.join(args.output, f)) for f in os.listdir(args.output))
+        print(f"Exported {len(models)} models to {args.output} ({size / 1024:.0f} KiB)")
+
+    compact_models, compact_preprocessor = load_artifacts(args.output)
+    samples = pd.DataFrame(generate_passengers(args.samples, np.random.default_rng(0)))[feature_columns]
+    mismatches, same_features = compare(models, preprocessor, compact_models, compact_preprocessor, samples)
+    print(f"Preprocessed features identical: {same_features}")
+    for name, count in mismatches.items():
+        print(f"{name:20s} {count} of {len(samples)} predictions differ")
+
+
+if __name__ == "__main__":
+    main()
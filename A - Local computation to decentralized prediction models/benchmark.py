@@ -0,0 +1,245 @@
+# Load and latency benchmark for the prediction API (app.py).
+#
+#   python benchmark.py --url http://localhost:5000 --requests 2000 --concurrency 16
+#   python benchmark.py --stages 2000 --routes none     # in-process per-stage timing only
+#   python benchmark.py --forest 1000 --routes none     # flattened forest vs sklearn, in-process
+#
+# Results are written as JSON (--output) so runs can be compared across changes.
+import argparse
+import json
+import platform
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import numpy as np
+
+from peers import ConnectionPool
+
+SINGLE_ROUTES = [
+    "logistic_regression", "random_forest", "svm", "consensus", "weighted_consensus", "pos_consensus"
+]
+BATCH_ROUTES = ["batch/consensus", "batch/weighted_consensus", "batch/pos_consensus"]
+
+
+def generate_passengers(n, rng):
+    """Passengers drawn from distributions close to the seaborn Titanic data set."""
+    pclass = rng.choice([1, 2, 3], size=n, p=[0.24, 0.21, 0.55])
+    sex = rng.choice(["male", "female"], size=n, p=[0.65, 0.35])
+    age = np.clip(rng.normal(29.7, 14.5, size=n), 0.42, 80).round(1)
+    sibsp = np.minimum(rng.poisson(0.5, size=n), 8)
+    parch = np.minimum(rng.poisson(0.4, size=n), 6)
+    # Fares are roughly log-normal with a median that depends strongly on the class
+    median_fare = np.array([0, 60.0, 14.5, 8.05])[pclass]
+    fare = (median_fare * rng.lognormal(0, 0.6, size=n)).round(4)
+    embarked = rng.choice(["S", "C", "Q"], size=n, p=[0.72, 0.19, 0.09])
+
+    return [
+        {"pclass": int(pclass[i]), "sex": str(sex[i]), "age": float(age[i]), "sibsp": int(sibsp[i]),
+         "parch": int(parch[i]), "fare": float(fare[i]), "embarked": str(embarked[i])}
+        for i in range(n)
+    ]
+
+
+def summarize(latencies, elapsed=None):
+    latencies_ms = np.asarray(latencies) * 1000
+    if not len(latencies_ms):
+        return {"count": 0}
+    summary = {
+        "count": int(len(latencies_ms)),
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "max_ms": float(latencies_ms.max())
+    }
+    if elapsed:
+        summary["throughput_rps"] = len(latencies_ms) / elapsed
+    return summary
+
+
+def run_route(pool, base_url, route, passengers, requests, concurrency, batch_size, timeout):
+    """Drive one route with `concurrency` parallel clients; return its latency summary."""
+    if route.startswith("batch/"):
+        def call(i):
+            rows = [passengers[(i * batch_size + k) % len(passengers)] for k in range(batch_size)]
+            return pool.request("POST", f"{base_url}/predict/{route}", timeout,
+                                body=json.dumps(rows), headers={"Content-Type": "application/json"})
+    else:
+        def call(i):
+            query = urlencode(passengers[i % len(passengers)])
+            return pool.request("GET", f"{base_url}/predict/{route}?{query}", timeout)
+
+    def timed(i):
+        started = time.perf_counter()
+        try:
+            status, _ = call(i)
+        except Exception:
+            status = None
+        return time.perf_counter() - started, status == 200
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    summary = summarize([latency for latency, ok in results if ok], elapsed)
+    summary["errors"] = sum(1 for _, ok in results if not ok)
+    if route.startswith("batch/"):
+        summary["rows_per_second"] = summary.get("throughput_rps", 0) * batch_size
+    return summary
+
+
+def profile_stages(passengers, iterations):
+    """Per-stage timing of the served single-row path, from the server's own request traces.
+
+    GET /predict/consensus (hard and soft) is served in-process by the Flask test client with
+    every request traced and the prediction cache cleared, so every request is a miss. The
+    stages are the spans /metrics reports: parse, cache, transform, one predict for the fused
+    linear models (in the request thread) and one per pooled model, serialize, and the whole
+    request.
+    """
+    import os
+    import tempfile
+
+    import app as server
+
+    fd, trace_file = tempfile.mkstemp(suffix=".jsonl")
+    os.close(fd)
+    # Nothing has been traced in this process yet, so the trace handle opens on trace_file
+    server.metrics.trace_file, server.metrics.trace_sample_rate = trace_file, 1.0
+    try:
+        client = server.app.test_client()
+        for mode in ("hard", "soft"):
+            for i in range(iterations):
+                server.prediction_cache.clear()
+                client.get(f"/predict/consensus?{urlencode({**passengers[i % len(passengers)], 'mode': mode})}")
+        server.metrics.trace_sample_rate = 0.0
+        with open(trace_file) as f:
+            traces = [json.loads(line) for line in f]
+    finally:
+        os.remove(trace_file)
+
+    timings = {}
+    for i, trace in enumerate(traces):
+        mode = "hard" if i < iterations else "soft"
+        timings.setdefault(f"{mode}.request", []).append(trace["duration_ms"] / 1000)
+        for span in trace["spans"]:
+            stage = f"{mode}.{span['stage']}" + (f".{span['model']}" if span["model"] else "")
+            timings.setdefault(stage, []).append(span["duration_ms"] / 1000)
+    return {stage: summarize(values) for stage, values in timings.items()}
+
+
+def forest_microbenchmark(passengers, iterations, batch_size):
+    """Flattened-tree ForestClassifier against the pickled RandomForestClassifier.
+
+    Checks that both give identical probabilities on every passenger, then times single-row
+    and batch predictions of each.
+    """
+    import os
+
+    import joblib
+    import pandas as pd
+
+    from artifacts import ForestClassifier
+
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+    forest = joblib.load(os.path.join(data_dir, "rf_model.pkl"))
+    preprocessor = joblib.load(os.path.join(data_dir, "preprocessor.pkl"))
+    flat = ForestClassifier.from_estimator(forest)
+
+    X = preprocessor.transform(pd.DataFrame(passengers)[list(preprocessor.feature_names_in_)])
+    results = {"identical_proba": bool(np.array_equal(forest.predict_proba(X), flat.predict_proba(X))),
+               "identical_predictions": bool(np.array_equal(forest.predict(X), flat.predict(X))),
+               "samples": len(X)}
+
+    for name, model in (("sklearn", forest), ("flattened", flat)):
+        latencies = []
+        for i in range(iterations):
+            row = X[i % len(X)][np.newaxis, :]
+            started = time.perf_counter()
+            model.predict(row)
+            latencies.append(time.perf_counter() - started)
+        results[f"{name}.single"] = summarize(latencies)
+
+        batch = X[:batch_size]
+        latencies = []
+        for _ in range(max(iterations // 100, 3)):
+            started = time.perf_counter()
+            model.predict(batch)
+            latencies.append(time.perf_counter() - started)
+        results[f"{name}.batch"] = summarize(latencies)
+        results[f"{name}.batch"]["rows_per_second"] = len(batch) / float(np.median(latencies))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency and throughput benchmark for the prediction API")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--routes", default="single",
+                        help="comma-separated routes, or 'single', 'batch', 'all', 'none'")
+    parser.add_argument("--requests", type=int, default=1000, help="requests per route")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=100, help="passengers per batch request")
+    parser.add_argument("--distinct", type=int, default=0,
+                        help="size of the passenger pool (repeats exercise the cache); 0 = all distinct")
+    parser.add_argument("--stages", type=int, default=0, help="in-process per-stage iterations (0 = skip)")
+    parser.add_argument("--forest", type=int, default=0,
+                        help="flattened forest vs sklearn microbenchmark iterations (0 = skip)")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    route_sets = {"single": SINGLE_ROUTES, "batch": BATCH_ROUTES, "all": SINGLE_ROUTES + BATCH_ROUTES, "none": []}
+    routes = route_sets.get(args.routes, [route for route in args.routes.split(",") if route])
+
+    rng = np.random.default_rng(args.seed)
+    # Enough passengers for every row sent by the selected routes to be distinct, and for one
+    # full batch of the forest microbenchmark
+    batch_size = max(args.batch_size, 1)
+    rows_per_request = batch_size if any(route.startswith("batch/") for route in routes) else 1
+    pool_size = max(args.requests * rows_per_request, batch_size if args.forest else 1, 1)
+    passengers = generate_passengers(args.distinct or pool_size, rng)
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "routes": {},
+        "stages": {},
+        "forest": {}
+    }
+
+    pool = ConnectionPool(max_idle_per_host=args.concurrency)
+    for route in routes:
+        summary = run_route(pool, args.url.rstrip("/"), route, passengers, args.requests,
+                            args.concurrency, args.batch_size, args.timeout)
+        results["routes"][route] = summary
+        print(f"{route:28s} p50={summary.get('p50_ms', 0):8.2f}ms p95={summary.get('p95_ms', 0):8.2f}ms "
+              f"p99={summary.get('p99_ms', 0):8.2f}ms {summary.get('throughput_rps', 0):9.1f} req/s "
+              f"errors={summary['errors']}")
+    pool.close()
+
+    if args.stages:
+        results["stages"] = profile_stages(passengers, args.stages)
+        for stage, summary in results["stages"].items():
+            print(f"stage {stage:40s} p50={summary['p50_ms'] * 1000:8.1f}us p99={summary['p99_ms'] * 1000:8.1f}us")
+
+    if args.forest:
+        results["forest"] = forest = forest_microbenchmark(passengers, args.forest, args.batch_size)
+        print(f"forest identical to sklearn: proba={forest['identical_proba']} "
+              f"predictions={forest['identical_predictions']} ({forest['samples']} passengers)")
+        for name in ("sklearn", "flattened"):
+            single, batch = forest[f"{name}.single"], forest[f"{name}.batch"]
+            print(f"forest {name:10s} single p50={single['p50_ms'] * 1000:8.1f}us "
+                  f"p99={single['p99_ms'] * 1000:8.1f}us batch of {args.batch_size} "
+                  f"p50={batch['p50_ms']:8.2f}ms {batch['rows_per_second']:10.0f} rows/s")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
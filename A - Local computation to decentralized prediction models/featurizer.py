@@ -0,0 +1,122 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from artifacts import ArrayPreprocessor
+
+# Numeric values used alongside every category combination when verifying the fast path
+VERIFICATION_NUMERIC_VALUES = (22.0, 1, 0, 7.25, 38.0, 1, 0, 71.2833, 0.42, 5, 2, 512.3292)
+
+
+class FastFeaturizer:
+    """Encode a single passenger straight into a NumPy row, without pandas.
+
+    The fitted StandardScaler statistics and OneHotEncoder categories are read from the
+    ColumnTransformer (or its ArrayPreprocessor export) once, at startup. `transform`
+    returns None whenever the fast path cannot encode a row (unseen category, unsupported
+    preprocessor), so the caller can fall back to `preprocessor.transform`.
+    """
+
+    def __init__(self, preprocessor, feature_columns):
+        self.feature_columns = list(feature_columns)
+        self._local = threading.local()
+
+        # Plan of (column positions, output offset, scaler mean, scaler scale) for numeric blocks
+        self._numeric = []
+        # Plan of (column position, {category: output index or None if dropped}) for categorical blocks
+        self._categorical = []
+        self.enabled = self._compile(preprocessor)
+
+    def _compile(self, preprocessor):
+        """Extract the fitted parameters; return False if the preprocessor has steps we do not mirror."""
+        if not isinstance(preprocessor, ArrayPreprocessor):
+            preprocessor = ArrayPreprocessor.from_column_transformer(preprocessor, self.feature_columns)
+            if preprocessor is None:
+                self.n_features = 0
+                return False
+        self.n_features = preprocessor.n_features
+
+        for columns, offset, mean, scale in preprocessor.numeric:
+            positions = [self.feature_columns.index(column) for column in columns]
+            self._numeric.append((positions, offset, mean, scale))
+        for column, offset, categories, dropped in preprocessor.categorical:
+            lookup = {}
+            for index, category in enumerate(categories):
+                if index == dropped:
+                    lookup[category] = None
+                else:
+                    lookup[category] = offset
+                    offset += 1
+            self._categorical.append((self.feature_columns.index(column), lookup))
+        return True
+
+    def _row(self):
+        # One preallocated row per thread, reused across requests
+        row = getattr(self._local, "row", None)
+        if row is None:
+            row = self._local.row = np.empty((1, self.n_features), dtype=np.float64)
+        return row
+
+    def transform(self, features):
+        """Encode one passenger (values in feature_columns order) into a (1, n_features) array.
+
+        The returned array is a per-thread buffer that is overwritten by the next call.
+        """
+        if not self.enabled:
+            return None
+
+        row = self._row()
+        row.fill(0.0)
+        values = row[0]
+
+        for position, lookup in self._categorical:
+            try:
+                index = lookup[features[position]]
+            except (KeyError, TypeError):
+                return None  # Unseen category: let the ColumnTransformer handle (and report) it
+            if index is not None:
+                values[index] = 1.0
+
+        for positions, offset, mean, scale in self._numeric:
+            block = values[offset:offset + len(positions)]
+            block[:] = [features[position] for position in positions]
+            # Same in-place order of operations as StandardScaler.transform
+            block -= mean
+            block /= scale
+
+        return row
+
+    def verify(self, preprocessor, samples):
+        """Disable the fast path unless it is bit-identical to preprocessor.transform on `samples`."""
+        if not self.enabled:
+            return False
+
+        expected = preprocessor.transform(pd.DataFrame(samples, columns=self.feature_columns))
+        if hasattr(expected, "toarray"):
+            expected = expected.toarray()
+
+        for sample, expected_row in zip(samples, np.asarray(expected, dtype=np.float64)):
+            row = self.transform(sample)
+            if row is None or not np.array_equal(row[0], expected_row):
+                self.enabled = False
+                break
+        return self.enabled
+
+    def verification_samples(self):
+        """Every combination of known categories, paired with a few numeric values."""
+        numeric_positions = [position for positions, _, _, _ in self._numeric for position in positions]
+        combinations = [[None] * len(self.feature_columns)]
+        for position, lookup in self._categorical:
+            combinations = [
+                combination[:position] + [category] + combination[position + 1:]
+                for combination in combinations for category in lookup
+            ]
+
+        samples = []
+        values = VERIFICATION_NUMERIC_VALUES
+        for index, combination in enumerate(combinations):
+            for offset, position in enumerate(numeric_positions):
+                combination[position] = values[(index * len(numeric_positions) + offset) % len(values)]
+            samples.append(combination)
+        return samples
@@ -0,0 +1,225 @@
+import hashlib
+import hmac
+import os
+import queue
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from ledger import _lock_file
+from weighting import stake_weights, update_weights, update_weights_with_slashing
+
+
+class PredictionLog:
+    """Issues single-use prediction IDs that carry the individual model predictions they stand for.
+
+    An ID is "<nonce>.<predictions>.<signature>", e.g. "65f1c2a03f2a...c1.101.9b0e...", signed
+    with HMAC-SHA256 under a secret created with the log; the nonce starts with the issue time.
+    The server keeps no per-prediction state until an ID is consumed, and any worker process
+    forked from the one that created the log accepts the IDs issued by the others. IDs do not
+    survive a restart of the server and expire after `max_age` seconds.
+
+    `consume` accepts an ID once. Consumed nonces are appended to `consumed_file` under an
+    exclusive lock, so an ID consumed by one worker is refused by all the others; without a
+    file they are only remembered by this process. Once a minute the expired nonces are
+    dropped, and the file is rewritten under the same lock with the rest. Its first line,
+    "# <generation>", changes with every rewrite, so the other processes then read it again
+    from the start.
+    """
+
+    def __init__(self, secret=None, consumed_file=None, max_age=86400):
+        self._secret = secret or os.urandom(32)
+        self.consumed_file = consumed_file
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._consumed = {}  # nonce -> issue time, of the unexpired consumed IDs
+        self._header = b"# 0\n"  # first line of consumed_file when it was last read
+        self._offset = len(self._header)  # bytes of consumed_file already read into _consumed
+        self._pruned_at = time.time()
+        if consumed_file is not None:
+            # The IDs consumed by an earlier run were signed with another secret
+            with open(consumed_file, "wb") as f:
+                f.write(self._header)
+
+    def _sign(self, payload):
+        return hmac.new(self._secret, payload.encode(), hashlib.sha256).hexdigest()[:32]
+
+    def record(self, model_preds):
+        """Return one ID for every row of a (n_rows, n_models) prediction matrix."""
+        issued = f"{int(time.time()):08x}"
+        prediction_ids = []
+        for row in model_preds:
+            payload = f"{issued}{uuid.uuid4().hex[:24]}.{''.join(str(int(prediction)) for prediction in row)}"
+            prediction_ids.append(f"{payload}.{self._sign(payload)}")
+        return prediction_ids
+
+    def _verify(self, prediction_id):
+        # (nonce, issue time, model predictions) of a valid, unexpired ID, else None
+        if not isinstance(prediction_id, str) or prediction_id.count(".") != 2:
+            return None
+        payload, signature = prediction_id.rsplit(".", 1)
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            return None
+        nonce, predictions = payload.split(".")
+        issued = int(nonce[:8], 16)
+        if time.time() - issued > self.max_age:
+            return None
+        return nonce, issued, tuple(int(prediction) for prediction in predictions)
+
+    def get(self, prediction_id):
+        """The model predictions behind an ID, or None if it was not issued by this log or expired."""
+        verified = self._verify(prediction_id)
+        return verified[2] if verified is not None else None
+
+    def consume(self, prediction_id):
+        """Like `get`, but only the first time: an ID that was already consumed gives None."""
+        verified = self._verify(prediction_id)
+        if verified is None:
+            return None
+        nonce, issued, model_preds = verified
+        with self._lock:
+            if self.consumed_file is None:
+                self._prune()
+                if nonce in self._consumed:
+                    return None
+                self._consumed[nonce] = issued
+                return model_preds
+
+            with open(self.consumed_file, "ab+") as f:
+                _lock_file(f)  # released when the file is closed
+                self._catch_up(f)
+                if self._prune():
+                    self._compact(f)
+                if nonce in self._consumed:
+                    return None
+                f.write(f"{nonce}\n".encode())
+                self._offset = f.tell()
+            self._consumed[nonce] = issued
+            return model_preds
+
+    def _catch_up(self, f):
+        # Called with the file lock held: read the nonces the other processes consumed
+        f.seek(0)
+        header = f.readline()
+        if header != self._header:
+            # Rewritten by another process since the last read
+            self._header, self._offset = header, len(header)
+        f.seek(self._offset)
+        for line in f.read().splitlines():
+            nonce = line.decode()
+            self._consumed[nonce] = int(nonce[:8], 16)
+        self._offset = f.tell()
+
+    def _compact(self, f):
+        # Called with the file lock held and _consumed caught up: keep the unexpired nonces only
+        self._header = f"# {int(self._header[2:]) + 1}\n".encode()
+        f.truncate(0)
+        f.write(self._header + b"".join(f"{nonce}\n".encode() for nonce in self._consumed))
+        f.flush()
+        self._offset = f.tell()
+
+    def _prune(self):
+        # Called with the lock held: expired IDs are refused anyway, so forget their nonces.
+        # Returns True if any were dropped.
+        now = time.time()
+        if now - self._pruned_at < 60:
+            return False
+        self._pruned_at = now
+        unexpired = {nonce: issued for nonce, issued in self._consumed.items() if now - issued <= self.max_age}
+        pruned = len(unexpired) < len(self._consumed)
+        self._consumed = unexpired
+        return pruned
+
+
+class FeedbackService:
+    """Applies ground-truth labels to the consensus weights in a background worker.
+
+    Labels are queued by request threads and grouped into micro-batches of `batch_size`,
+    like the notebook's replay of X_test. Each full batch runs the Q3 weight update and the
+    Q4 slashing update once, records the slashes in the BalanceLedger and publishes the new
+    weights through the WeightsStore.
+    """
+
+    def __init__(self, weights_store, ledger, model_names, batch_size=10):
+        self.weights_store = weights_store
+        self.ledger = ledger
+        self.model_names = list(model_names)
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self.received = 0
+        self.processed = 0
+        self.applied_batches = 0
+        self.slashes = 0
+
+    def submit(self, model_preds, label):
+        """Queue one labelled prediction; never blocks the calling request thread."""
+        self._queue.put((model_preds, int(label)))
+        with self._lock:
+            self.received += 1
+
+    def _apply(self, batch):
+        predictions = np.array([model_preds for model_preds, _ in batch])
+        labels = np.array([label for _, label in batch])
+        slashed = []
+
+        def compute(snapshot):
+            balances = self.ledger.balances()
+            weights = update_weights(labels, predictions, snapshot.weights)
+            pos_weights, new_balances, newly_slashed = update_weights_with_slashing(
+                labels, predictions, stake_weights(balances, self.model_names),
+                balances, self.model_names
+            )
+            # One group-committed ledger write for all slashes of the batch
+            self.ledger.append(
+                [("slash", name, balances[name] - new_balances[name]) for name in newly_slashed],
+                sync=True
+            )
+            slashed.extend(newly_slashed)
+            return weights, pos_weights
+
+        self.weights_store.update(compute)
+        with self._lock:
+            self.applied_batches += 1
+            self.slashes += len(slashed)
+
+    def _run(self):
+        batch = []
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch.append(item)
+            if len(batch) < self.batch_size:
+                continue
+            try:
+                self._apply(batch)
+            except Exception as e:
+                print(f"Feedback batch error: {e}")
+            with self._lock:
+                self.processed += len(batch)
+            batch = []
+
+    def start(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="feedback-worker", daemon=True)
+            self._worker.start()
+
+    def stop(self, timeout=None):
+        """Ask the worker to exit; with a timeout, wait for the batch in progress to finish."""
+        self._queue.put(None)
+        if timeout is not None and self._worker is not None:
+            self._worker.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "received": self.received,
+                "pending": self.received - self.processed,
+                "applied_batches": self.applied_batches,
+                "slashes": self.slashes,
+                "batch_size": self.batch_size
+            }
@@ -0,0 +1,141 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+from artifacts import FusedLinearScorer, platt
+from featurizer import FastFeaturizer
+
+
+class InferenceEngine:
+    """Owns the preprocessor and the model registry.
+
+    Inputs are preprocessed once and the transformed matrix is handed to every model.
+    The linear models (logistic regression, linear SVM) are scored together by one
+    FusedLinearScorer product in the calling thread while the other models run on a shared
+    thread pool (the heavy parts of their predictors release the GIL).
+
+    With a Metrics instance, transforms and every model's predictions are timed as the
+    "transform" and "predict" stages of the request being served. `calibrations` maps model
+    names to Platt (A, B) parameters, giving probabilities to models that have no
+    predict_proba of their own (the pickled SVC).
+    """
+
+    def __init__(self, models, preprocessor, feature_columns, max_workers=None, metrics=None, calibrations=None):
+        self.models = dict(models)
+        self.calibrations = dict(calibrations or {})
+        self.model_names = list(self.models.keys())
+        self.preprocessor = preprocessor
+        self.feature_columns = list(feature_columns)
+        self.metrics = metrics
+
+        # Pandas-free single-row preprocessing, only kept if it matches the ColumnTransformer exactly
+        self.featurizer = FastFeaturizer(preprocessor, self.feature_columns)
+        self.featurizer.verify(preprocessor, self.featurizer.verification_samples())
+
+        self.linear = FusedLinearScorer.from_models(self.models, self.calibrations)
+        self.linear_names = self.linear.model_names if self.linear is not None else []
+        self.linear_label = "+".join(self.linear_names)
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or len(self.models), thread_name_prefix="inference"
+        )
+
+    def _stage(self, stage, model="", context=None):
+        return self.metrics.stage(stage, model, context) if self.metrics is not None else nullcontext()
+
+    def _timed(self, function, model_name, features_scaled, context):
+        # Runs on a pool thread: the request context is passed in from the submitting thread
+        with self._stage("predict", model_name, context):
+            return function(features_scaled)
+
+    def _submit(self, function, model_name, features_scaled):
+        context = self.metrics.context() if self.metrics is not None else None
+        return self.executor.submit(self._timed, function, model_name, features_scaled, context)
+
+    def transform(self, features):
+        """Preprocess one passenger, using the fast path unless it cannot encode the row."""
+        with self._stage("transform"):
+            features_scaled = self.featurizer.transform(features)
+            if features_scaled is None:
+                features_df = pd.DataFrame([features], columns=self.feature_columns)
+                features_scaled = self.preprocessor.transform(features_df)
+        return features_scaled
+
+    def transform_batch(self, features_df):
+        """Preprocess a DataFrame of passengers with the ColumnTransformer in one call."""
+        with self._stage("transform"):
+            return self.preprocessor.transform(features_df[self.feature_columns])
+
+    def predict(self, model_name, features_scaled):
+        """Predictions of a single model over already preprocessed rows."""
+        with self._stage("predict", model_name):
+            return self.models[model_name].predict(features_scaled).astype(int)
+
+    def predict_matrix(self, features_scaled):
+        """Fan the preprocessed rows out to every model in parallel.
+
+        Returns the (n_rows, n_models) prediction matrix, columns in `model_names` order.
+        """
+        futures = {
+            name: self._submit(model.predict, name, features_scaled)
+            for name, model in self.models.items() if name not in self.linear_names
+        }
+        columns = {}
+        if self.linear is not None:
+            with self._stage("predict", self.linear_label):
+                linear_preds = self.linear.predict(features_scaled)
+            columns.update((name, linear_preds[:, j]) for j, name in enumerate(self.linear_names))
+        columns.update((name, future.result()) for name, future in futures.items())
+        return np.column_stack([columns[name] for name in self.model_names]).astype(int)
+
+    def predict_proba_matrix(self, features_scaled):
+        """Predictions and survival probabilities of every model, both (n_rows, n_models).
+
+        Probabilities come from the fused linear scorer's calibration, the model's predict_proba,
+        or Platt scaling of its decision_function with the model's entry in `calibrations`.
+        """
+        futures = {
+            name: self._submit(functools.partial(_predict_with_proba, model, self.calibrations.get(name)),
+                               name, features_scaled)
+            for name, model in self.models.items() if name not in self.linear_names
+        }
+        columns = {}
+        if self.linear is not None:
+            with self._stage("predict", self.linear_label):
+                linear_preds, linear_proba = self.linear.score(features_scaled)
+            columns.update(
+                (name, (linear_preds[:, j], linear_proba[:, j])) for j, name in enumerate(self.linear_names)
+            )
+        columns.update((name, future.result()) for name, future in futures.items())
+        return (np.column_stack([columns[name][0] for name in self.model_names]).astype(int),
+                np.column_stack([columns[name][1] for name in self.model_names]))
+
+    def predict_one(self, features):
+        """Transform one passenger once and return the prediction of every model as a row vector."""
+        return self.predict_matrix(self.transform(features))[0]
+
+    def predict_one_proba(self, features):
+        """Predictions and survival probabilities of every model for one passenger, as row vectors."""
+        model_preds, model_proba = self.predict_proba_matrix(self.transform(features))
+        return model_preds[0], model_proba[0]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def _predict_with_proba(model, calibration, features_scaled):
+    """(predictions, probability of class 1) of one sklearn or compact classifier."""
+    classes = np.asarray(model.classes_ if hasattr(model, "classes_") else model.classes)
+    if not hasattr(model, "predict_proba") or (hasattr(model, "probability") and not model.probability):
+        # An SVC without probability=True: Platt scaling of its margin
+        if calibration is None:
+            raise ValueError(f"{type(model).__name__} has no probabilities and no calibration")
+        decisions = model.decision_function(features_scaled)
+        positive = platt(decisions, *calibration)
+        return classes.take((decisions > 0).astype(int)), positive if classes[1] == 1 else 1 - positive
+    proba = model.predict_proba(features_scaled)
+    # argmax of predict_proba is exactly how the sklearn classifiers predict
+    return classes.take(np.argmax(proba, axis=1)), proba[:, np.flatnonzero(classes == 1)[0]]
@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, single-process use only
+    fcntl = None
+
+RECORD_TYPES = ("deposit", "slash", "reward")
+
+
+class BalanceLedger:
+    """Append-only ledger of model stake movements (deposits, slashes, rewards).
+
+    Every movement is one JSON line in `ledger_file`; current balances live in memory and
+    are O(1) to read. Writes are group-committed: records are flushed and fsync'ed once
+    `fsync_every` of them are pending or `fsync_interval` seconds have passed since the last
+    sync (checked on append), or when a writer passes `sync=True` / calls `sync()`. Every
+    `snapshot_every` records the balances are written to `snapshot_file` together with the
+    ledger offset, so startup only replays the tail.
+
+    Several processes (e.g. forked server workers) may share one ledger: appends hold an
+    exclusive lock on the file and first apply the records other processes wrote.
+    """
+
+    def __init__(self, ledger_file, snapshot_file, model_names, initial_balance=1000,
+                 seed_file=None, fsync_every=64, fsync_interval=1.0, snapshot_every=1000):
+        self.ledger_file = ledger_file
+        self.snapshot_file = snapshot_file
+        self.model_names = list(model_names)
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+
+        self._lock = threading.Lock()
+        self._balances = {}
+        self.seq = 0
+        self._snapshot_seq = 0
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._offset = 0  # bytes of ledger_file already applied to the balances
+
+        self._replay()
+        self._file = open(self.ledger_file, "ab")
+
+        # First start: open an account for every model, seeded from the legacy balances file if any
+        missing = [name for name in self.model_names if name not in self._balances]
+        if missing:
+            seed = {}
+            if seed_file and os.path.exists(seed_file):
+                with open(seed_file, "r") as f:
+                    seed = json.load(f)
+            self.append([("deposit", name, seed.get(name, initial_balance)) for name in missing], sync=True)
+
+    def _replay(self):
+        if os.path.exists(self.snapshot_file):
+            with open(self.snapshot_file, "r") as f:
+                snapshot = json.load(f)
+            self._balances = dict(snapshot["balances"])
+            self.seq = self._snapshot_seq = snapshot["seq"]
+            self._offset = snapshot["offset"]
+
+        if not os.path.exists(self.ledger_file):
+            return
+
+        with open(self.ledger_file, "rb+") as f:
+            _lock_file(f)
+            if not self._catch_up(f):
+                # Torn write from a crash: drop the partial record
+                f.truncate(self._offset)
+
+    def _catch_up(self, f):
+        """Apply the complete records after the current offset; False if a partial one follows."""
+        f.seek(self._offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                return False
+            self._apply(json.loads(line))
+            self._offset += len(line)
+        return True
+
+    def _apply(self, record):
+        self._balances[record["model"]] = record["balance"]
+        self.seq = record["seq"]
+
+    def append(self, movements, sync=False):
+        """Record (type, model, amount) movements atomically with respect to other writers.
+
+        Slashes are capped at the current balance. Returns the written records.
+        """
+        records = []
+        with self._lock, open(self.ledger_file, "rb") as reader:
+            _lock_file(self._file)
+            if not self._catch_up(reader):
+                # Torn write from a process that crashed: drop the partial record, or this
+                # one would be appended onto it
+                self._file.truncate(self._offset)
+            for record_type, model_name, amount in movements:
+                if record_type not in RECORD_TYPES:
+                    raise ValueError(f"Unknown ledger record type '{record_type}'")
+                balance = self._balances.get(model_name, 0)
+                if record_type == "slash":
+                    amount = min(amount, balance)
+                    balance -= amount
+                else:
+                    balance += amount
+
+                record = {
+                    "seq": self.seq + 1, "ts": time.time(), "type": record_type,
+                    "model": model_name, "amount": amount, "balance": balance
+                }
+                line = (json.dumps(record) + "\n").encode()
+                self._file.write(line)
+                self._apply(record)
+                self._offset += len(line)
+                records.append(record)
+
+            # Other processes must see the records before they can take the lock
+            self._file.flush()
+            _unlock_file(self._file)
+            self._pending += len(records)
+            if sync or self._pending >= self.fsync_every \
+                    or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+            if self.seq - self._snapshot_seq >= self.snapshot_every:
+                self._snapshot()
+        return records
+
+    def deposit(self, model_name, amount, sync=False):
+        return self.append([("deposit", model_name, amount)], sync)
+
+    def slash(self, model_name, amount, sync=False):
+        return self.append([("slash", model_name, amount)], sync)
+
+    def reward(self, model_name, amount, sync=False):
+        return self.append([("reward", model_name, amount)], sync)
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def _snapshot(self):
+        self._sync()
+        tmp_path = f"{self.snapshot_file}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"seq": self.seq, "offset": self._offset, "balances": self._balances}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_file)
+        self._snapshot_seq = self.seq
+
+    def reopen(self):
+        """Re-open the ledger file; called in a forked process so its file lock is its own."""
+        with self._lock:
+            self._file.close()
+            self._file = open(self.ledger_file, "ab")
+
+    def refresh(self):
+        """Apply the records other processes appended since this one last read the ledger."""
+        with self._lock, open(self.ledger_file, "rb") as reader:
+            _lock_file(reader, shared=True)
+            self._catch_up(reader)
+
+    def sync(self):
+        with self._lock:
+            if self._pending:
+                self._sync()
+
+    def balance(self, model_name):
+        return self._balances[model_name]
+
+    def balances(self):
+        """Copy of the current balance of every model."""
+        with self._lock:
+            return dict(self._balances)
+
+    def records(self, since_seq=0):
+        """Ledger records with seq > since_seq, read back from disk for auditing."""
+        self.sync()
+        with open(self.ledger_file, "r") as f:
+            return [record for record in map(json.loads, f) if record["seq"] > since_seq]
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            self._file.close()
+
+
+def _lock_file(f, shared=False):
+    # Released by _unlock_file or when the file is closed
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
@@ -0,0 +1,180 @@
+import bisect
+import functools
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds, from 50us (a cached answer) to 5s (a slow batch)
+DEFAULT_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0
+)
+
+
+class Histogram:
+    """Fixed-bucket latency histogram: an observation is a bisect and three additions."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot: above the largest bound (+Inf)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class RequestContext:
+    """Route of the request being served, and its trace when the request was sampled."""
+
+    __slots__ = ("route", "started", "spans")
+
+    def __init__(self, route, sampled):
+        self.route = route
+        self.started = time.perf_counter()
+        self.spans = [] if sampled else None
+
+
+class Metrics:
+    """Per-stage latency histograms, labelled by route and model, plus sampled request traces.
+
+    A request is opened with `begin(route)` and closed with `end(status)`; in between,
+    `stage(name)` times a block of code in the calling thread. Work handed to other threads
+    passes the context along explicitly (`context()` / `observe(..., context=...)`).
+
+    A sampled request (`trace_sample_rate`) also keeps every span with its offset from the
+    start of the request and is appended to `trace_file` as one JSON line. The histograms
+    belong to one process: behind serve.py every worker reports its own.
+    """
+
+    def __init__(self, namespace="prediction", trace_file=None, trace_sample_rate=0.0, buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.trace_file = trace_file
+        self.trace_sample_rate = trace_sample_rate
+        self.buckets = tuple(buckets)
+        self._histograms = {}       # (stage, route, model) -> Histogram
+        self._requests = {}         # (route, status) -> count
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._trace_lock = threading.Lock()
+        self._trace_handle = None
+        self._trace_pid = None
+        self.traces_written = 0
+
+    def _histogram(self, key):
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(self.buckets))
+        return histogram
+
+    def begin(self, route):
+        sampled = self.trace_file is not None and random.random() < self.trace_sample_rate
+        self._local.context = RequestContext(route, sampled)
+        return self._local.context
+
+    def context(self):
+        return getattr(self._local, "context", None)
+
+    def observe(self, stage, seconds, model="", context=None, started=None):
+        """Record one stage duration under the route of `context` (default: this thread's request)."""
+        context = context or self.context()
+        route = context.route if context is not None else ""
+        self._histogram((stage, route, model)).observe(seconds)
+        if context is not None and context.spans is not None:
+            offset = (started if started is not None else time.perf_counter() - seconds) - context.started
+            context.spans.append({
+                "stage": stage, "model": model, "start_ms": offset * 1000, "duration_ms": seconds * 1000
+            })
+
+    @contextmanager
+    def stage(self, stage, model="", context=None):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, model, context, started)
+
+    def timed(self, stage):
+        """Decorator form of stage()."""
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def end(self, status):
+        context = self.context()
+        if context is None:
+            return
+        self._local.context = None
+        duration = time.perf_counter() - context.started
+        self.observe("request", duration, context=context, started=context.started)
+        with self._lock:
+            key = (context.route, str(status))
+            self._requests[key] = self._requests.get(key, 0) + 1
+        if context.spans is not None:
+            self._write_trace(context, status, duration)
+
+    def _write_trace(self, context, status, duration):
+        record = {
+            "ts": time.time(), "pid": os.getpid(), "route": context.route, "status": status,
+            "duration_ms": duration * 1000, "spans": context.spans
+        }
+        line = json.dumps(record) + "\n"
+        with self._trace_lock:
+            # Opened lazily and re-opened after a fork, so every worker appends through its own handle
+            if self._trace_handle is None or self._trace_pid != os.getpid():
+                self._trace_handle = open(self.trace_file, "a", buffering=1)
+                self._trace_pid = os.getpid()
+            self._trace_handle.write(line)
+            self.traces_written += 1
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        name = f"{self.namespace}_stage_duration_seconds"
+        lines = [
+            f"# HELP {name} Duration of each serving stage, per route and model.",
+            f"# TYPE {name} histogram"
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            requests = sorted(self._requests.items())
+
+        for (stage, route, model), histogram in histograms:
+            counts, total, count = histogram.snapshot()
+            labels = f'stage="{stage}",route="{_escape(route)}",model="{_escape(model)}"'
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {total!r}")
+            lines.append(f"{name}_count{{{labels}}} {count}")
+
+        name = f"{self.namespace}_requests_total"
+        lines += [f"# HELP {name} Requests served, per route and HTTP status.", f"# TYPE {name} counter"]
+        for (route, status), count in requests:
+            lines.append(f'{name}{{route="{_escape(route)}",status="{status}"}} {count}')
+
+        name = f"{self.namespace}_traces_written_total"
+        lines += [f"# HELP {name} Sampled request traces appended to the trace file.", f"# TYPE {name} counter",
+                  f"{name} {self.traces_written}"]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
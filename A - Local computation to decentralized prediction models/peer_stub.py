@@ -0,0 +1,37 @@
+# Local stand-in for a remote peer of the decentralized consensus (README Q2), for testing
+# the fan-out client without ngrok. Usage: python peer_stub.py --port 5001 --latency 0.05
+import argparse
+import random
+import time
+
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+settings = {"latency": 0.0, "jitter": 0.0, "prediction": None}
+
+
+@app.route('/predict/<model_name>', methods=['GET'])
+def predict(model_name):
+    """Answer in the group's standard format after a configurable delay."""
+    time.sleep(settings["latency"] + random.uniform(0, settings["jitter"]))
+    prediction = settings["prediction"]
+    if prediction is None:
+        prediction = random.choice([0, 1])
+
+    return jsonify({
+        "model": model_name,
+        "input_features": request.args.to_dict(),
+        "prediction": "Survived" if prediction == 1 else "Did not survive"
+    })
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in peer for /predict/remote_consensus")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every answer")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay, up to this many seconds")
+    parser.add_argument("--prediction", type=int, choices=[0, 1], help="fixed answer (random if omitted)")
+    args = parser.parse_args()
+
+    settings.update(latency=args.latency, jitter=args.jitter, prediction=args.prediction)
+    app.run(host="0.0.0.0", port=args.port, threaded=True)
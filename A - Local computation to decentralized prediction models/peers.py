@@ -0,0 +1,228 @@
+import http.client
+import json
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from urllib.parse import urlencode, urlsplit
+
+Peer = namedtuple("Peer", ["name", "url", "stake"])
+
+
+class PeerRegistry:
+    """Remote model endpoints taking part in the decentralized consensus (README Q2).
+
+    `peers_file` holds a JSON list of {"name", "url", "stake"?}; `url` is the peer's full
+    predict route, e.g. "https://<id>.ngrok-free.app/predict/random_forest". Peers without
+    an explicit stake use their balance in the ledger, or `default_stake`.
+    """
+
+    def __init__(self, peers_file, ledger=None, default_stake=1000):
+        self.peers_file = peers_file
+        self.ledger = ledger
+        self.default_stake = default_stake
+        self._entries = []
+        self.reload()
+
+    def reload(self):
+        try:
+            with open(self.peers_file, "r") as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            self._entries = []
+
+    def peers(self):
+        balances = self.ledger.balances() if self.ledger is not None else {}
+        return [
+            Peer(entry["name"], entry["url"],
+                 entry.get("stake", balances.get(entry["name"], self.default_stake)))
+            for entry in self._entries
+        ]
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections, reused per host across requests."""
+
+    def __init__(self, max_idle_per_host=8):
+        self.max_idle_per_host = max_idle_per_host
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def _connect(self, scheme, netloc, timeout):
+        connection_class = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return connection_class(netloc, timeout=timeout)
+
+    def get(self, url, timeout):
+        """GET `url` and return (status, body)."""
+        return self.request("GET", url, timeout)
+
+    def request(self, method, url, timeout, body=None, headers=None):
+        """Send one request and return (status, body), retrying once if a pooled connection went stale."""
+        headers = {"Accept": "application/json", **(headers or {})}
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path + (f"?{parts.query}" if parts.query else "")
+
+        for attempt in range(2):
+            with self._lock:
+                connection = self._idle[key].pop() if self._idle[key] else None
+            reused = connection is not None
+            if connection is None:
+                connection = self._connect(parts.scheme, parts.netloc, timeout)
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response_body = response.read()
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                connection.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+
+            if response.will_close:
+                connection.close()
+            else:
+                with self._lock:
+                    if len(self._idle[key]) < self.max_idle_per_host:
+                        self._idle[key].append(connection)
+                        connection = None
+                if connection is not None:
+                    connection.close()
+            return response.status, response_body
+
+    def close(self):
+        with self._lock:
+            for connections in self._idle.values():
+                for connection in connections:
+                    connection.close()
+            self._idle.clear()
+
+
+def parse_prediction(body):
+    """0/1 prediction from a peer response in the group's standard format."""
+    data = json.loads(body)
+    prediction = data.get("prediction", data.get("final_prediction"))
+    if prediction in ("Survived", 1):
+        return 1
+    if prediction in ("Did not survive", 0):
+        return 0
+    raise ValueError(f"Unexpected prediction {prediction!r}")
+
+
+class FanOutClient:
+    """Queries every registered peer concurrently and returns a stake-weighted quorum result.
+
+    - Each peer gets at most `timeout` seconds, and the whole consensus the same budget.
+    - A peer that has not answered after `hedge_delay` seconds gets a second, hedged request;
+      whichever copy answers first is used.
+    - The result is returned as soon as peers holding `quorum` of the total stake have
+      answered, so one slow peer does not set the latency of the consensus. Peers still
+      pending then are reported as "not_awaited", not "timed_out": their requests that have
+      not started are cancelled, the running ones end by the deadline and are ignored.
+    - Every peer has its own pool of `max_workers_per_peer` threads, shared by the primary
+      requests, the hedges and the stragglers of earlier consensus calls. A slow peer can
+      only fill its own pool, so the requests to the other peers never queue behind it.
+    """
+
+    def __init__(self, registry, timeout=2.0, hedge_delay=0.3, quorum=2 / 3, max_workers_per_peer=16):
+        self.registry = registry
+        self.timeout = timeout
+        self.hedge_delay = hedge_delay
+        self.quorum = quorum
+        self.max_workers_per_peer = max_workers_per_peer
+        self.pool = ConnectionPool()
+        self._executors = {}  # peer name -> ThreadPoolExecutor
+        self._executors_lock = threading.Lock()
+
+    def _submit(self, peer, query, deadline):
+        with self._executors_lock:
+            executor = self._executors.get(peer.name)
+            if executor is None:
+                executor = self._executors[peer.name] = ThreadPoolExecutor(
+                    max_workers=self.max_workers_per_peer, thread_name_prefix=f"fan-out-{peer.name}"
+                )
+        return executor.submit(self._query, peer, query, deadline)
+
+    def _query(self, peer, query, deadline):
+        started = time.monotonic()
+        status, body = self.pool.get(f"{peer.url}?{query}", max(deadline - started, 0.001))
+        if status != 200:
+            raise ValueError(f"HTTP {status}")
+        return parse_prediction(body), time.monotonic() - started
+
+    def consensus(self, features):
+        """Stake-weighted consensus of the peers' predictions for one passenger (dict of features)."""
+        peers = self.registry.peers()
+        if not peers:
+            raise LookupError("No peers registered")
+
+        query = urlencode(features)
+        started = time.monotonic()
+        deadline = started + self.timeout
+        total_stake = sum(peer.stake for peer in peers)
+        if total_stake <= 0:
+            raise LookupError("No staked peers: every registered peer has a stake of 0")
+
+        pending = {self._submit(peer, query, deadline): peer for peer in peers}
+        hedged = set()
+        answers, errors = {}, {}
+        answered_stake = 0.0
+
+        while pending and answered_stake < self.quorum * total_stake:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            hedge_at = started + self.hedge_delay
+            wait_until = hedge_at if now < hedge_at else deadline
+            done, _ = wait(pending, timeout=wait_until - now, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                peer = pending.pop(future, None)
+                if peer is None or peer.name in answers:  # the hedged copy of an answered request
+                    continue
+                try:
+                    answers[peer.name] = future.result()
+                except Exception as e:
+                    errors[peer.name] = str(e)
+                    continue
+                answered_stake += peer.stake
+                errors.pop(peer.name, None)
+                # The other copy of a hedged request is no longer needed
+                for other in [f for f, p in pending.items() if p.name == peer.name]:
+                    other.cancel()
+                    del pending[other]
+
+            if time.monotonic() >= hedge_at:
+                for peer in [p for p in pending.values() if p.name not in hedged]:
+                    hedged.add(peer.name)
+                    pending[self._submit(peer, query, deadline)] = peer
+
+        # Whatever is still pending was either made unnecessary by the quorum or cut off by the deadline
+        quorum_reached = answered_stake >= self.quorum * total_stake
+        unanswered = sorted({peer.name for peer in pending.values()} - set(answers) - set(errors))
+        for future in pending:
+            future.cancel()
+
+        stakes = {peer.name: peer.stake for peer in peers}
+        weighted_sum = sum(stakes[name] * prediction for name, (prediction, _) in answers.items())
+        final_prediction = int(round(weighted_sum / answered_stake)) if answered_stake else None
+
+        return {
+            "final_prediction": final_prediction,
+            "individual_predictions": {name: prediction for name, (prediction, _) in answers.items()},
+            "latencies": {name: latency for name, (_, latency) in answers.items()},
+            "errors": errors,
+            "timed_out": [] if quorum_reached else unanswered,
+            "not_awaited": unanswered if quorum_reached else [],
+            "hedged": sorted(hedged),
+            "answered_stake": answered_stake,
+            "total_stake": total_stake,
+            "quorum_reached": quorum_reached
+        }
@@ -0,0 +1,88 @@
+from collections import namedtuple
+
+import numpy as np
+
+from weighting import INITIAL_BALANCE, LEARNING_RATE, SLASH_PENALTY, SLASHING_THRESHOLD
+
+ReplayResult = namedtuple("ReplayResult", [
+    "configs",              # (n_configs, 3): learning_rate, slash_penalty, slashing_threshold
+    "weights",              # (n_configs, n_models) final Q3 weights
+    "pos_weights",          # (n_configs, n_models) final Q4 PoS weights
+    "balances",             # (n_configs, n_models) final stakes
+    "slashes",              # (n_configs, n_models) number of times each model was slashed
+    "weighted_accuracy",    # (n_configs,) accuracy of the Q3 consensus served during the replay
+    "pos_accuracy",         # (n_configs,) accuracy of the Q4 consensus served during the replay
+])
+
+
+def parameter_grid(learning_rates, slash_penalties, slashing_thresholds):
+    """Every combination of the given settings as a (n_configs, 3) array."""
+    grid = np.meshgrid(
+        np.atleast_1d(learning_rates).astype(float),
+        np.atleast_1d(slash_penalties).astype(float),
+        np.atleast_1d(slashing_thresholds).astype(float),
+        indexing="ij"
+    )
+    return np.column_stack([axis.ravel() for axis in grid])
+
+
+def replay(predictions, labels, batch_size=10, learning_rates=LEARNING_RATE,
+           slash_penalties=SLASH_PENALTY, slashing_thresholds=SLASHING_THRESHOLD,
+           initial_weights=None, initial_balances=INITIAL_BALANCE):
+    """Replay a (n_samples, n_models) prediction matrix against labels in fixed-size batches.
+
+    Runs the notebook's Q3 (update_weights) and Q4 (update_weights_with_slashing) loops for
+    every combination of learning rate, slash penalty and slashing threshold at once: the
+    state of all configurations is kept in (n_configs, n_models) arrays and balances stay in
+    memory, so a sweep costs one pass over the batches. Trailing samples that do not fill
+    a batch are ignored, as in the notebook.
+    """
+    predictions = np.asarray(predictions)
+    labels = np.asarray(labels).ravel()
+    num_batches = len(labels) // batch_size
+    num_models = predictions.shape[1]
+
+    configs = parameter_grid(learning_rates, slash_penalties, slashing_thresholds)
+    learning_rate, slash_penalty, slashing_threshold = (configs[:, [k]] for k in range(3))
+    num_configs = len(configs)
+
+    # Per-batch, per-model accuracy computed once for every configuration
+    batch_preds = predictions[:num_batches * batch_size].reshape(num_batches, batch_size, num_models)
+    batch_labels = labels[:num_batches * batch_size].reshape(num_batches, batch_size)
+    batch_accuracy = (batch_preds == batch_labels[:, :, None]).mean(axis=1)
+
+    if initial_weights is None:
+        # Notebook default: overall model accuracies, normalised
+        initial_weights = (predictions == labels[:, None]).mean(axis=0)
+    weights = np.tile(np.asarray(initial_weights, dtype=float) / np.sum(initial_weights), (num_configs, 1))
+    balances = np.broadcast_to(np.asarray(initial_balances, dtype=float), (num_configs, num_models)).copy()
+    pos_weights = balances / balances.sum(axis=1, keepdims=True)
+    slashes = np.zeros((num_configs, num_models), dtype=int)
+    weighted_correct = np.zeros(num_configs)
+    pos_correct = np.zeros(num_configs)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for b in range(num_batches):
+            preds, y_true, accuracy = batch_preds[b], batch_labels[b], batch_accuracy[b]
+
+            # Consensus served with the weights in force before this batch's update
+            weighted_correct += (np.round(preds @ weights.T) == y_true[:, None]).sum(axis=0)
+            pos_weights = balances / balances.sum(axis=1, keepdims=True)
+            pos_correct += (np.round(preds @ pos_weights.T) == y_true[:, None]).sum(axis=0)
+
+            # Q3: update_weights
+            weights = weights * (1 + learning_rate * (accuracy - weights))
+            weights /= weights.sum(axis=1, keepdims=True)
+
+            # Q4: update_weights_with_slashing
+            slashed = accuracy < slashing_threshold
+            balances = np.where(slashed, np.maximum(0, balances - slash_penalty), balances)
+            slashes += slashed
+            pos_weights = balances * (1 + learning_rate * (accuracy - pos_weights))
+            pos_weights /= pos_weights.sum(axis=1, keepdims=True)
+
+    num_replayed = max(num_batches * batch_size, 1)
+    return ReplayResult(
+        configs, weights, pos_weights, balances, slashes,
+        weighted_correct / num_replayed, pos_correct / num_replayed
+    )
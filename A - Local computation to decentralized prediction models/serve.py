@@ -0,0 +1,87 @@
+# Production server for the prediction API (app.py) on gunicorn.
+#
+#   python serve.py --workers 4 --threads 8 --port 5000
+#
+# The models are loaded once in the master process (preload) and the workers are forked from
+# it, so the pickled models' memory is shared copy-on-write instead of loaded per worker. Every
+# worker serves requests on its own thread pool; /predict/* therefore scales across the cores.
+# Settings can also come from the environment: PREDICTION_SERVER_WORKERS, _THREADS, _BIND, ...
+# python app.py still runs the single-process Flask development server.
+import argparse
+import os
+
+
+def env(name, default, cast=str):
+    value = os.environ.get(f"PREDICTION_SERVER_{name}")
+    return cast(value) if value is not None else default
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the prediction API with preloaded, fork-shared models")
+    parser.add_argument("--bind", default=env("BIND", None), help="host:port, overrides --host/--port")
+    parser.add_argument("--host", default=env("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=env("PORT", 5000, int))
+    parser.add_argument("--workers", type=int, default=env("WORKERS", os.cpu_count() or 1, int),
+                        help="worker processes (default: one per core)")
+    parser.add_argument("--threads", type=int, default=env("THREADS", 4, int), help="request threads per worker")
+    parser.add_argument("--timeout", type=int, default=env("TIMEOUT", 30, int),
+                        help="seconds before a silent worker is killed and replaced")
+    parser.add_argument("--graceful-timeout", type=int, default=env("GRACEFUL_TIMEOUT", 30, int),
+                        help="seconds a worker gets to finish in-flight requests on shutdown or reload")
+    parser.add_argument("--keepalive", type=int, default=env("KEEPALIVE", 5, int),
+                        help="seconds an idle keep-alive connection is held open")
+    parser.add_argument("--max-requests", type=int, default=env("MAX_REQUESTS", 0, int),
+                        help="recycle a worker after this many requests (0 = never)")
+    parser.add_argument("--log-level", default=env("LOG_LEVEL", "info"))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit("serve.py needs gunicorn: pip install gunicorn")
+
+    # Parallelism comes from the workers; keep every worker's BLAS/OpenMP pools to one thread
+    for variable in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(variable, "1")
+    # Background threads are started per worker after the fork, not in the master
+    os.environ["PREDICTION_SERVER_PRELOAD"] = "1"
+    import app as server
+
+    def post_fork(arbiter, worker):
+        server.start_background_services()
+
+    def worker_exit(arbiter, worker):
+        server.stop_background_services()
+
+    class PredictionServer(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": args.bind or f"{args.host}:{args.port}",
+                "workers": args.workers,
+                "worker_class": "gthread",
+                "threads": args.threads,
+                "preload_app": True,
+                "timeout": args.timeout,
+                "graceful_timeout": args.graceful_timeout,
+                "keepalive": args.keepalive,
+                "max_requests": args.max_requests,
+                "max_requests_jitter": args.max_requests // 10,
+                "loglevel": args.log_level,
+                "post_fork": post_fork,
+                "worker_exit": worker_exit
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return server.app
+
+    PredictionServer().run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from featurizer import FastFeaturizer
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+FEATURE_COLUMNS = ['pclass', 'sex', 'age', 'sibsp', 'parch', 'fare', 'embarked']
+
+
+@pytest.fixture(scope="module")
+def preprocessor():
+    return joblib.load(os.path.join(DATA_DIR, "preprocessor.pkl"))
+
+
+def test_fast_path_matches_the_column_transformer(preprocessor):
+    featurizer = FastFeaturizer(preprocessor, FEATURE_COLUMNS)
+    samples = featurizer.verification_samples()
+    assert featurizer.verify(preprocessor, samples)
+
+    expected = preprocessor.transform(pd.DataFrame(samples, columns=FEATURE_COLUMNS))
+    expected = np.asarray(expected.toarray() if hasattr(expected, "toarray") else expected)
+    for sample, expected_row in zip(samples, expected):
+        assert np.array_equal(featurizer.transform(sample)[0], expected_row)
+
+
+def test_unseen_category_falls_back(preprocessor):
+    featurizer = FastFeaturizer(preprocessor, FEATURE_COLUMNS)
+    sample = list(featurizer.verification_samples()[0])
+    sample[FEATURE_COLUMNS.index("embarked")] = "X"
+    assert featurizer.transform(sample) is None
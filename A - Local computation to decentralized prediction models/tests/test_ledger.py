@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from ledger import BalanceLedger
+
+MODELS = ["logistic_regression", "svm"]
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / "ledger.jsonl"), str(tmp_path / "ledger_snapshot.json")
+
+
+def open_ledger(paths, **kwargs):
+    return BalanceLedger(paths[0], paths[1], MODELS, initial_balance=1000, **kwargs)
+
+
+def read_lines(path):
+    with open(path, "rb") as f:
+        return f.read().split(b"\n")
+
+
+def test_append_after_torn_tail_drops_the_partial_record(paths):
+    ledger = open_ledger(paths)
+    # Another process crashed halfway through writing a record
+    with open(paths[0], "ab") as f:
+        f.write(b'{"seq": 3, "ts": 0, "type": "slash", "mod')
+
+    ledger.slash("svm", 100, sync=True)
+    ledger.close()
+
+    lines = read_lines(paths[0])
+    assert lines[-1] == b""
+    records = [json.loads(line) for line in lines[:-1]]
+    assert [record["seq"] for record in records] == [1, 2, 3]
+
+    replayed = open_ledger(paths)
+    assert replayed.balances() == {"logistic_regression": 1000, "svm": 900}
+    replayed.close()
+
+
+def test_torn_tail_is_truncated_at_startup(paths):
+    open_ledger(paths).close()
+    with open(paths[0], "ab") as f:
+        f.write(b'{"seq": 3, "ty')
+
+    ledger = open_ledger(paths)
+    assert ledger.seq == 2
+    ledger.reward("logistic_regression", 50, sync=True)
+    ledger.close()
+
+    assert [record["seq"] for record in open_ledger(paths).records()] == [1, 2, 3]
+
+
+def test_snapshot_then_tail_replay(paths):
+    ledger = open_ledger(paths, snapshot_every=3)
+    ledger.slash("svm", 200)
+    ledger.reward("svm", 10)  # seq 4: past the snapshot taken at seq 3
+    ledger.slash("svm", 5000, sync=True)  # Capped at the balance
+    ledger.close()
+
+    with open(paths[1], "r") as f:
+        assert json.load(f)["seq"] == 3
+
+    replayed = open_ledger(paths)
+    assert replayed.seq == 5
+    assert replayed.balances() == {"logistic_regression": 1000, "svm": 0}
+    replayed.close()
@@ -0,0 +1,43 @@
+import numpy as np
+
+from replay import parameter_grid, replay
+
+
+def notebook_loop(predictions, labels, batch_size, learning_rate, slash_penalty, slashing_threshold):
+    """The notebook's Q3/Q4 updates for a single configuration, one batch at a time."""
+    weights = (predictions == labels[:, None]).mean(axis=0)
+    weights = weights / weights.sum()
+    balances = np.full(predictions.shape[1], 1000.0)
+    for b in range(len(labels) // batch_size):
+        preds = predictions[b * batch_size:(b + 1) * batch_size]
+        accuracy = (preds == labels[b * batch_size:(b + 1) * batch_size, None]).mean(axis=0)
+        weights = weights * (1 + learning_rate * (accuracy - weights))
+        weights /= weights.sum()
+        # Each batch starts from the stake-proportional weights, as in the notebook
+        pos_weights = balances / balances.sum()
+        slashed = accuracy < slashing_threshold
+        balances = np.where(slashed, np.maximum(0, balances - slash_penalty), balances)
+        pos_weights = balances * (1 + learning_rate * (accuracy - pos_weights))
+        pos_weights /= pos_weights.sum()
+    return weights, pos_weights, balances
+
+
+def test_parameter_grid_covers_every_combination():
+    grid = parameter_grid([0.1, 0.2], 50, [0.6, 0.7, 0.8])
+    assert grid.shape == (6, 3)
+    assert {tuple(row) for row in grid} == {(lr, 50.0, t) for lr in (0.1, 0.2) for t in (0.6, 0.7, 0.8)}
+
+
+def test_sweep_matches_one_configuration_at_a_time():
+    rng = np.random.default_rng(0)
+    labels = rng.integers(0, 2, 205)
+    predictions = np.where(rng.random((205, 3)) < [0.9, 0.7, 0.5], labels[:, None], 1 - labels[:, None])
+
+    result = replay(predictions, labels, batch_size=10, learning_rates=[0.05, 0.2],
+                    slash_penalties=[10, 100], slashing_thresholds=[0.6, 0.8])
+    for config, weights, pos_weights, balances in zip(
+            result.configs, result.weights, result.pos_weights, result.balances):
+        expected = notebook_loop(predictions, labels, 10, *config)
+        np.testing.assert_allclose(weights, expected[0])
+        np.testing.assert_allclose(pos_weights, expected[1])
+        np.testing.assert_allclose(balances, expected[2])
@@ -0,0 +1,52 @@
+import numpy as np
+
+INITIAL_BALANCE = 1000  # Initial deposit for each model
+SLASH_PENALTY = 50  # Penalty for poor performance (slashing)
+SLASHING_THRESHOLD = 0.3  # Accuracy threshold for slashing
+LEARNING_RATE = 0.1
+
+
+def batch_accuracy(y_true, predictions):
+    """Per-model accuracy of a (batch_size, num_models) prediction matrix."""
+    predictions = np.array(predictions)
+    y_true = np.array(y_true).flatten()
+    return (predictions.T == y_true).T.mean(axis=0)
+
+
+def update_weights(y_true, predictions, weights, learning_rate=LEARNING_RATE):
+    """Q3: move each weight towards the model's accuracy on the batch, then normalise."""
+    accuracy_adjustments = batch_accuracy(y_true, predictions)
+    weights = np.array(weights, dtype=float)
+
+    weights = weights * (1 + learning_rate * (accuracy_adjustments - weights))
+    return weights / weights.sum()
+
+
+def update_weights_with_slashing(y_true, predictions, weights, balances, model_names,
+                                 learning_rate=LEARNING_RATE, slash_penalty=SLASH_PENALTY,
+                                 slashing_threshold=SLASHING_THRESHOLD):
+    """Q4: slash models below the accuracy threshold and re-weight by stake and accuracy.
+
+    Same rule as the notebook's update_weights_with_slashing, without the file I/O:
+    returns (new_weights, new_balances, slashed_model_names).
+    """
+    accuracy_adjustments = batch_accuracy(y_true, predictions)
+    weights = np.array(weights, dtype=float)
+    balances = dict(balances)
+    slashed = []
+
+    for i, model_name in enumerate(model_names):
+        if accuracy_adjustments[i] < slashing_threshold:
+            balances[model_name] = max(0, balances[model_name] - slash_penalty)  # Apply slashing
+            slashed.append(model_name)
+
+        # Use stake as a weight factor
+        weights[i] = balances[model_name] * (1 + learning_rate * (accuracy_adjustments[i] - weights[i]))
+
+    return weights / weights.sum(), balances, slashed
+
+
+def stake_weights(balances, model_names):
+    """Normalised PoS weights from the current stake of each model."""
+    stakes = np.array([balances[model_name] for model_name in model_names], dtype=float)
+    return stakes / stakes.sum()
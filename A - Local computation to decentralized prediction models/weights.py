@@ -0,0 +1,143 @@
+import json
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from ledger import _lock_file
+
+# Immutable view of the consensus parameters; replaced as a whole, never mutated
+WeightsSnapshot = namedtuple("WeightsSnapshot", ["version", "weights", "pos_weights", "balances", "mtimes"])
+
+
+def frozen_array(values):
+    array = np.array(values, dtype=float)
+    array.flags.writeable = False
+    return array
+
+
+class WeightsStore:
+    """Holds the current WeightsSnapshot and swaps in a new one when the JSON files or the ledger change.
+
+    Stake balances are taken from the BalanceLedger each time a snapshot is built; the ledger
+    file is polled with the JSON files, so slashes recorded by the notebook are picked up too.
+    Server worker processes share the files and the ledger, so an update made by one worker
+    reaches the others through the same modification-time polling. Updates hold an exclusive lock on
+    `<weights_file>.lock` from the re-read to the write, so concurrent updates by several
+    workers apply one after the other instead of overwriting each other.
+
+    Readers take `store.current` once per request and use that snapshot throughout, so they
+    never see a half-updated vector and never wait on a reload: publishing a snapshot is a
+    single attribute assignment. Reloads are serialised among themselves by `_reload_lock`.
+    """
+
+    def __init__(self, weights_file, pos_weights_file, ledger, model_names, poll_interval=2.0):
+        self.weights_file = weights_file
+        self.pos_weights_file = pos_weights_file
+        self.lock_file = f"{weights_file}.lock"
+        self.ledger = ledger
+        self.model_names = list(model_names)
+        self.poll_interval = poll_interval
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._stop = threading.Event()
+        self.current = None
+        self.reload(force=True)
+
+    def _mtimes(self):
+        mtimes = []
+        for path in (self.weights_file, self.pos_weights_file, self.ledger.ledger_file):
+            try:
+                mtimes.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def _read_json(self, path, default):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+
+    def _read_weights(self, path):
+        uniform = {name: 1 / len(self.model_names) for name in self.model_names}
+        values = self._read_json(path, uniform)
+        return frozen_array([values[name] for name in self.model_names])
+
+    def reload(self, force=False):
+        """Re-read the files if they changed since the last snapshot; return True if one was published.
+
+        A file caught half-written by another process fails to parse; the current snapshot is
+        then kept and the next poll retries.
+        """
+        with self._reload_lock:
+            return self._reload(force)
+
+    def _reload(self, force):
+        # Called with _reload_lock held
+        mtimes = self._mtimes()
+        if not force and self.current is not None and mtimes == self.current.mtimes:
+            return False
+
+        try:
+            weights = self._read_weights(self.weights_file)
+            pos_weights = self._read_weights(self.pos_weights_file)
+        except (ValueError, KeyError) as e:
+            if self.current is None:
+                raise
+            print(f"Weights reload skipped: {e}")
+            return False
+
+        self.ledger.refresh()
+        version = self.current.version + 1 if self.current is not None else 1
+        self.current = WeightsSnapshot(version, weights, pos_weights, self.ledger.balances(), mtimes)
+        return True
+
+    def _write_json(self, path, values):
+        # Write-then-rename so other readers never see a partially written file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(values, f)
+        os.replace(tmp_path, path)
+
+    def update(self, compute):
+        """Publish a snapshot derived from the current one and persist it to the JSON files.
+
+        `compute(snapshot)` returns (weights, pos_weights) and records any stake movements in
+        the ledger itself. It runs under the reload lock and the update file lock, so neither a
+        reload in this process nor an update in another one can interleave with it.
+        """
+        with self._reload_lock, open(self.lock_file, "a") as lock:
+            _lock_file(lock)  # released when the lock file is closed
+            # Start from what another worker process may have written since the last poll
+            self._reload(force=False)
+            self.ledger.refresh()
+            weights, pos_weights = compute(self.current)
+            weights, pos_weights = frozen_array(weights), frozen_array(pos_weights)
+
+            self._write_json(self.weights_file, dict(zip(self.model_names, weights.tolist())))
+            self._write_json(self.pos_weights_file, dict(zip(self.model_names, pos_weights.tolist())))
+
+            self.current = WeightsSnapshot(
+                self.current.version + 1, weights, pos_weights, self.ledger.balances(), self._mtimes()
+            )
+            return self.current
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"Weights reload error: {e}")
+
+    def start_watching(self):
+        """Poll the files' modification times in a daemon thread."""
+        if self._watcher is None or not self._watcher.is_alive():
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name="weights-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop_watching(self):
+        self._stop.set()
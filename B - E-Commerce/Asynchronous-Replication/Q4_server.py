@@ -1,9 +1,11 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
 import sqlite3
 from flask_cors import CORS
-import threading
-import time
 from pathlib import Path
+from change_log import ChangeLogReplicator
+from read_router import ReadRouter
+from catalog_cache import CatalogCache
+from pagination import page_params, link_next, ndjson
 
 
 app = Flask(__name__)
@@ -21,7 +23,7 @@ def apply_cors(response):
 script_dir = Path(__file__).parent.absolute()
 PRIMARY_DB = script_dir / "ecommerce_primary.db"
 MIRROR_DB = script_dir / "ecommerce_mirror.db"
-SYNC_INTERVAL = 5  # seconds
+SYNC_INTERVAL = 1  # seconds between replication rounds
 
 
 def db_connection(db_name):
@@ -29,60 +31,156 @@ def db_connection(db_name):
     conn.row_factory = sqlite3.Row
     return conn
 
-primary_conn = db_connection(PRIMARY_DB)
-replica_conn = db_connection(MIRROR_DB)
+def stream_rows(db_name, query, params, limit=None):
+    """NDJSON response that reads the rows from the database while the client downloads them."""
+    if limit is not None:
+        query, params = f"{query} LIMIT ?", (*params, limit)
+
+    def generate():
+        # The connection stays open until the last row is sent (or the client goes away)
+        conn = db_connection(db_name)
+        try:
+            yield from ndjson(conn.execute(query, params))
+        finally:
+            conn.close()
+
+    return app.response_class(generate(), mimetype="application/x-ndjson")
 
 # ----------------------------------------- ASYNC REPLICATION -----------------------------------------
-# def replicate():
-#     while True:
-#         try:
-#             # Open connections to primary and replica databases
-#             with sqlite3.connect(PRIMARY_DB) as primary_conn, sqlite3.connect(MIRROR_DB) as replica_conn:
-#                 primary_conn.backup(replica_conn)
-#                 print("Replication successful!")
-#         except Exception as e:
-#             print(f"Replication error: {e}")
+# Triggers on the primary log every changed row; the replicator ships only those rows to the mirror
+REPLICATED_TABLES = ["products", "cart", "orders", "order_items"]
+replicator = ChangeLogReplicator(PRIMARY_DB, MIRROR_DB, REPLICATED_TABLES, interval=SYNC_INTERVAL)
+replicator.start()
+
+# GET /replication - Replication position and lag of the mirror
+@app.route('/replication', methods=['GET'])
+def replication_status():
+    return jsonify({**replicator.status(), "reads": router.stats()})
+
+# GET /metrics - Replication lag in the Prometheus text format
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    status = replicator.status()
+    lines = [
+        "# HELP ecommerce_replication_lag_seconds Age of the oldest change not yet applied to the mirror.",
+        "# TYPE ecommerce_replication_lag_seconds gauge",
+        f"ecommerce_replication_lag_seconds {status['lag_seconds']!r}",
+        "# HELP ecommerce_replication_pending_changes Change log entries not yet applied to the mirror.",
+        "# TYPE ecommerce_replication_pending_changes gauge",
+        f"ecommerce_replication_pending_changes {status['pending_changes']}",
+        "# HELP ecommerce_replication_rows_shipped_total Rows upserted or deleted on the mirror.",
+        "# TYPE ecommerce_replication_rows_shipped_total counter",
+        f"ecommerce_replication_rows_shipped_total {status['rows_shipped']}",
+        "# HELP ecommerce_replication_up Whether the last replication round succeeded.",
+        "# TYPE ecommerce_replication_up gauge",
+        f"ecommerce_replication_up {0 if status['last_error'] else 1}"
+    ]
+    return "\n".join(lines) + "\n", 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+# ----------------------------------------- READ ROUTING -----------------------------------------
+# GETs are spread over the primary and the mirror. A client bounds the staleness it accepts with
+# ?maxStaleness=<seconds> (or X-Max-Staleness), and reads its own writes by sending back the
+# X-Replication-Position of its last write (or ?position=); the server also remembers it per user.
+MAX_STALENESS = 5.0  # seconds, default staleness accepted from the mirror
+router = ReadRouter({"primary": PRIMARY_DB, "mirror": MIRROR_DB}, replicator.positions, max_staleness=MAX_STALENESS)
+
+def request_value(header, arg, cast):
+    value = request.args.get(arg, request.headers.get(header))
+    try:
+        return cast(value) if value is not None else None
+    except ValueError:
+        return None
+
+def read_db(user_id=None):
+    """Database to serve this GET from: the primary, or the mirror if it is fresh enough."""
+    position = request_value("X-Replication-Position", "position", int) or 0
+    if user_id is not None:
+        position = max(position, router.user_position(str(user_id)))
+    name, db_path = router.choose(position, request_value("X-Max-Staleness", "maxStaleness", float))
+    g.served_by = name
+    return db_path
 
-#         time.sleep(SYNC_INTERVAL)  # Wait before next sync
+@app.after_request
+def attach_replication_position(response):
+    if request.method in ("POST", "PUT", "DELETE") and response.status_code < 300:
+        position = router.position()
+        user_id = (request.view_args or {}).get("user_id")
+        data = request.get_json(silent=True)
+        if user_id is None and isinstance(data, dict):
+            user_id = data.get("user_id")  # POST /orders
+        if user_id is not None:
+            router.remember(str(user_id), position)
+        response.headers["X-Replication-Position"] = str(position)
+    if "served_by" in g:
+        response.headers["X-Served-By"] = g.served_by
+    response.headers["Access-Control-Expose-Headers"] = "X-Replication-Position, X-Served-By, ETag, Link, X-Next-After"
+    return response
 
-# threading.Thread(target=replicate, daemon=True).start()
+# ----------------------------------------- CATALOG CACHE -----------------------------------------
+# The catalog is read far more often than it changes: GET /products and /products/:id are served
+# from memory, as pre-serialised JSON with an ETag. The product routes below refresh it on writes.
+CATALOG_MAX_AGE = 30  # seconds before a full reload picks up writes made by other processes
+
+def load_products(product_id=None):
+    """All products from the primary, or one product (None if it does not exist)."""
+    conn = db_connection(PRIMARY_DB)
+    try:
+        if product_id is None:
+            return [dict(row) for row in conn.execute("SELECT * FROM products")]
+        row = conn.execute("SELECT * FROM products WHERE id = ?", (product_id,)).fetchone()
+        return dict(row) if row else None
+    finally:
+        conn.close()
+
+catalog = CatalogCache(load_products, max_age=CATALOG_MAX_AGE)
+
+def cached_json(body, etag):
+    """Pre-serialised JSON response; 304 Not Modified if the client already has this version."""
+    g.served_by = "cache"
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+# GET /catalog/stats - Size and hit rate of the catalog cache
+@app.route('/catalog/stats', methods=['GET'])
+def catalog_stats():
+    return jsonify(catalog.stats())
 
 # ----------------------------------------- PRODUCTS ROUTES -----------------------------------------
 
-# GET /products - List all products (with optional filtering)
+# GET /products - List all products (with optional filtering), a keyset page (?limit=&after=)
+# or an NDJSON export (?stream=true)
 @app.route('/products', methods=['GET'])
 def get_products():
-    category = request.args.get('category')
+    category = request.args.get('category') or None
     in_stock = request.args.get('inStock')
-
-    cursor = primary_conn.cursor()
-
-    query = "SELECT * FROM products"
-    params = []
-
-    if category:
-        query += " WHERE category = ?"
-        params.append(category)
-    
-    if in_stock and in_stock.lower() == 'true':
-        query += " AND stock > 0" if category else " WHERE stock > 0"
-
-    cursor.execute(query, params)
-    products = cursor.fetchall()
-    primary_conn.close()
-
-    return jsonify([dict(row) for row in products])
+    in_stock = bool(in_stock and in_stock.lower() == 'true')
+    try:
+        limit, after, stream = page_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        query, params = "SELECT * FROM products WHERE id > ?", [after]
+        if category:
+            query += " AND category = ?"
+            params.append(category)
+        if in_stock:
+            query += " AND stock > 0"
+        return stream_rows(read_db(), query + " ORDER BY id", params, limit)
+    if limit is None:
+        return cached_json(*catalog.products(category, in_stock))
+    body, etag, last_id = catalog.page(category, in_stock, after, limit)
+    response = cached_json(body, etag)
+    return link_next(response, request.base_url, request.args.to_dict(), last_id) if last_id is not None else response
 
 # GET /products/:id - Retrieve a single product by ID
 @app.route('/products/<int:product_id>', methods=['GET'])
 def get_product_by_id(product_id):
-    cursor = replica_conn.cursor()
-    cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-    product = cursor.fetchone()
-    replica_conn.close()
+    product = catalog.product(product_id)
 
     if product:
-        return jsonify(dict(product))
+        return cached_json(*product)
     return jsonify({"error": "Product not found"}), 404
 
 # POST /products - Add a new product
@@ -94,7 +192,7 @@ def add_product():
     if not all(field in data for field in required_fields):
         return jsonify({"error": "Missing required fields"}), 400
 
-    conn = db_connection()
+    conn = db_connection(PRIMARY_DB)
     cursor = conn.cursor()
     cursor.execute("""
         INSERT INTO products (name, description, price, category, stock) 
@@ -102,6 +200,7 @@ def add_product():
     """, (data["name"], data["description"], data["price"], data["category"], data["stock"]))
     conn.commit()
     conn.close()
+    catalog.refresh(cursor.lastrowid)
 
     return jsonify({"message": "Product added successfully"}), 201
 
@@ -121,22 +220,24 @@ def update_product(product_id):
     update_query = f"UPDATE products SET {', '.join(update_fields)} WHERE id = ?"
     values = list(data.values()) + [product_id]
 
-    conn = db_connection()
+    conn = db_connection(PRIMARY_DB)
     cursor = conn.cursor()
     cursor.execute(update_query, values)
     conn.commit()
     conn.close()
+    catalog.refresh(product_id)
 
     return jsonify({"message": "Product updated successfully"})
 
 # DELETE /products/:id - Remove a product
 @app.route('/products/<int:product_id>', methods=['DELETE'])
 def delete_product(product_id):
-    conn = db_connection()
+    conn = db_connection(PRIMARY_DB)
     cursor = conn.cursor()
     cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
     conn.commit()
     conn.close()
+    catalog.refresh(product_id)
 
     return jsonify({"message": "Product deleted successfully"})
 
@@ -153,7 +254,7 @@ def add_to_cart(user_id):
     if not product_id or not quantity:
         return jsonify({"error": "Missing product_id or quantity"}), 400
 
-    conn = db_connection()
+    conn = db_connection(PRIMARY_DB)
     cursor = conn.cursor()
 
     cursor.execute("INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?);", (user_id, product_id, quantity))
@@ -165,7 +266,7 @@ def add_to_cart(user_id):
 # GET /cart/:userId - Retrieve user cart
 @app.route('/cart/<int:user_id>', methods=['GET'])
 def get_cart(user_id):
-    conn = db_connection()
+    conn = db_connection(read_db(user_id))
     cursor = conn.cursor()
     cursor.execute("""
         SELECT c.id, p.name, c.quantity, p.price 
@@ -181,7 +282,7 @@ def get_cart(user_id):
 # DELETE /cart/:userId/item/:productId - Remove item from cart
 @app.route('/cart/<int:user_id>/item/<int:product_id>', methods=['DELETE'])
 def remove_from_cart(user_id, product_id):
-    conn = db_connection()
+    conn = db_connection(PRIMARY_DB)
     cursor = conn.cursor()
     cursor.execute("DELETE FROM cart WHERE user_id = ? AND product_id = ?;", (user_id, product_id))
     conn.commit()
@@ -202,7 +303,7 @@ def create_order():
     if not user_id or not cart_items:
         return jsonify({"error": "Missing user_id or cart_items"}), 400
 
-    conn = db_connection()
+    conn = db_connection(PRIMARY_DB)
     cursor = conn.cursor()
 
     # Calculate total price
@@ -222,16 +323,32 @@ def create_order():
 
     return jsonify({"message": "Order created successfully", "order_id": order_id})
 
-# GET /orders/:userId - Get orders for a user
+# GET /orders/:userId - Get orders for a user, a keyset page (?limit=&after=) or an NDJSON export (?stream=true)
 @app.route('/orders/<int:user_id>', methods=['GET'])
 def get_orders(user_id):
-    conn = db_connection()
+    try:
+        limit, after, stream = page_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        return stream_rows(read_db(user_id), "SELECT * FROM orders WHERE user_id = ? AND id > ? ORDER BY id",
+                           (user_id, after), limit)
+    conn = db_connection(read_db(user_id))
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM orders WHERE user_id = ?;", (user_id,))
+    if limit is None:
+        cursor.execute("SELECT * FROM orders WHERE user_id = ?;", (user_id,))
+    else:
+        # One extra row tells whether there is a next page
+        cursor.execute("SELECT * FROM orders WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?;",
+                       (user_id, after, limit + 1))
     orders = cursor.fetchall()
     conn.close()
 
-    return jsonify([dict(order) for order in orders])
+    response = jsonify([dict(order) for order in orders[:limit]])
+    if limit is not None and len(orders) > limit:
+        link_next(response, request.base_url, request.args.to_dict(), orders[limit - 1]["id"])
+    return response
 
 
 if __name__ == '__main__':
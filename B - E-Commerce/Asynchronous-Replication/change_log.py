@@ -0,0 +1,238 @@
+import sqlite3
+import threading
+import time
+
+# Unix time with sub-second precision (unixepoch('subsec') needs SQLite 3.42)
+NOW = "((julianday('now') - 2440587.5) * 86400.0)"
+
+
+def install(conn, tables):
+    """Create the change log and the triggers that fill it on the primary (idempotent).
+
+    Every insert, update and delete on `tables` appends (table, row id) to `change_log`; the
+    row itself is read at replication time, so several changes to one row ship as one.
+    """
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            changed_at REAL NOT NULL DEFAULT {NOW}
+        )
+    """)
+    for table in tables:
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_change_insert AFTER INSERT ON {table} BEGIN
+                INSERT INTO change_log (table_name, row_id) VALUES ('{table}', NEW.id);
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_change_update AFTER UPDATE ON {table} BEGIN
+                INSERT INTO change_log (table_name, row_id) SELECT '{table}', OLD.id WHERE OLD.id <> NEW.id;
+                INSERT INTO change_log (table_name, row_id) VALUES ('{table}', NEW.id);
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {table}_change_delete AFTER DELETE ON {table} BEGIN
+                INSERT INTO change_log (table_name, row_id) VALUES ('{table}', OLD.id);
+            END
+        """)
+    conn.commit()
+
+
+class ChangeLogReplicator:
+    """Ships the rows changed on the primary to the mirror, every `interval` seconds.
+
+    Each round reads up to `batch_size` new change_log entries and the current version of the
+    rows they name from one snapshot of the primary, then upserts (or deletes, for rows that
+    no longer exist) those rows on the mirror in a single transaction that also advances the
+    mirror's `replication_state.last_seq`. A round costs O(changes), not O(database size), and
+    a crash at any point replays at most the last, idempotent, round.
+
+    A mirror without a `replication_state` is seeded once with a full backup() of the primary.
+    Entries the mirror already has are trimmed from the primary's change log.
+    """
+
+    def __init__(self, primary_db, mirror_db, tables, interval=1.0, batch_size=1000):
+        self.primary_db = primary_db
+        self.mirror_db = mirror_db
+        self.tables = list(tables)
+        self.interval = interval
+        self.batch_size = batch_size
+        self._columns = {}
+        self._installed = False
+        self._trimmed_seq = -1
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.last_seq = 0
+        self.rows_shipped = 0
+        self.rounds = 0
+        self.last_round_at = None
+        self.last_error = None
+
+    def _connect(self, db_path):
+        conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _seed(self, primary, mirror):
+        """Copy the whole primary once, then drop the primary-only objects from the copy."""
+        primary.backup(mirror)
+        last_seq = mirror.execute("SELECT COALESCE(MAX(seq), 0) FROM change_log").fetchone()[0]
+        for table in self.tables:
+            for op in ("insert", "update", "delete"):
+                mirror.execute(f"DROP TRIGGER IF EXISTS {table}_change_{op}")
+        mirror.execute("DROP TABLE IF EXISTS change_log")
+        mirror.execute("""
+            CREATE TABLE replication_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                last_seq INTEGER NOT NULL,
+                applied_at REAL NOT NULL
+            )
+        """)
+        mirror.execute("INSERT INTO replication_state (id, last_seq, applied_at) VALUES (1, ?, ?)",
+                       (last_seq, time.time()))
+        mirror.commit()
+        print(f"Mirror seeded from a full copy of the primary (change log at {last_seq})")
+        return last_seq
+
+    def _mirror_position(self, primary, mirror):
+        exists = mirror.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'replication_state'"
+        ).fetchone()
+        if not exists:
+            return self._seed(primary, mirror)
+        return mirror.execute("SELECT last_seq FROM replication_state WHERE id = 1").fetchone()[0]
+
+    def _table_columns(self, conn, table):
+        if table not in self._columns:
+            self._columns[table] = [row["name"] for row in conn.execute(f"PRAGMA table_info({table})")]
+        return self._columns[table]
+
+    def run_once(self):
+        """Replicate one batch of changes; returns the number of change log entries applied."""
+        primary = self._connect(self.primary_db)
+        mirror = self._connect(self.mirror_db)
+        try:
+            if not self._installed:
+                install(primary, self.tables)
+                self._installed = True
+            last_seq = self._mirror_position(primary, mirror)
+
+            # One read transaction: the change entries and the rows they name are consistent
+            primary.execute("BEGIN")
+            changes = primary.execute(
+                "SELECT seq, table_name, row_id FROM change_log WHERE seq > ? ORDER BY seq LIMIT ?",
+                (last_seq, self.batch_size)
+            ).fetchall()
+            rows = {}
+            for table in self.tables:
+                ids = sorted({change["row_id"] for change in changes if change["table_name"] == table})
+                if ids:
+                    placeholders = ", ".join("?" * len(ids))
+                    for row in primary.execute(f"SELECT * FROM {table} WHERE id IN ({placeholders})", ids):
+                        rows[(table, row["id"])] = tuple(row)
+            primary.rollback()
+
+            keys = list(dict.fromkeys((change["table_name"], change["row_id"]) for change in changes))
+            if changes:
+                new_seq = changes[-1]["seq"]
+                mirror.execute("BEGIN IMMEDIATE")
+                for table, row_id in keys:
+                    row = rows.get((table, row_id))
+                    if row is None:
+                        mirror.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+                    else:
+                        columns = self._table_columns(primary, table)
+                        mirror.execute(
+                            f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) "
+                            f"VALUES ({', '.join('?' * len(columns))})", row
+                        )
+                mirror.execute("UPDATE replication_state SET last_seq = ?, applied_at = ? WHERE id = 1",
+                               (new_seq, time.time()))
+                mirror.commit()
+                last_seq = new_seq
+
+            # The mirror has everything up to last_seq; the primary no longer needs it
+            if last_seq > self._trimmed_seq:
+                primary.execute("DELETE FROM change_log WHERE seq <= ?", (last_seq,))
+                primary.commit()
+                self._trimmed_seq = last_seq
+
+            with self._lock:
+                self.last_seq = last_seq
+                self.rows_shipped += len(keys)
+                self.rounds += 1
+                self.last_round_at = time.time()
+                self.last_error = None
+            return len(changes)
+        finally:
+            primary.close()
+            mirror.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                applied = self.run_once()
+            except Exception as e:
+                with self._lock:
+                    self.last_error = str(e)
+                print(f"Replication error: {e}")
+                applied = 0
+            # A full batch means more is waiting: go again without sleeping
+            if applied < self.batch_size:
+                self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="replicator", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def positions(self):
+        """{"primary": (latest change seq, 0), "mirror": (applied seq, lag seconds)} for read routing."""
+        primary = self._connect(self.primary_db)
+        mirror = self._connect(self.mirror_db)
+        try:
+            row = primary.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+            primary_seq = row[0] if row else 0
+            try:
+                mirror_seq = mirror.execute("SELECT last_seq FROM replication_state WHERE id = 1").fetchone()[0]
+            except sqlite3.OperationalError:
+                return {"primary": (primary_seq, 0.0), "mirror": (0, float("inf"))}  # not seeded yet
+            oldest = primary.execute("SELECT MIN(changed_at) FROM change_log WHERE seq > ?", (mirror_seq,)).fetchone()[0]
+        finally:
+            primary.close()
+            mirror.close()
+        lag = max(time.time() - oldest, 0.0) if oldest is not None else 0.0
+        return {"primary": (primary_seq, 0.0), "mirror": (mirror_seq, lag)}
+
+    def status(self):
+        """Replication lag: the age of the oldest change the mirror does not have yet."""
+        with self._lock:
+            status = {
+                "last_seq": self.last_seq,
+                "rows_shipped": self.rows_shipped,
+                "rounds": self.rounds,
+                "last_round_at": self.last_round_at,
+                "last_error": self.last_error
+            }
+        conn = self._connect(self.primary_db)
+        try:
+            pending, oldest = conn.execute(
+                "SELECT COUNT(*), MIN(changed_at) FROM change_log WHERE seq > ?", (status["last_seq"],)
+            ).fetchone()
+        except sqlite3.OperationalError:
+            pending, oldest = 0, None   # change log not installed yet
+        finally:
+            conn.close()
+        status["pending_changes"] = pending
+        status["lag_seconds"] = max(time.time() - oldest, 0.0) if oldest is not None else 0.0
+        return status
@@ -0,0 +1,94 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+
+
+class ReadRouter:
+    """Spreads reads over the primary and its mirror, within each client's consistency needs.
+
+    `copies` maps a name ("primary" first) to its database; `positions()` returns, per name,
+    (replication position, lag in seconds). Positions only grow: the primary's is the position
+    of its latest write, a mirror's the position it has applied up to.
+
+    A read can go to any copy whose lag is within `max_staleness` seconds and whose position
+    has reached the client's token, so a client that sends back the position of its last write
+    reads its own writes. Eligible copies are used in turn. The primary is always eligible.
+    Positions are sampled at most every `refresh_interval` seconds; a sample's age is added to
+    the lag, so a cached sample never makes a copy look fresher than it is. The latest write
+    position of the last `remembered_users` users is also kept, for clients that send no token.
+    """
+
+    def __init__(self, copies, positions, max_staleness=5.0, refresh_interval=0.05, remembered_users=10000):
+        self.copies = dict(copies)
+        self.primary = next(iter(self.copies))
+        self.positions = positions
+        self.max_staleness = max_staleness
+        self.refresh_interval = refresh_interval
+        self.remembered_users = remembered_users
+        self._sample = None
+        self._sampled_at = 0.0
+        self._users = OrderedDict()
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+        self.reads = {name: 0 for name in self.copies}
+
+    def _positions(self, fresh=False):
+        now = time.monotonic()
+        with self._lock:
+            sample, sampled_at = self._sample, self._sampled_at
+        if fresh or sample is None or now - sampled_at > self.refresh_interval:
+            try:
+                sample = self.positions()
+            except Exception as e:
+                print(f"Replication position error: {e}")
+                sample = {name: (0, float("inf")) for name in self.copies}
+                sample[self.primary] = (0, 0.0)
+            sampled_at = now
+            with self._lock:
+                self._sample, self._sampled_at = sample, sampled_at
+        age = now - sampled_at
+        return {name: (position, lag + age if name != self.primary else 0.0)
+                for name, (position, lag) in sample.items()}
+
+    def position(self):
+        """Replication position of the primary's latest write: the token to hand to the writer."""
+        return self._positions(fresh=True)[self.primary][0]
+
+    def remember(self, user_id, position):
+        with self._lock:
+            self._users[user_id] = max(position, self._users.pop(user_id, 0))
+            while len(self._users) > self.remembered_users:
+                self._users.popitem(last=False)
+
+    def user_position(self, user_id):
+        with self._lock:
+            return self._users.get(user_id, 0)
+
+    def choose(self, min_position=0, max_staleness=None):
+        """(name, database) of the copy to read from."""
+        max_staleness = self.max_staleness if max_staleness is None else max_staleness
+        positions = self._positions()
+        eligible = [
+            name for name in self.copies
+            if name == self.primary or (positions.get(name, (0, float("inf")))[1] <= max_staleness
+                                        and positions[name][0] >= min_position)
+        ]
+        name = eligible[next(self._turn) % len(eligible)]
+        with self._lock:
+            self.reads[name] += 1
+        return name, self.copies[name]
+
+    def stats(self):
+        positions = self._positions()
+        with self._lock:
+            reads = dict(self.reads)
+        copies = {}
+        for name in self.copies:
+            position, lag = positions.get(name, (0, float("inf")))
+            copies[name] = {
+                "position": position,
+                "lag_seconds": lag if lag != float("inf") else None,  # unknown, or not caught up
+                "reads": reads[name]
+            }
+        return {"max_staleness": self.max_staleness, "copies": copies}
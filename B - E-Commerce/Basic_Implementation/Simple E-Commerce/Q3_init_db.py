@@ -1,5 +1,7 @@
 import sqlite3
 
+from migrations import migrate
+
 # Connect to SQLite database (or create if it doesn't exist)
 conn = sqlite3.connect("B - E-Commerce/Simple E-Commerce/ecommerce.db")
 cursor = conn.cursor()
@@ -50,8 +52,9 @@ CREATE TABLE IF NOT EXISTS cart (
 );
 """)
 
-# Commit and close connection
+# Commit, then bring the schema (indexes) up to the latest migration
 conn.commit()
+migrate(conn)
 conn.close()
 
 print("Database initialized successfully!")
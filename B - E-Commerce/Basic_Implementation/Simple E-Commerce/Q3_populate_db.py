@@ -1,60 +1,223 @@
-import sqlite3
+# Synthetic data generator: fills the database with a catalog, users, orders and carts at any scale.
+#
+#   python Q3_populate_db.py                                    # a small demo data set
+#   python Q3_populate_db.py --products 1000000 --users 200000 --orders 2000000 --cart-rows 500000
+#
+# Product popularity and user activity follow Zipf's law (a few products are in most orders,
+# a few users place most of them), categories have a skewed mix and their own price ranges.
+# Rows are generated chunk by chunk and bulk-loaded with executemany, one transaction per table,
+# so memory does not grow with the number of orders or cart rows. What is held is a price and a
+# popularity rank per product and a rank per user, in compact arrays: about 24 bytes per product
+# and 16 per user. Order times end at --until (a fixed date by default), so the same --seed on
+# the same starting database always produces the same data.
+import argparse
+import calendar
+import itertools
 import random
+import sqlite3
+import time
+from array import array
+
+from migrations import migrate, schema_version
 
 DB_NAME = "B - E-Commerce/Simple E-Commerce/ecommerce.db"
 
-# Connect to the database
-conn = sqlite3.connect(DB_NAME)
-cursor = conn.cursor()
-
-# ---------------------- POPULATE PRODUCTS TABLE ----------------------
-products = [
-    ("Laptop", "High-performance laptop", 1200.99, "Electronics", 15),
-    ("Smartphone", "Latest model smartphone", 799.99, "Electronics", 25),
-    ("Headphones", "Noise-canceling headphones", 199.99, "Accessories", 30),
-    ("Gaming Console", "Next-gen gaming console", 499.99, "Electronics", 10),
-    ("Coffee Maker", "Automatic coffee machine", 99.99, "Home Appliances", 20),
-    ("Desk Chair", "Ergonomic office chair", 150.50, "Furniture", 12),
-    ("Backpack", "Waterproof travel backpack", 49.99, "Accessories", 35),
-    ("Smart Watch", "Fitness and health tracking watch", 249.99, "Wearables", 18),
-    ("LED TV", "55-inch 4K UHD Smart TV", 649.99, "Electronics", 8),
-    ("Bluetooth Speaker", "Portable wireless speaker", 89.99, "Accessories", 22),
+CHUNK_SIZE = 50_000
+UNTIL = "2025-01-01 00:00:00"  # default end of the order history (UTC)
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+INSERT_PRODUCT = "INSERT INTO products (id, name, description, price, category, stock) VALUES (?, ?, ?, ?, ?, ?)"
+INSERT_ORDER = "INSERT INTO orders (id, user_id, total_price, status, created_at) VALUES (?, ?, ?, ?, ?)"
+INSERT_ORDER_ITEM = "INSERT INTO order_items (order_id, product_id, quantity) VALUES (?, ?, ?)"
+INSERT_CART = "INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?)"
+
+# (category, median price); earlier categories are larger (Zipfian category mix)
+CATEGORIES = [
+    ("Electronics", 450.0),
+    ("Accessories", 35.0),
+    ("Home Appliances", 120.0),
+    ("Clothing", 40.0),
+    ("Books", 15.0),
+    ("Furniture", 220.0),
+    ("Wearables", 180.0),
+    ("Sports", 60.0),
+    ("Toys", 25.0),
+    ("Beauty", 20.0),
+    ("Garden", 45.0),
+    ("Groceries", 8.0),
+    ("Automotive", 75.0),
+    ("Office Supplies", 12.0),
+    ("Pet Supplies", 18.0),
+    ("Music", 30.0)
 ]
+ADJECTIVES = ["Basic", "Classic", "Compact", "Deluxe", "Eco", "Essential", "Pro", "Smart", "Ultra", "Wireless"]
+STATUSES = [("Completed", 0.6), ("Shipped", 0.2), ("Pending", 0.15), ("Canceled", 0.05)]
+QUANTITIES = [(1, 0.7), (2, 0.2), (3, 0.1)]
+OUT_OF_STOCK = 0.08
+
+
+def zipf_cum_weights(n, s):
+    """Cumulative weights of ranks 1..n under Zipf's law with exponent s, for random.choices."""
+    return array("d", itertools.accumulate(rank ** -s for rank in range(1, n + 1)))
+
+
+def chunks(count, chunk_size):
+    """(offset, size) of the chunks covering `count` rows."""
+    for offset in range(0, count, chunk_size):
+        yield offset, min(chunk_size, count - offset)
+
+
+def product_rows(rng, first_id, count, chunk_size):
+    """Chunks of product rows: (id, name, description, price, category, stock)."""
+    category_weights = zipf_cum_weights(len(CATEGORIES), 1.0)
+    for offset, size in chunks(count, chunk_size):
+        categories = rng.choices(CATEGORIES, cum_weights=category_weights, k=size)
+        adjectives = rng.choices(ADJECTIVES, k=size)
+        rows = []
+        for i, (category, median_price) in enumerate(categories):
+            product_id = first_id + offset + i
+            stock = 0 if rng.random() < OUT_OF_STOCK else int(rng.expovariate(1 / 40)) + 1
+            rows.append((
+                product_id,
+                f"{adjectives[i]} {category} item {product_id}",
+                f"Synthetic {category.lower()} product",
+                round(median_price * rng.lognormvariate(0, 0.5), 2),
+                category,
+                stock
+            ))
+        yield (rows,)
+
+
+def order_rows(rng, first_id, count, chunk_size, pick_users, pick_products, prices, items_per_order, days, until):
+    """Chunks of (orders, order items); order ids and creation times increase together.
+
+    `prices` is indexed by product id; `until` is the end of the order history, in epoch seconds.
+    """
+    statuses, status_weights = zip(*STATUSES)
+    quantities, quantity_weights = zip(*QUANTITIES)
+    start = until - days * 86400
+    step = days * 86400 / max(count, 1)
+    order_sizes = range(1, 2 * items_per_order)
+    for offset, size in chunks(count, chunk_size):
+        users = pick_users(size)
+        sizes = rng.choices(order_sizes, k=size)
+        products = iter(pick_products(sum(sizes)))
+        quantity_of = iter(rng.choices(quantities, weights=quantity_weights, k=sum(sizes)))
+        order_status = rng.choices(statuses, weights=status_weights, k=size)
+        orders, items = [], []
+        for i in range(size):
+            order_id = first_id + offset + i
+            total_price = 0.0
+            for _ in range(sizes[i]):
+                product_id, quantity = next(products), next(quantity_of)
+                total_price += prices[product_id] * quantity
+                items.append((order_id, product_id, quantity))
+            created_at = time.strftime(TIME_FORMAT, time.gmtime(start + (offset + i + rng.random()) * step))
+            orders.append((order_id, users[i], round(total_price, 2), order_status[i], created_at))
+        yield orders, items
+
+
+def cart_rows(rng, count, chunk_size, pick_users, pick_products):
+    """Chunks of cart rows: (user_id, product_id, quantity)."""
+    quantities, quantity_weights = zip(*QUANTITIES)
+    for _, size in chunks(count, chunk_size):
+        quantity_of = rng.choices(quantities, weights=quantity_weights, k=size)
+        yield (list(zip(pick_users(size), pick_products(size), quantity_of)),)
+
+
+def zipf_picker(rng, ids, s):
+    """pick(k): k ids, drawn with Zipfian popularity over a random ranking of `ids`; None if there are none."""
+    ranked = array("q", ids)
+    if not ranked:
+        return None
+    rng.shuffle(ranked)
+    cum_weights = zipf_cum_weights(len(ranked), s)
+    return lambda k: rng.choices(ranked, cum_weights=cum_weights, k=k)
+
+
+def bulk_load(conn, inserts, row_chunks):
+    """executemany every chunk inside one transaction.
+
+    `inserts` maps each table to its INSERT; every chunk holds one list of rows per table, in the
+    same order, so rows that belong together (an order and its items) are generated together.
+    """
+    started = time.perf_counter()
+    totals = dict.fromkeys(inserts, 0)
+    conn.execute("BEGIN")
+    for chunk in row_chunks:
+        for (table, query), rows in zip(inserts.items(), chunk):
+            conn.executemany(query, rows)
+            totals[table] += len(rows)
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    for table, total in totals.items():
+        print(f"{table}: {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+def product_prices(conn):
+    """Prices of all products, indexed by product id (0.0 where there is no product)."""
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM products").fetchone()[0]
+    prices = array("d", bytes(8 * (max_id + 1)))
+    for product_id, price in conn.execute("SELECT id, price FROM products"):
+        prices[product_id] = price
+    return prices
+
+
+def populate(db_path, products, users, orders, items_per_order, cart_rows_count, zipf, days, until, seed,
+             chunk_size):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    # Bulk-load tuning; these settings only last as long as this connection
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA cache_size = -262144")     # 256 MiB
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+    # A new database gets its tables now and its indexes after the load, which is much faster
+    # than keeping them up to date row by row
+    if schema_version(conn) == 0:
+        migrate(conn, target=1)
 
-cursor.executemany("INSERT INTO products (name, description, price, category, stock) VALUES (?, ?, ?, ?, ?);", products)
+    first_product = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM products").fetchone()[0]
+    bulk_load(conn, {"products": INSERT_PRODUCT}, product_rows(rng, first_product, products, chunk_size))
 
-# ---------------------- POPULATE ORDERS TABLE ----------------------
-orders = []
-for i in range(1, 11):  # Create 10 orders
-    user_id = random.randint(1, 5)  # Assuming 5 users
-    total_price = round(random.uniform(50, 2000), 2)
-    status = random.choice(["Pending", "Completed", "Shipped", "Canceled"])
-    orders.append((user_id, total_price, status))
+    product_ids = (product_id for product_id, in conn.execute("SELECT id FROM products ORDER BY id"))
+    pick_products = zipf_picker(rng, product_ids, zipf)
+    if pick_products and users:
+        pick_users = zipf_picker(rng, range(1, users + 1), zipf)
 
-cursor.executemany("INSERT INTO orders (user_id, total_price, status) VALUES (?, ?, ?);", orders)
+        first_order = conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM orders").fetchone()[0]
+        bulk_load(conn, {"orders": INSERT_ORDER, "order_items": INSERT_ORDER_ITEM},
+                  order_rows(rng, first_order, orders, chunk_size, pick_users, pick_products,
+                             product_prices(conn), items_per_order, days, until))
+        bulk_load(conn, {"cart": INSERT_CART}, cart_rows(rng, cart_rows_count, chunk_size, pick_users, pick_products))
 
-# ---------------------- POPULATE ORDER ITEMS TABLE ----------------------
-order_items = []
-for order_id in range(1, 11):  # Assume 10 orders exist
-    for _ in range(random.randint(1, 4)):  # Each order has 1-4 products
-        product_id = random.randint(1, len(products))
-        quantity = random.randint(1, 3)
-        order_items.append((order_id, product_id, quantity))
+    started = time.perf_counter()
+    if migrate(conn):
+        print(f"Indexes built in {time.perf_counter() - started:.1f}s")
+    conn.close()
 
-cursor.executemany("INSERT INTO order_items (order_id, product_id, quantity) VALUES (?, ?, ?);", order_items)
 
-# ---------------------- POPULATE CART TABLE ----------------------
-cart = []
-for user_id in range(1, 6):  # Assuming 5 users
-    for _ in range(random.randint(2, 5)):  # Each user has 2-5 products in cart
-        product_id = random.randint(1, len(products))
-        quantity = random.randint(1, 3)
-        cart.append((user_id, product_id, quantity))
+def main():
+    parser = argparse.ArgumentParser(description="Fill the e-commerce database with synthetic data")
+    parser.add_argument("--db", default=DB_NAME, help="database to fill")
+    parser.add_argument("--products", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--items-per-order", type=int, default=3, help="mean number of items in an order")
+    parser.add_argument("--cart-rows", type=int, default=500)
+    parser.add_argument("--zipf", type=float, default=1.0, help="skew of product popularity and user activity")
+    parser.add_argument("--days", type=float, default=365, help="orders are spread over this many days")
+    parser.add_argument("--until", default=UNTIL, help=f"UTC time the orders end at, '{TIME_FORMAT}' (default {UNTIL})")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+    until = calendar.timegm(time.strptime(args.until, TIME_FORMAT))
 
-cursor.executemany("INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?);", cart)
+    started = time.perf_counter()
+    populate(args.db, args.products, args.users, args.orders, max(args.items_per_order, 1), args.cart_rows,
+             args.zipf, args.days, until, args.seed, args.chunk_size)
+    print(f"Database populated successfully in {time.perf_counter() - started:.1f}s!")
 
-# Commit changes and close connection
-conn.commit()
-conn.close()
 
-print("Database populated successfully!")
+if __name__ == "__main__":
+    main()
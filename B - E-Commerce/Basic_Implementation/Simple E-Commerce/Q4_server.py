@@ -1,6 +1,9 @@
 from flask import Flask, request, jsonify
-import sqlite3
+import os
 from flask_cors import CORS
+from db_pool import ConnectionPool
+from catalog_cache import CatalogCache
+from pagination import page_params, link_next, ndjson
 
 app = Flask(__name__)
 CORS(app)
@@ -11,34 +14,85 @@ def apply_cors(response):
     response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
     response.headers["Access-Control-Allow-Headers"] = "Content-Type, Authorization"
     response.headers["Access-Control-Allow-Credentials"] = "true"
+    response.headers["Access-Control-Expose-Headers"] = "ETag, Link, X-Next-After"
     return response
 
 DB_NAME = "B - E-Commerce/Simple E-Commerce/ecommerce.db"
 
+# Persistent connections shared by all routes
+POOL_SIZE = int(os.environ.get("ECOMMERCE_DB_POOL_SIZE", 8))
+pool = ConnectionPool(DB_NAME, size=POOL_SIZE)
+
 def db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row  
-    return conn
+    """Borrow a pooled connection: `with db_connection() as conn:`."""
+    return pool.connection()
+
+def stream_rows(query, params, limit=None):
+    """NDJSON response that reads the rows from the database while the client downloads them."""
+    if limit is not None:
+        query, params = f"{query} LIMIT ?", (*params, limit)
+
+    def generate():
+        # The pooled connection is held until the last row is sent (or the client goes away)
+        with db_connection() as conn:
+            yield from ndjson(conn.execute(query, params))
+
+    return app.response_class(generate(), mimetype="application/x-ndjson")
+
+# GET /health - Health of the database connection pool
+@app.route('/health', methods=['GET'])
+def health():
+    database = pool.health()
+    return jsonify({"status": "ok" if database["ok"] else "degraded", "database": database}), 200 if database["ok"] else 503
+
+# ----------------------------------------- CATALOG CACHE -----------------------------------------
+# The catalog is read far more often than it changes: GET /products and /products/:id are served
+# from memory, as pre-serialised JSON with an ETag. The product routes below refresh it on writes.
+CATALOG_MAX_AGE = 30  # seconds before a full reload picks up writes made by other processes
+
+def load_products(product_id=None):
+    """All products from the database, or one product (None if it does not exist)."""
+    with db_connection() as conn:
+        if product_id is None:
+            return [dict(row) for row in conn.execute("SELECT * FROM products")]
+        row = conn.execute("SELECT * FROM products WHERE id = ?", (product_id,)).fetchone()
+        return dict(row) if row else None
+
+catalog = CatalogCache(load_products, max_age=CATALOG_MAX_AGE)
+
+def cached_json(body, etag):
+    """Pre-serialised JSON response; 304 Not Modified if the client already has this version."""
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+# GET /catalog/stats - Size and hit rate of the catalog cache
+@app.route('/catalog/stats', methods=['GET'])
+def catalog_stats():
+    return jsonify(catalog.stats())
 
 # ----------------------------------------- PRODUCTS ROUTES -----------------------------------------
 
+# GET /products - All products, a keyset page (?limit=&after=) or an NDJSON export (?stream=true)
 @app.route('/products', methods=['GET'])
 def get_products():
-    conn = db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM products")
-    products = cursor.fetchall()
-    conn.close()
-    return jsonify([dict(product) for product in products])
+    try:
+        limit, after, stream = page_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        return stream_rows("SELECT * FROM products WHERE id > ? ORDER BY id", (after,), limit)
+    if limit is None:
+        return cached_json(*catalog.products())
+    body, etag, last_id = catalog.page(after=after, limit=limit)
+    response = cached_json(body, etag)
+    return link_next(response, request.base_url, request.args.to_dict(), last_id) if last_id is not None else response
 
 @app.route('/products/<int:product_id>', methods=['GET'])
 def get_product_by_id(product_id):
-    conn = db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-    product = cursor.fetchone()
-    conn.close()
-    return jsonify(dict(product)) if product else jsonify({"error": "Product not found"}), 404
+    product = catalog.product(product_id)
+    return cached_json(*product) if product else (jsonify({"error": "Product not found"}), 404)
 
 @app.route('/products', methods=['POST'])
 def add_product():
@@ -48,14 +102,14 @@ def add_product():
     if not all(field in data for field in required_fields):
         return jsonify({"error": "Missing required fields"}), 400
 
-    conn = db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT INTO products (name, description, price, category, stock) 
-        VALUES (?, ?, ?, ?, ?);
-    """, (data["name"], data["description"], data["price"], data["category"], data["stock"]))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT INTO products (name, description, price, category, stock) 
+            VALUES (?, ?, ?, ?, ?);
+        """, (data["name"], data["description"], data["price"], data["category"], data["stock"]))
+        conn.commit()
+    catalog.refresh(cursor.lastrowid)
 
     return jsonify({"message": "Product added successfully"}), 201
 
@@ -70,32 +124,30 @@ def update_product(product_id):
     query = "UPDATE products SET " + ", ".join(f"{key} = ?" for key in update_fields.keys()) + " WHERE id = ?"
     values = list(update_fields.values()) + [product_id]
 
-    conn = db_connection()
-    cursor = conn.cursor()
-    cursor.execute(query, values)
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, values)
+        conn.commit()
+    catalog.refresh(product_id)
 
     return jsonify({"message": "Product updated successfully"})
 
 @app.route('/products/<int:product_id>', methods=['DELETE'])
 def delete_product(product_id):
-    conn = db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-    cursor.execute("SELECT 1 FROM order_items WHERE product_id = ?", (product_id,))
-    if cursor.fetchone():
-        conn.close()
-        return jsonify({"error": "Cannot delete a product that is part of an order"}), 400
+        cursor.execute("SELECT 1 FROM order_items WHERE product_id = ?", (product_id,))
+        if cursor.fetchone():
+            return jsonify({"error": "Cannot delete a product that is part of an order"}), 400
 
-    cursor.execute("SELECT 1 FROM cart WHERE product_id = ?", (product_id,))
-    if cursor.fetchone():
-        conn.close()
-        return jsonify({"error": "Cannot delete a product that is in a user's cart"}), 400
+        cursor.execute("SELECT 1 FROM cart WHERE product_id = ?", (product_id,))
+        if cursor.fetchone():
+            return jsonify({"error": "Cannot delete a product that is in a user's cart"}), 400
 
-    cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
-    conn.commit()
-    conn.close()
+        cursor.execute("DELETE FROM products WHERE id = ?", (product_id,))
+        conn.commit()
+    catalog.refresh(product_id)
 
     return jsonify({"message": "Product deleted successfully"})
 
@@ -110,43 +162,40 @@ def add_to_cart(user_id):
     if not product_id or not quantity or quantity <= 0:
         return jsonify({"error": "Invalid product_id or quantity"}), 400
 
-    conn = db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-    cursor.execute("SELECT stock FROM products WHERE id = ?", (product_id,))
-    product = cursor.fetchone()
-    if not product:
-        return jsonify({"error": "Product not found"}), 400
+        cursor.execute("SELECT stock FROM products WHERE id = ?", (product_id,))
+        product = cursor.fetchone()
+        if not product:
+            return jsonify({"error": "Product not found"}), 400
 
-    cursor.execute("INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?);", (user_id, product_id, quantity))
-    conn.commit()
-    conn.close()
+        cursor.execute("INSERT INTO cart (user_id, product_id, quantity) VALUES (?, ?, ?);", (user_id, product_id, quantity))
+        conn.commit()
 
     return jsonify({"message": "Product added to cart"})
 
 @app.route('/cart/<int:user_id>', methods=['GET'])
 def get_cart(user_id):
-    conn = db_connection()
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT c.id, p.name, c.quantity, p.price, 
-               (p.price * c.quantity) AS total_item_price
-        FROM cart c 
-        JOIN products p ON c.product_id = p.id
-        WHERE c.user_id = ?;
-    """, (user_id,))
-    cart_items = cursor.fetchall()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT c.id, p.name, c.quantity, p.price, 
+                   (p.price * c.quantity) AS total_item_price
+            FROM cart c 
+            JOIN products p ON c.product_id = p.id
+            WHERE c.user_id = ?;
+        """, (user_id,))
+        cart_items = cursor.fetchall()
 
     return jsonify([dict(item) for item in cart_items])
 
 @app.route('/cart/<int:user_id>/item/<int:product_id>', methods=['DELETE'])
 def remove_from_cart(user_id, product_id):
-    conn = db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM cart WHERE user_id = ? AND product_id = ?;", (user_id, product_id))
-    conn.commit()
-    conn.close()
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM cart WHERE user_id = ? AND product_id = ?;", (user_id, product_id))
+        conn.commit()
     return jsonify({"message": "Product removed from cart"})
 
 # ----------------------------------------- ORDERS ROUTES -----------------------------------------
@@ -160,31 +209,47 @@ def create_order():
     if not user_id or not cart_items:
         return jsonify({"error": "Missing user_id or cart_items"}), 400
 
-    conn = db_connection()
-    cursor = conn.cursor()
+    with db_connection() as conn:
+        cursor = conn.cursor()
 
-    total_price = sum(item["quantity"] * item["price"] for item in cart_items)
-    cursor.execute("INSERT INTO orders (user_id, total_price) VALUES (?, ?);", (user_id, total_price))
-    order_id = cursor.lastrowid
+        total_price = sum(item["quantity"] * item["price"] for item in cart_items)
+        cursor.execute("INSERT INTO orders (user_id, total_price) VALUES (?, ?);", (user_id, total_price))
+        order_id = cursor.lastrowid
 
-    for item in cart_items:
-        cursor.execute("INSERT INTO order_items (order_id, product_id, quantity) VALUES (?, ?, ?);",
-                       (order_id, item["product_id"], item["quantity"]))
-        cursor.execute("UPDATE products SET stock = stock - ? WHERE id = ?", (item["quantity"], item["product_id"]))
+        for item in cart_items:
+            cursor.execute("INSERT INTO order_items (order_id, product_id, quantity) VALUES (?, ?, ?);",
+                           (order_id, item["product_id"], item["quantity"]))
+            cursor.execute("UPDATE products SET stock = stock - ? WHERE id = ?", (item["quantity"], item["product_id"]))
 
-    conn.commit()
-    conn.close()
+        conn.commit()
+    for item in cart_items:
+        catalog.refresh(item["product_id"])  # stock changed
 
     return jsonify({"message": "Order created successfully", "order_id": order_id})
 
+# GET /orders/:user_id - A user's orders, a keyset page (?limit=&after=) or an NDJSON export (?stream=true)
 @app.route('/orders/<int:user_id>', methods=['GET'])
 def get_orders(user_id):
-    conn = db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM orders WHERE user_id = ?;", (user_id,))
-    orders = cursor.fetchall()
-    conn.close()
-    return jsonify([dict(order) for order in orders])
+    try:
+        limit, after, stream = page_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        return stream_rows("SELECT * FROM orders WHERE user_id = ? AND id > ? ORDER BY id", (user_id, after), limit)
+    with db_connection() as conn:
+        cursor = conn.cursor()
+        if limit is None:
+            cursor.execute("SELECT * FROM orders WHERE user_id = ?;", (user_id,))
+        else:
+            # One extra row tells whether there is a next page
+            cursor.execute("SELECT * FROM orders WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?;",
+                           (user_id, after, limit + 1))
+        orders = cursor.fetchall()
+    response = jsonify([dict(order) for order in orders[:limit]])
+    if limit is not None and len(orders) > limit:
+        link_next(response, request.base_url, request.args.to_dict(), orders[limit - 1]["id"])
+    return response
 
 if __name__ == '__main__':
     PORT = 3001
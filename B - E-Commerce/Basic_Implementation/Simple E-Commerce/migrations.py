@@ -0,0 +1,322 @@
+# Schema migrations for the e-commerce databases, tracked in PRAGMA user_version.
+#
+#   python migrations.py ecommerce_primary.db ecommerce_mirror.db      # migrate to the latest version
+#   python migrations.py ecommerce_primary.db --check                  # fail if a hot query scans a table
+#   python migrations.py --benchmark --products 1000000 --cart-rows 10000000
+#
+# --check is the query-plan regression test: it runs EXPLAIN QUERY PLAN on every hot-path query
+# of the servers and exits non-zero if one of them scans instead of searching an index. When it
+# migrates a database, it also times the hot queries before and after and fails if one got
+# slower; --benchmark does the same on a synthetic database.
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+# (version, description, statements); a version is applied in one transaction
+MIGRATIONS = [
+    (1, "Tables (as created by Q3_init_db.py)", [
+        """CREATE TABLE IF NOT EXISTS products (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            price REAL NOT NULL,
+            category TEXT,
+            stock INTEGER NOT NULL CHECK(stock >= 0)
+        )""",
+        """CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            total_price REAL NOT NULL,
+            status TEXT DEFAULT 'Pending',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )""",
+        """CREATE TABLE IF NOT EXISTS order_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK(quantity > 0),
+            FOREIGN KEY (order_id) REFERENCES orders(id) ON DELETE CASCADE,
+            FOREIGN KEY (product_id) REFERENCES products(id)
+        )""",
+        """CREATE TABLE IF NOT EXISTS cart (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL CHECK(quantity > 0),
+            FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+        )"""
+    ]),
+    (2, "Secondary indexes for the hot-path filters", [
+        # Catalog filters: ?category=, ?category=&inStock=true and ?inStock=true
+        "CREATE INDEX IF NOT EXISTS idx_products_category_stock ON products (category, stock)",
+        # Covers every cart lookup by user (the rowid is in every index), and the item delete
+        "CREATE INDEX IF NOT EXISTS idx_cart_user ON cart (user_id, product_id, quantity)",
+        # "Is this product in a cart?" before a product is deleted
+        "CREATE INDEX IF NOT EXISTS idx_cart_product ON cart (product_id)",
+        # Covers SELECT * FROM orders WHERE user_id = ?
+        "CREATE INDEX IF NOT EXISTS idx_orders_user ON orders (user_id, created_at, total_price, status)",
+        # "Is this product in an order?" before a product is deleted
+        "CREATE INDEX IF NOT EXISTS idx_order_items_product ON order_items (product_id)",
+        # The items of an order, and the ON DELETE CASCADE from orders
+        "CREATE INDEX IF NOT EXISTS idx_order_items_order ON order_items (order_id, product_id, quantity)"
+    ]),
+    (3, "Keyset pagination of a user's orders", [
+        # Ordered by id within a user, so ?after= is a seek and needs no sort; still covering
+        "DROP INDEX IF EXISTS idx_orders_user",
+        "CREATE INDEX IF NOT EXISTS idx_orders_user_id ON orders (user_id, id, created_at, total_price, status)"
+    ]),
+    (4, "Drop the stock index", [
+        # Created by earlier versions of migration 2. About 90% of the products are in stock, so
+        # ?inStock=true through this index was slower than the table scan it replaced
+        "DROP INDEX IF EXISTS idx_products_stock"
+    ])
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# (name, query, example parameters): the filtered queries the servers run on every request
+HOT_QUERIES = [
+    ("product by id", "SELECT * FROM products WHERE id = ?", (1,)),
+    ("products by category", "SELECT * FROM products WHERE category = ?", ("Electronics",)),
+    ("products in stock by category", "SELECT * FROM products WHERE category = ? AND stock > 0", ("Electronics",)),
+    ("products in stock", "SELECT * FROM products WHERE stock > 0", ()),
+    ("cart rows of a user", "SELECT * FROM cart WHERE user_id = ?", (1,)),
+    ("cart of a user", """
+        SELECT c.id, p.name, c.quantity, p.price, (p.price * c.quantity) AS total_item_price
+        FROM cart c JOIN products p ON c.product_id = p.id
+        WHERE c.user_id = ?
+    """, (1,)),
+    ("cart item delete", "DELETE FROM cart WHERE user_id = ? AND product_id = ?", (1, 1)),
+    ("product in a cart", "SELECT 1 FROM cart WHERE product_id = ?", (1,)),
+    ("orders of a user", "SELECT * FROM orders WHERE user_id = ?", (1,)),
+    ("orders page of a user", "SELECT * FROM orders WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?", (1, 0, 101)),
+    ("products page", "SELECT * FROM products WHERE id > ? ORDER BY id LIMIT ?", (0, 101)),
+    ("product in an order", "SELECT 1 FROM order_items WHERE product_id = ?", (1,))
+]
+
+# Hot queries for which a scan is the fastest plan, and why
+EXPECTED_SCANS = {
+    "products in stock": "matches about 90% of the products"
+}
+
+# A query is slower after migrating if its p50 grew by more than this factor (timing noise)
+SLOWDOWN_TOLERANCE = 1.25
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, target=LATEST_VERSION):
+    """Apply the migrations between the database's version and `target`; returns the versions applied."""
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if version <= schema_version(conn) or version > target:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+        print(f"Migrated to version {version}: {description}")
+    return applied
+
+
+def query_plan(conn, query, params):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+
+
+def check_query_plans(conn):
+    """{query name: plan} of every hot query whose plan scans a table or an index, unless expected."""
+    scans = {}
+    for name, query, params in HOT_QUERIES:
+        if name in EXPECTED_SCANS:
+            continue
+        plan = query_plan(conn, query, params)
+        if any(step.startswith("SCAN") and step != "SCAN CONSTANT ROW" for step in plan):
+            scans[name] = plan
+    return scans
+
+
+def fill_benchmark_database(conn, products, cart_rows, orders, order_items, users, categories=50):
+    """Synthetic rows generated inside SQLite (recursive CTEs), so millions load in seconds."""
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("BEGIN")
+    conn.execute(f"""
+        INSERT INTO products (name, description, price, category, stock)
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {products})
+        SELECT 'product-' || i, 'Synthetic product ' || i, (abs(random()) % 200000) / 100.0,
+               'category-' || (abs(random()) % {categories}),
+               CASE WHEN abs(random()) % 10 = 0 THEN 0 ELSE abs(random()) % 100 END
+        FROM n
+    """)
+    conn.execute(f"""
+        INSERT INTO cart (user_id, product_id, quantity)
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {cart_rows})
+        SELECT 1 + abs(random()) % {users}, 1 + abs(random()) % {products}, 1 + abs(random()) % 3 FROM n
+    """)
+    conn.execute(f"""
+        INSERT INTO orders (user_id, total_price, status)
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {orders})
+        SELECT 1 + abs(random()) % {users}, (abs(random()) % 500000) / 100.0, 'Pending' FROM n
+    """)
+    conn.execute(f"""
+        INSERT INTO order_items (order_id, product_id, quantity)
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < {order_items})
+        SELECT 1 + abs(random()) % {orders}, 1 + abs(random()) % {products}, 1 + abs(random()) % 3 FROM n
+    """)
+    conn.commit()
+
+
+def time_queries(conn, products, users, categories, budget=2.0, iterations=200, seed=0):
+    """Mean and p50 latency (ms) of every hot SELECT, with random ids up to `products` and `users`."""
+    rng = random.Random(seed)
+    categories = list(categories) or [None]
+    params_for = {
+        "product by id": lambda: (rng.randint(1, products),),
+        "products by category": lambda: (rng.choice(categories),),
+        "products in stock by category": lambda: (rng.choice(categories),),
+        "products in stock": lambda: (),
+        "cart rows of a user": lambda: (rng.randint(1, users),),
+        "cart of a user": lambda: (rng.randint(1, users),),
+        "product in a cart": lambda: (rng.randint(1, products),),
+        "orders of a user": lambda: (rng.randint(1, users),),
+        "orders page of a user": lambda: (rng.randint(1, users), 0, 101),
+        "products page": lambda: (rng.randint(0, products), 101),
+        "product in an order": lambda: (rng.randint(1, products),)
+    }
+    results = {}
+    for name, query, _ in HOT_QUERIES:
+        if name not in params_for:
+            continue  # writes are only plan-checked
+        latencies = []
+        deadline = time.perf_counter() + budget
+        while len(latencies) < iterations and (not latencies or time.perf_counter() < deadline):
+            params = params_for[name]()
+            started = time.perf_counter()
+            conn.execute(query, params).fetchall()
+            latencies.append(time.perf_counter() - started)
+        latencies.sort()
+        results[name] = {
+            "runs": len(latencies),
+            "mean_ms": sum(latencies) / len(latencies) * 1000,
+            "p50_ms": latencies[len(latencies) // 2] * 1000
+        }
+    return results
+
+
+def time_database(conn):
+    """time_queries with parameters drawn from what the database holds."""
+    products = conn.execute("SELECT COALESCE(MAX(id), 1) FROM products").fetchone()[0]
+    users = conn.execute("""
+        SELECT MAX(COALESCE((SELECT MAX(user_id) FROM orders), 1), COALESCE((SELECT MAX(user_id) FROM cart), 1))
+    """).fetchone()[0]
+    categories = [category for category, in conn.execute("SELECT DISTINCT category FROM products")]
+    return time_queries(conn, products, users, categories)
+
+
+def slower_queries(before, after, tolerance=SLOWDOWN_TOLERANCE):
+    """{query name: (p50 before, p50 after)} of the queries whose p50 grew by more than `tolerance`."""
+    return {
+        name: (before[name]["p50_ms"], after[name]["p50_ms"])
+        for name in before
+        if name in after and after[name]["p50_ms"] > before[name]["p50_ms"] * tolerance
+    }
+
+
+def print_comparison(before, after):
+    print(f"{'query':32s} {'before p50':>12s} {'after p50':>12s} {'speed-up':>10s}")
+    for name in before:
+        speedup = before[name]["p50_ms"] / max(after[name]["p50_ms"], 1e-6)
+        print(f"{name:32s} {before[name]['p50_ms']:10.3f}ms {after[name]['p50_ms']:10.3f}ms {speedup:9.1f}x")
+
+
+def benchmark(path, products, cart_rows, orders, order_items, users, categories=50):
+    conn = sqlite3.connect(path)
+    migrate(conn, target=1)
+    started = time.perf_counter()
+    fill_benchmark_database(conn, products, cart_rows, orders, order_items, users)
+    print(f"Loaded {products} products, {cart_rows} cart rows, {orders} orders and {order_items} order items "
+          f"in {time.perf_counter() - started:.1f}s")
+    conn.execute("PRAGMA journal_mode = DELETE")
+    conn.execute("PRAGMA synchronous = FULL")
+
+    category_names = [f"category-{i}" for i in range(categories)]
+    before = time_queries(conn, products, users, category_names)
+    started = time.perf_counter()
+    migrate(conn)
+    print(f"Indexes built in {time.perf_counter() - started:.1f}s")
+    after = time_queries(conn, products, users, category_names)
+
+    print_comparison(before, after)
+    scans = check_query_plans(conn)
+    conn.close()
+    return before, after, scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate, plan-check or benchmark the e-commerce schema")
+    parser.add_argument("databases", nargs="*", help="database files to migrate (and check)")
+    parser.add_argument("--check", action="store_true",
+                        help="fail if a hot-path query scans a table, or got slower through the migration")
+    parser.add_argument("--benchmark", action="store_true", help="time the hot queries before and after migrating")
+    parser.add_argument("--bench-db", default=None, help="benchmark database file (default: a temporary file)")
+    parser.add_argument("--products", type=int, default=1_000_000)
+    parser.add_argument("--cart-rows", type=int, default=10_000_000)
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--order-items", type=int, default=3_000_000)
+    parser.add_argument("--users", type=int, default=100_000)
+    args = parser.parse_args()
+
+    failed = False
+    for path in args.databases:
+        conn = sqlite3.connect(path)
+        pending = schema_version(conn) < LATEST_VERSION
+        before = time_database(conn) if args.check and pending else None
+        applied = migrate(conn)
+        print(f"{path}: schema version {schema_version(conn)}" + ("" if applied else " (up to date)"))
+        if args.check:
+            for name, plan in check_query_plans(conn).items():
+                failed = True
+                print(f"{path}: '{name}' scans: {'; '.join(plan)}")
+            if before is not None:
+                after = time_database(conn)
+                print_comparison(before, after)
+                for name, (p50_before, p50_after) in slower_queries(before, after).items():
+                    failed = True
+                    print(f"{path}: '{name}' got slower: p50 {p50_before:.3f}ms -> {p50_after:.3f}ms")
+        conn.close()
+
+    if args.benchmark:
+        fd, path = tempfile.mkstemp(suffix=".db") if args.bench_db is None else (None, args.bench_db)
+        if fd is not None:
+            os.close(fd)
+        try:
+            before, after, scans = benchmark(path, args.products, args.cart_rows, args.orders, args.order_items,
+                                             args.users)
+        finally:
+            if fd is not None:
+                os.remove(path)
+        for name, plan in scans.items():
+            failed = True
+            print(f"benchmark: '{name}' scans: {'; '.join(plan)}")
+        for name, (p50_before, p50_after) in slower_queries(before, after).items():
+            failed = True
+            print(f"benchmark: '{name}' got slower: p50 {p50_before:.3f}ms -> {p50_after:.3f}ms")
+
+    if args.check or args.benchmark:
+        print("Query plans: FAILED" if failed else "Query plans: every hot query uses an index or an expected scan")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import json
+from urllib.parse import urlencode
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH = 500
+
+
+def page_params(args):
+    """(limit, after, stream) from the query string: ?limit=&after=&stream=true.
+
+    Pages are keyset pages: `after` is the last id the client has, so a page costs one index
+    seek whatever its depth. `limit` is None when neither is given, for the unpaginated
+    response; a stream has no upper bound. Raises ValueError on bad values.
+    """
+    stream = args.get("stream", "").lower() == "true"
+    try:
+        after = int(args.get("after", 0))
+        limit = args.get("limit")
+        if limit is not None:
+            limit = int(limit)
+        elif "after" in args and not stream:
+            limit = DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise ValueError("limit and after must be integers")
+    if after < 0 or (limit is not None and limit < 1):
+        raise ValueError("limit must be positive and after must not be negative")
+    if limit is not None and limit > MAX_PAGE_SIZE and not stream:
+        raise ValueError(f"limit must not exceed {MAX_PAGE_SIZE}; use stream=true to export everything")
+    return limit, after, stream
+
+
+def link_next(response, url, args, last_id):
+    """Point the client at the page after `last_id` (Link rel="next" and X-Next-After headers)."""
+    query = urlencode({**args, "after": last_id})
+    response.headers["Link"] = f'<{url}?{query}>; rel="next"'
+    response.headers["X-Next-After"] = str(last_id)
+    return response
+
+
+def ndjson(cursor, batch_size=STREAM_BATCH):
+    """Newline-delimited JSON of a cursor's rows, fetched and sent `batch_size` rows at a time."""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield "".join(json.dumps(dict(row)) + "\n" for row in rows).encode()
@@ -1,6 +1,13 @@
-from flask import Flask, request, jsonify
-import sqlite3
+from flask import Flask, request, jsonify, g
+import os
+import time
 from flask_cors import CORS
+from db_pool import ConnectionPool
+from group_commit import WriteBatcher
+from two_phase import TwoPhaseCommit
+from read_router import ReadRouter
+from catalog_cache import CatalogCache
+from pagination import page_params, link_next, ndjson
 
 app = Flask(__name__)
 CORS(app)
@@ -16,55 +23,166 @@ def apply_cors(response):
 # Define primary and mirrored databases
 PRIMARY_DB = "ecommerce_primary.db"
 MIRROR_DB = "ecommerce_mirror.db"
+INTENT_LOG = "ecommerce_intent_log.jsonl"  # two-phase commit decisions, replayed on restart
+
+# Persistent connections per database, shared by all routes
+POOL_SIZE = int(os.environ.get("ECOMMERCE_DB_POOL_SIZE", 8))
+pools = {db_path: ConnectionPool(db_path, size=POOL_SIZE) for db_path in (PRIMARY_DB, MIRROR_DB)}
 
 def db_connection(db_path):
-    """Create a connection to the given database."""
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row  
-    return conn
+    """Borrow a pooled connection to the given database: `with db_connection(PRIMARY_DB) as conn:`."""
+    return pools[db_path].connection()
 
-def execute_write(query, params=()):
-    """Write to both primary and mirrored databases (ensuring consistency)."""
-    try:
-        conn_primary = db_connection(PRIMARY_DB)
-        conn_mirror = db_connection(MIRROR_DB)
+def stream_rows(db_path, query, params, limit=None):
+    """NDJSON response that reads the rows from the database while the client downloads them."""
+    if limit is not None:
+        query, params = f"{query} LIMIT ?", (*params, limit)
+
+    def generate():
+        # The pooled connection is held until the last row is sent (or the client goes away)
+        with db_connection(db_path) as conn:
+            yield from ndjson(conn.execute(query, params))
 
-        cursor_primary = conn_primary.cursor()
-        cursor_mirror = conn_mirror.cursor()
+    return app.response_class(generate(), mimetype="application/x-ndjson")
 
-        cursor_primary.execute(query, params)
-        cursor_mirror.execute(query, params)
+# Every write transaction commits on both copies or, after a failure, is completed on restart
+coordinator = TwoPhaseCommit([pools[PRIMARY_DB], pools[MIRROR_DB]], INTENT_LOG)
+coordinator.recover()
 
-        conn_primary.commit()
-        conn_mirror.commit()
+# Concurrent writes are committed together: one transaction per database every few milliseconds
+writer = WriteBatcher(
+    coordinator,
+    max_batch=int(os.environ.get("ECOMMERCE_GROUP_COMMIT_MAX_BATCH", 64)),
+    max_delay=float(os.environ.get("ECOMMERCE_GROUP_COMMIT_DELAY_MS", 5)) / 1000
+)
+writer.start()
 
-        conn_primary.close()
-        conn_mirror.close()
+def execute_write(query, params=()):
+    """Write to both primary and mirrored databases (ensuring consistency).
 
+    Returns once the batch holding the write is committed on both copies.
+    """
+    try:
+        writer.execute(query, params)
         return True  # Success
     except Exception as e:
         print(f"Database write error: {e}")
         return False
 
+# ----------------------------------------- READ ROUTING -----------------------------------------
+# GETs are spread over the primary and the mirror. The mirror commits with the primary, so it only
+# falls behind while a two-phase commit is in doubt, and is not read from until it has caught up.
+# A client can still require its own writes with the X-Replication-Position of its last write (or
+# ?position=), and bound staleness with ?maxStaleness=<seconds>; positions are remembered per user.
+MAX_STALENESS = 1.0  # seconds, default staleness accepted from the mirror
+
+def replication_positions():
+    """Last committed two-phase transaction id of each copy, and the mirror's lag behind the primary."""
+    positions = {}
+    for name, db_path in (("primary", PRIMARY_DB), ("mirror", MIRROR_DB)):
+        with db_connection(db_path) as conn:
+            row = conn.execute("SELECT last_txid FROM two_phase_state WHERE id = 1").fetchone()
+        positions[name] = row[0] if row else 0
+    behind = positions["mirror"] < positions["primary"]
+    return {"primary": (positions["primary"], 0.0), "mirror": (positions["mirror"], float("inf") if behind else 0.0)}
+
+router = ReadRouter({"primary": PRIMARY_DB, "mirror": MIRROR_DB}, replication_positions, max_staleness=MAX_STALENESS)
+
+def request_value(header, arg, cast):
+    value = request.args.get(arg, request.headers.get(header))
+    try:
+        return cast(value) if value is not None else None
+    except ValueError:
+        return None
+
+def read_db(user_id=None):
+    """Database to serve this GET from: the primary, or the mirror if it is fresh enough."""
+    position = request_value("X-Replication-Position", "position", int) or 0
+    if user_id is not None:
+        position = max(position, router.user_position(str(user_id)))
+    name, db_path = router.choose(position, request_value("X-Max-Staleness", "maxStaleness", float))
+    g.served_by = name
+    return db_path
+
+@app.after_request
+def attach_replication_position(response):
+    if request.method in ("POST", "PUT", "DELETE") and response.status_code < 300:
+        position = router.position()
+        user_id = (request.view_args or {}).get("user_id")
+        data = request.get_json(silent=True)
+        if user_id is None and isinstance(data, dict):
+            user_id = data.get("user_id")  # POST /orders
+        if user_id is not None:
+            router.remember(str(user_id), position)
+        response.headers["X-Replication-Position"] = str(position)
+    if "served_by" in g:
+        response.headers["X-Served-By"] = g.served_by
+    response.headers["Access-Control-Expose-Headers"] = "X-Replication-Position, X-Served-By, ETag, Link, X-Next-After"
+    return response
+
+# GET /health - Health of the database connection pools
+@app.route('/health', methods=['GET'])
+def health():
+    databases = {name: pools[db_path].health() for name, db_path in (("primary", PRIMARY_DB), ("mirror", MIRROR_DB))}
+    transactions = coordinator.stats()
+    healthy = all(database["ok"] for database in databases.values()) and not transactions["blocked"]
+    return jsonify({
+        "status": "ok" if healthy else "degraded",
+        "databases": databases,
+        "group_commit": writer.stats(),
+        "two_phase_commit": transactions,
+        "reads": router.stats()
+    }), 200 if healthy else 503
+
+# ----------------------------------------- CATALOG CACHE -----------------------------------------
+# The catalog is read far more often than it changes: GET /products and /products/:id are served
+# from memory, as pre-serialised JSON with an ETag. The product routes below refresh it on writes.
+CATALOG_MAX_AGE = 30  # seconds before a full reload picks up writes made by other processes
+
+def load_products(product_id=None):
+    """All products from the primary, or one product (None if it does not exist)."""
+    with db_connection(PRIMARY_DB) as conn:
+        if product_id is None:
+            return [dict(row) for row in conn.execute("SELECT * FROM products")]
+        row = conn.execute("SELECT * FROM products WHERE id = ?", (product_id,)).fetchone()
+        return dict(row) if row else None
+
+catalog = CatalogCache(load_products, max_age=CATALOG_MAX_AGE)
+
+def cached_json(body, etag):
+    """Pre-serialised JSON response; 304 Not Modified if the client already has this version."""
+    g.served_by = "cache"
+    response = app.response_class(body, mimetype="application/json")
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+# GET /catalog/stats - Size and hit rate of the catalog cache
+@app.route('/catalog/stats', methods=['GET'])
+def catalog_stats():
+    return jsonify(catalog.stats())
+
 # ----------------------------------------- PRODUCTS ROUTES -----------------------------------------
 
+# GET /products - All products, a keyset page (?limit=&after=) or an NDJSON export (?stream=true)
 @app.route('/products', methods=['GET'])
 def get_products():
-    conn = db_connection(PRIMARY_DB)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM products")
-    products = cursor.fetchall()
-    conn.close()
-    return jsonify([dict(product) for product in products])
+    try:
+        limit, after, stream = page_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        return stream_rows(read_db(), "SELECT * FROM products WHERE id > ? ORDER BY id", (after,), limit)
+    if limit is None:
+        return cached_json(*catalog.products())
+    body, etag, last_id = catalog.page(after=after, limit=limit)
+    response = cached_json(body, etag)
+    return link_next(response, request.base_url, request.args.to_dict(), last_id) if last_id is not None else response
 
 @app.route('/products/<int:product_id>', methods=['GET'])
 def get_product_by_id(product_id):
-    conn = db_connection(PRIMARY_DB)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-    product = cursor.fetchone()
-    conn.close()
-    return jsonify(dict(product)) if product else jsonify({"error": "Product not found"}), 404
+    product = catalog.product(product_id)
+    return cached_json(*product) if product else (jsonify({"error": "Product not found"}), 404)
 
 @app.route('/products', methods=['POST'])
 def add_product():
@@ -76,6 +194,7 @@ def add_product():
 
     query = "INSERT INTO products (name, description, price, category, stock) VALUES (?, ?, ?, ?, ?);"
     if execute_write(query, (data["name"], data["description"], data["price"], data["category"], data["stock"])):
+        catalog.invalidate()  # the new id is not known here; reloaded on the next read
         return jsonify({"message": "Product added successfully"}), 201
     else:
         return jsonify({"error": "Database write failed"}), 500
@@ -92,26 +211,26 @@ def update_product(product_id):
     values = list(update_fields.values()) + [product_id]
 
     if execute_write(query, values):
+        catalog.refresh(product_id)
         return jsonify({"message": "Product updated successfully"})
     else:
         return jsonify({"error": "Database update failed"}), 500
 
 @app.route('/products/<int:product_id>', methods=['DELETE'])
 def delete_product(product_id):
-    conn = db_connection(PRIMARY_DB)
-    cursor = conn.cursor()
+    with db_connection(PRIMARY_DB) as conn:
+        cursor = conn.cursor()
 
-    cursor.execute("SELECT 1 FROM order_items WHERE product_id = ?", (product_id,))
-    if cursor.fetchone():
-        conn.close()
-        return jsonify({"error": "Cannot delete a product that is part of an order"}), 400
+        cursor.execute("SELECT 1 FROM order_items WHERE product_id = ?", (product_id,))
+        if cursor.fetchone():
+            return jsonify({"error": "Cannot delete a product that is part of an order"}), 400
 
-    cursor.execute("SELECT 1 FROM cart WHERE product_id = ?", (product_id,))
-    if cursor.fetchone():
-        conn.close()
-        return jsonify({"error": "Cannot delete a product that is in a user's cart"}), 400
+        cursor.execute("SELECT 1 FROM cart WHERE product_id = ?", (product_id,))
+        if cursor.fetchone():
+            return jsonify({"error": "Cannot delete a product that is in a user's cart"}), 400
 
     if execute_write("DELETE FROM products WHERE id = ?", (product_id,)):
+        catalog.refresh(product_id)
         return jsonify({"message": "Product deleted successfully"})
     else:
         return jsonify({"error": "Database deletion failed"}), 500
@@ -135,11 +254,10 @@ def add_to_cart(user_id):
 
 @app.route('/cart/<int:user_id>', methods=['GET'])
 def get_cart(user_id):
-    conn = db_connection(PRIMARY_DB)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM cart WHERE user_id = ?", (user_id,))
-    cart_items = cursor.fetchall()
-    conn.close()
+    with db_connection(read_db(user_id)) as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM cart WHERE user_id = ?", (user_id,))
+        cart_items = cursor.fetchall()
     return jsonify([dict(item) for item in cart_items])
 
 # ----------------------------------------- ORDERS ROUTES -----------------------------------------
@@ -154,21 +272,40 @@ def create_order():
         return jsonify({"error": "Missing user_id or cart_items"}), 400
 
     total_price = sum(item["price"] * item["quantity"] for item in cart_items)
-    query = "INSERT INTO orders (user_id, total_price) VALUES (?, ?);"
+    # created_at is a parameter, not the column's CURRENT_TIMESTAMP default: each copy, and a
+    # recovery replaying the logged statement later, must write the same value
+    created_at = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+    query = "INSERT INTO orders (user_id, total_price, created_at) VALUES (?, ?, ?);"
 
-    if execute_write(query, (user_id, total_price)):
+    if execute_write(query, (user_id, total_price, created_at)):
         return jsonify({"message": "Order created successfully"})
     else:
         return jsonify({"error": "Database write failed"}), 500
 
+# GET /orders/:user_id - A user's orders, a keyset page (?limit=&after=) or an NDJSON export (?stream=true)
 @app.route('/orders/<int:user_id>', methods=['GET'])
 def get_orders(user_id):
-    conn = db_connection(PRIMARY_DB)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM orders WHERE user_id = ?;", (user_id,))
-    orders = cursor.fetchall()
-    conn.close()
-    return jsonify([dict(order) for order in orders])
+    try:
+        limit, after, stream = page_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream:
+        return stream_rows(read_db(user_id), "SELECT * FROM orders WHERE user_id = ? AND id > ? ORDER BY id",
+                           (user_id, after), limit)
+    with db_connection(read_db(user_id)) as conn:
+        cursor = conn.cursor()
+        if limit is None:
+            cursor.execute("SELECT * FROM orders WHERE user_id = ?;", (user_id,))
+        else:
+            # One extra row tells whether there is a next page
+            cursor.execute("SELECT * FROM orders WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?;",
+                           (user_id, after, limit + 1))
+        orders = cursor.fetchall()
+    response = jsonify([dict(order) for order in orders[:limit]])
+    if limit is not None and len(orders) > limit:
+        link_next(response, request.base_url, request.args.to_dict(), orders[limit - 1]["id"])
+    return response
 
 if __name__ == '__main__':
     PORT = 3001
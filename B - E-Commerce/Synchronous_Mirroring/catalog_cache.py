@@ -0,0 +1,198 @@
+import bisect
+import hashlib
+import json
+import threading
+import time
+
+
+def serialise(value):
+    return json.dumps(value, sort_keys=True, separators=(",", ":")).encode()
+
+
+def etag_of(body):
+    return hashlib.blake2b(body, digest_size=8).hexdigest()
+
+
+class Catalog:
+    """The indexed products of one load: by id, by category and by stock availability."""
+
+    def __init__(self, products=()):
+        self.products = {}        # id -> (product, serialised product, etag)
+        self.by_category = {}     # category -> set of ids
+        self.in_stock = set()
+        for product in products:
+            self.index(product)
+
+    def index(self, product):
+        body = serialise(product)
+        self.products[product["id"]] = (product, body, etag_of(body))
+        self.by_category.setdefault(product["category"], set()).add(product["id"])
+        if product["stock"] > 0:
+            self.in_stock.add(product["id"])
+
+    def unindex(self, product_id):
+        entry = self.products.pop(product_id, None)
+        if entry is None:
+            return
+        ids = self.by_category.get(entry[0]["category"])
+        if ids is not None:
+            ids.discard(product_id)
+            if not ids:
+                del self.by_category[entry[0]["category"]]
+        self.in_stock.discard(product_id)
+
+
+class CatalogCache:
+    """Process-wide copy of the products table, served as pre-serialised JSON.
+
+    Products are indexed by id, by category and by stock availability, and every product is
+    serialised once, when it is loaded. A list response is assembled from those pieces the
+    first time it is asked for and kept, with its ETag, until the catalog changes. Keyset pages
+    (`page`) are cut from the sorted ids of the selection, which are kept the same way.
+
+    `load(product_id=None)` reads all products (a list of dicts) or one (a dict, or None if it
+    does not exist) from the database. Writes made by this process keep the cache current
+    through `refresh(product_id)`, which re-reads one product, or `invalidate()`, which drops
+    everything until the next read. Writes made elsewhere, by another server process sharing
+    the database, are picked up by a full reload once the cache is `max_age` seconds old.
+
+    The reload reads and indexes the table outside the lock and then swaps the new Catalog in,
+    so reads keep being served from the old one meanwhile; only the first load is waited for.
+    Products refreshed while a reload runs are carried over into the new Catalog, and an
+    `invalidate()` during a reload makes the next read reload again.
+    """
+
+    def __init__(self, load, max_age=30.0):
+        self.load = load
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()   # one full reload at a time
+        self._loaded_at = None
+        self._catalog = Catalog()
+        self._reloading = False
+        self._refreshed = set()    # ids refreshed while a reload runs
+        self._invalidated = False  # invalidate() called while a reload runs
+        self._responses = {}       # (category, in stock only) -> (serialised list, etag)
+        self._ordered = {}         # (category, in stock only) -> sorted ids, for keyset pages
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    def _stale(self):
+        # Called with the lock held
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.max_age
+
+    def _ensure_loaded(self):
+        # Called without the lock: when stale, one thread reloads while the others read on
+        with self._lock:
+            if not self._stale() or (self._reloading and self._loaded_at is not None):
+                return
+        with self._reload_lock:
+            with self._lock:
+                if not self._stale():
+                    return  # reloaded by the thread this one waited for
+                self._reloading = True
+                self._refreshed.clear()
+                self._invalidated = False
+            try:
+                catalog = Catalog(self.load())
+            except BaseException:
+                with self._lock:
+                    self._reloading = False
+                raise
+            with self._lock:
+                self._reloading = False
+                # Refreshes made meanwhile may be newer than what the reload read
+                for product_id in self._refreshed:
+                    catalog.unindex(product_id)
+                    entry = self._catalog.products.get(product_id)
+                    if entry is not None:
+                        catalog.index(entry[0])
+                self._catalog = catalog
+                self._responses, self._ordered = {}, {}
+                self._loaded_at = None if self._invalidated else time.monotonic()
+                self.reloads += 1
+
+    def _ids(self, key):
+        # Called with the lock held: the sorted ids of a (category, in stock only) selection
+        ids = self._ordered.get(key)
+        if ids is None:
+            category, in_stock = key
+            catalog = self._catalog
+            ids = set(catalog.products) if category is None else set(catalog.by_category.get(category, ()))
+            if in_stock:
+                ids &= catalog.in_stock
+            ids = self._ordered[key] = sorted(ids)
+        return ids
+
+    def products(self, category=None, in_stock=False):
+        """(serialised list, etag) of the products, optionally of one category and in stock."""
+        key = (category, bool(in_stock))
+        self._ensure_loaded()
+        with self._lock:
+            response = self._responses.get(key)
+            if response is not None:
+                self.hits += 1
+                return response
+            self.misses += 1
+            products = self._catalog.products
+            body = b"[" + b",".join(products[product_id][1] for product_id in self._ids(key)) + b"]"
+            response = self._responses[key] = (body, etag_of(body))
+            return response
+
+    def page(self, category=None, in_stock=False, after=0, limit=100):
+        """(serialised page, etag, last id) of the first `limit` products with an id above `after`.
+
+        The last id is the `after` of the next page, or None if this is the last page.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            ids = self._ids((category, bool(in_stock)))
+            start = bisect.bisect_right(ids, after)
+            page = ids[start:start + limit]
+            products = self._catalog.products
+            body = b"[" + b",".join(products[product_id][1] for product_id in page) + b"]"
+            self.hits += 1
+            more = start + limit < len(ids)
+        return body, etag_of(body), page[-1] if more else None
+
+    def product(self, product_id):
+        """(serialised product, etag), or None if there is no such product."""
+        self._ensure_loaded()
+        with self._lock:
+            entry = self._catalog.products.get(product_id)
+            self.hits += 1
+        return (entry[1], entry[2]) if entry is not None else None
+
+    def refresh(self, product_id):
+        """Re-read one product after it was added, updated or deleted."""
+        with self._lock:
+            if self._loaded_at is None and not self._reloading:
+                return
+            # Read under the lock, so concurrent refreshes of one product apply in order
+            product = self.load(product_id)
+            self._catalog.unindex(product_id)
+            if product is not None:
+                self._catalog.index(product)
+            if self._reloading:
+                self._refreshed.add(product_id)
+            self._responses.clear()
+            self._ordered.clear()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+            self._invalidated = self._reloading
+            self._responses.clear()
+            self._ordered.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "products": len(self._catalog.products),
+                "categories": len(self._catalog.by_category),
+                "cached_responses": len(self._responses),
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads
+            }
@@ -0,0 +1,139 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became free within the pool's timeout."""
+
+
+class ConnectionPool:
+    """Persistent SQLite connections to one database file, shared by all request threads.
+
+    The development server starts a new thread for every request, so connections are checked
+    out per request rather than bound to a thread: `with pool.connection() as conn:` borrows
+    one and returns it afterwards, rolling back anything left uncommitted. At most `size`
+    connections are opened, lazily; a request that finds them all busy waits up to `timeout`
+    seconds. Each connection:
+
+    - runs in WAL mode, so readers do not block the writer and the writer does not block readers;
+    - keeps sqlite3's prepared-statement cache (`cached_statements`) across requests;
+    - is checked with `SELECT 1` before reuse if it sat idle for `health_check_interval`
+      seconds or its last request failed, and replaced if the check fails.
+    """
+
+    def __init__(self, db_path, size=8, timeout=5.0, health_check_interval=30.0, cached_statements=256):
+        self.db_path = str(db_path)
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.cached_statements = cached_statements
+        self._idle = queue.LifoQueue()    # (connection, last used, needs check); LIFO keeps the warm ones busy
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self.replaced = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn):
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._opened -= 1
+
+    def acquire(self):
+        try:
+            conn, last_used, suspect = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    return self._connect()
+                except Exception:
+                    with self._lock:
+                        self._opened -= 1
+                    raise
+            try:
+                conn, last_used, suspect = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise PoolTimeout(f"No free connection to {self.db_path} after {self.timeout}s") from None
+
+        if (suspect or time.monotonic() - last_used > self.health_check_interval) and not self._is_healthy(conn):
+            self._discard(conn)
+            with self._lock:
+                self._opened += 1
+                self.replaced += 1
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        return conn
+
+    def release(self, conn, failed=False):
+        if self._closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        self._idle.put((conn, time.monotonic(), failed))
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            self.release(conn, failed=True)
+            raise
+        self.release(conn)
+
+    def health(self):
+        """Borrow a connection and run the health check on it."""
+        try:
+            with self.connection() as conn:
+                ok = self._is_healthy(conn)
+        except Exception:
+            ok = False
+        return {"database": self.db_path, "ok": ok, **self.stats()}
+
+    def stats(self):
+        with self._lock:
+            opened = self._opened
+        return {"size": self.size, "open": opened, "idle": self._idle.qsize(), "replaced": self.replaced}
+
+    def close(self):
+        """Close the idle connections; connections still checked out are closed when returned."""
+        self._closed = True
+        while True:
+            try:
+                conn, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+
+
+class PendingWrite:
+    """One statement waiting for its batch; `done` is set once the batch committed or failed."""
+
+    __slots__ = ("query", "params", "done", "error")
+
+    def __init__(self, query, params):
+        self.query = query
+        self.params = params
+        self.done = threading.Event()
+        self.error = None
+
+
+class WriteBatcher:
+    """Group commit of the mirrored writes.
+
+    Request threads queue their statement with `execute()` and block until it is durable. A
+    single writer thread collects the queued statements, waiting up to `max_delay` seconds for
+    more after the first one, or until it has `max_batch`. The batch is committed as one
+    transaction on every copy by `coordinator` (two_phase.TwoPhaseCommit), so a batch costs one
+    commit, and one fsync, per copy instead of one per request. A statement that fails (a CHECK
+    constraint, a missing table) fails its own request only; the rest of the batch commits.
+    """
+
+    def __init__(self, coordinator, max_batch=64, max_delay=0.005):
+        self.coordinator = coordinator
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.statements = 0
+        self.failed_batches = 0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """Commit what is already queued, then stop the writer thread."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, query, params=()):
+        write = PendingWrite(query, params)
+        self._queue.put(write)
+        return write
+
+    def execute(self, query, params=(), timeout=None):
+        """Queue one statement and wait until its batch is committed on every copy."""
+        write = self.submit(query, params)
+        if not write.done.wait(timeout):
+            raise TimeoutError("Write not committed within the timeout")
+        if write.error is not None:
+            raise write.error
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                write = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if write is None:
+                return batch, True
+            batch.append(write)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stopping = self._collect(first)
+            self._commit(batch)
+
+    def _commit(self, batch):
+        try:
+            self.coordinator.commit(batch)
+        except Exception as e:
+            # No request of the batch is acknowledged; they all see the failure
+            for write in batch:
+                write.error = write.error or e
+            with self._lock:
+                self.failed_batches += 1
+        with self._lock:
+            self.batches += 1
+            self.statements += len(batch)
+        for write in batch:
+            write.done.set()
+
+    def stats(self):
+        with self._lock:
+            batches, statements, failed = self.batches, self.statements, self.failed_batches
+        return {
+            "batches": batches,
+            "statements": statements,
+            "failed_batches": failed,
+            "mean_batch_size": statements / batches if batches else 0.0,
+            "queued": self._queue.qsize()
+        }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The server modules live next to Q4_server.py, not in an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,112 @@
+import importlib
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from db_pool import ConnectionPool
+from migrations import migrate
+from two_phase import TwoPhaseCommit
+
+ORDER = {"user_id": 7, "cart_items": [{"product_id": 1, "price": 12.5, "quantity": 2}]}
+
+
+class Crash(Exception):
+    """Stands in for the process dying: not an sqlite3.Error, so nothing handles it."""
+
+
+class CrashingConnection:
+    """Connection whose commit() dies; everything else goes to the real connection."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def commit(self):
+        raise Crash("server died before committing this copy")
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for db_path in ("ecommerce_primary.db", "ecommerce_mirror.db"):
+        with sqlite3.connect(db_path) as conn:
+            migrate(conn)
+
+    sys.modules.pop("Q4_server", None)
+    module = importlib.import_module("Q4_server")
+    yield module
+    module.writer.stop(5)
+    for pool in module.pools.values():
+        pool.close()
+    sys.modules.pop("Q4_server", None)
+
+
+def crash_on_commit(monkeypatch, pool):
+    connection = pool.connection
+
+    @contextmanager
+    def crashing_connection():
+        with connection() as conn:
+            yield CrashingConnection(conn)
+
+    monkeypatch.setattr(pool, "connection", crashing_connection)
+
+
+def orders(db_path):
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT id, user_id, total_price, status, created_at FROM orders").fetchall()
+
+
+def restart(server):
+    """Recover the way a restarted server does: new pools over the same files and intent log."""
+    pools = [ConnectionPool(db_path) for db_path in (server.PRIMARY_DB, server.MIRROR_DB)]
+    coordinator = TwoPhaseCommit(pools, server.INTENT_LOG)
+    try:
+        coordinator.recover()
+        return coordinator.stats()
+    finally:
+        for pool in pools:
+            pool.close()
+
+
+def test_crash_after_decision_is_replayed_identically(server, monkeypatch):
+    crash_on_commit(monkeypatch, server.pools[server.MIRROR_DB])
+    response = server.app.test_client().post("/orders", json=ORDER)
+    assert response.status_code == 500
+
+    # Decided and committed on the primary only
+    assert len(orders(server.PRIMARY_DB)) == 1
+    assert orders(server.MIRROR_DB) == []
+
+    time.sleep(1.1)  # A replay that re-evaluates the time would write a different created_at
+    assert restart(server)["recovered"] == 1
+    assert orders(server.MIRROR_DB) == orders(server.PRIMARY_DB)
+
+    # Nothing left to replay
+    assert restart(server)["recovered"] == 0
+
+
+def test_crash_before_decision_commits_nowhere(server, monkeypatch):
+    def crash(record, sync):
+        raise Crash("server died before logging the decision")
+
+    monkeypatch.setattr(server.coordinator, "_append", crash)
+    response = server.app.test_client().post("/orders", json=ORDER)
+    assert response.status_code == 500
+
+    assert restart(server)["recovered"] == 0
+    assert orders(server.PRIMARY_DB) == []
+    assert orders(server.MIRROR_DB) == []
+
+
+def test_orders_are_identical_on_both_copies(server):
+    client = server.app.test_client()
+    for _ in range(3):
+        assert client.post("/orders", json=ORDER).status_code == 200
+    assert len(orders(server.PRIMARY_DB)) == 3
+    assert orders(server.MIRROR_DB) == orders(server.PRIMARY_DB)
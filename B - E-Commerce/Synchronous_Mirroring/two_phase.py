@@ -0,0 +1,223 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import ExitStack
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; a single server process needs no file lock
+    fcntl = None
+
+
+class TwoPhaseCommit:
+    """Atomic commit of one transaction on every copy (primary, then mirror) of the database.
+
+    SQLite has no PREPARE TRANSACTION, so the protocol is built from what it has:
+
+    1. Prepare: BEGIN IMMEDIATE on every copy and run all statements there. Each statement
+       runs in a savepoint; one that fails is rolled back on every copy and reported on its
+       write (`write.error`) without failing the others. Every copy also records the
+       transaction id in `two_phase_state`, inside the same transaction.
+    2. Decide: the statements that succeeded are appended to the intent log and fsynced.
+       From this point the transaction commits on every copy, whatever happens.
+    3. Commit every copy, then log the transaction as done.
+
+    A copy that has committed transaction N has `last_txid >= N`. After a crash or a failed
+    commit, `recover()` replays every decided but unfinished transaction on the copies that
+    are missing it, so the copies converge without a full backup() resync. Until that
+    succeeds no new transaction is accepted.
+
+    Every copy runs the statements itself, and recovery runs them again later, so they must be
+    deterministic: the current time, random values and the like go in their parameters, never
+    in SQL such as CURRENT_TIMESTAMP (including column defaults).
+
+    The primary and backup servers can share the databases and the intent log: transaction ids
+    are taken from the copies while their write locks are held, and the log is appended to and
+    compacted under an exclusive file lock.
+    """
+
+    def __init__(self, pools, intent_log, compact_every=1000):
+        self.pools = list(pools)
+        self.intent_log = intent_log
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._next_txid = None          # None until recover() has run successfully
+        self._since_compaction = 0
+        self.committed = 0
+        self.recovered = 0
+
+    def _append(self, record, sync):
+        with open(self.intent_log, "a+") as f:
+            _lock_file(f)
+            try:
+                # A record torn by a crash must not swallow the next one
+                end = f.seek(0, os.SEEK_END)
+                f.seek(max(end - 1, 0))
+                separator = "\n" if end and f.read(1) != "\n" else ""
+                f.write(separator + json.dumps(record) + "\n")
+                f.flush()
+                if sync:
+                    os.fsync(f.fileno())
+            finally:
+                _unlock_file(f)
+
+    @staticmethod
+    def _parse_log(f):
+        """Decided transactions not logged as done, and the highest transaction id in the log."""
+        pending, last_txid = {}, 0
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # torn by a crash before its fsync: never decided
+            last_txid = max(last_txid, record["txid"])
+            if record["state"] == "commit":
+                pending[record["txid"]] = record["statements"]
+            else:
+                pending.pop(record["txid"], None)
+        return pending, last_txid
+
+    def _read_log(self):
+        try:
+            with open(self.intent_log, "r") as f:
+                return self._parse_log(f)
+        except FileNotFoundError:
+            return {}, 0
+
+    @staticmethod
+    def _last_txid(conn):
+        row = conn.execute("SELECT last_txid FROM two_phase_state WHERE id = 1").fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _mark(conn, txid):
+        conn.execute("INSERT OR REPLACE INTO two_phase_state (id, last_txid) VALUES (1, ?)", (txid,))
+
+    def recover(self):
+        """Finish the transactions that were decided but not committed on every copy."""
+        with self._lock:
+            self._recover()
+
+    def _recover(self):
+        self._next_txid = None
+        for pool in self.pools:
+            with pool.connection() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS two_phase_state (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        last_txid INTEGER NOT NULL
+                    )
+                """)
+                conn.commit()
+
+        pending, last_txid = self._read_log()
+        for txid, statements in sorted(pending.items()):
+            for pool in self.pools:
+                with pool.connection() as conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    if self._last_txid(conn) >= txid:
+                        continue
+                    for query, params in statements:
+                        conn.execute(query, params)
+                    self._mark(conn, txid)
+                    conn.commit()
+            self._append({"txid": txid, "state": "done"}, sync=False)
+            self.recovered += 1
+
+        for pool in self.pools:
+            with pool.connection() as conn:
+                last_txid = max(last_txid, self._last_txid(conn))
+        self._compact()
+        self._next_txid = last_txid + 1
+
+    def _compact(self):
+        """Empty the intent log once every transaction in it is on every copy."""
+        self._since_compaction = 0
+        with open(self.intent_log, "a+") as f:
+            _lock_file(f)
+            try:
+                f.seek(0)
+                pending, _ = self._parse_log(f)
+                if not pending:
+                    f.truncate(0)
+            finally:
+                _unlock_file(f)
+
+    def commit(self, writes):
+        """Apply `writes` (objects with `query`, `params` and `error`) as one transaction on every copy.
+
+        Raises if it was not committed on every copy; statement errors are set on their write.
+        A transaction that fails after the decision is still completed later, by recovery.
+        """
+        with self._lock:
+            if self._next_txid is None:
+                self._recover()
+            in_doubt = False
+
+            with ExitStack() as stack:
+                conns = [stack.enter_context(pool.connection()) for pool in self.pools]
+
+                # Phase 1: prepare on every copy
+                for conn in conns:
+                    conn.execute("BEGIN IMMEDIATE")
+                # Under the write locks: no other server can take the same id
+                txid = max([self._next_txid] + [self._last_txid(conn) + 1 for conn in conns])
+                statements = []
+                for write in writes:
+                    for conn in conns:
+                        conn.execute("SAVEPOINT write")
+                    try:
+                        for conn in conns:
+                            conn.execute(write.query, write.params)
+                        statements.append([write.query, list(write.params)])
+                    except sqlite3.Error as e:
+                        write.error = e
+                        for conn in conns:
+                            conn.execute("ROLLBACK TO write")
+                    for conn in conns:
+                        conn.execute("RELEASE write")
+                if not statements:
+                    return  # nothing to commit; the connections roll back on release
+                for conn in conns:
+                    self._mark(conn, txid)
+
+                # Decision: once logged, the transaction is committed on every copy
+                self._append({"txid": txid, "state": "commit", "statements": statements}, sync=True)
+                self._next_txid = txid + 1
+
+                # Phase 2: commit every copy
+                try:
+                    for conn in conns:
+                        conn.commit()
+                except sqlite3.Error as e:
+                    print(f"Transaction {txid} in doubt, recovering: {e}")
+                    in_doubt = True
+
+            if in_doubt:
+                self._recover()     # raises, and blocks further transactions, while a copy is failing
+            else:
+                self._append({"txid": txid, "state": "done"}, sync=False)
+                self._since_compaction += 1
+                if self._since_compaction >= self.compact_every:
+                    self._compact()
+            self.committed += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "next_txid": self._next_txid,
+                "committed": self.committed,
+                "recovered": self.recovered,
+                "blocked": self._next_txid is None
+            }
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)